@@ -1,15 +1,27 @@
 import os
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import ttk, filedialog, messagebox, simpledialog
 import cv2
-import numpy as np
 
-from segmentation import start_segmentation
+from segmentation import start_segmentation, load_ocr_grid, save_ocr_grid, cell_write_params
 from ocr_processor import run_ocr_on_table
+from pages import MULTIPAGE_EXTENSIONS, page_count, page_table_name, list_tables
+from metrics import RunMetrics, SEGMENTATION_METRICS_FILE
+from jobs import JobRunner, check_cancel, format_progress
+from payload import sharpen_image
 
 # === SETTINGS ===
 INPUT_ROOT = "input_tables"
 OUTPUT_ROOT = "output"
+UPLOAD_PRESET = "raw"  # see payload.UPLOAD_PRESETS; "compact" sends trimmed grayscale crops
+DEDUP_THRESHOLD = None  # Hamming distance (e.g. 4) under which near-identical cells share one OCR request
+MOSAIC_OCR = False  # pack many small cells onto one canvas per Vision request
+INCREMENTAL_OCR = True  # after a grid is redrawn, only re-OCR cells whose crop box changed and keep reviewed values
+JOB_SERVER_URL = None  # e.g. "http://127.0.0.1:8765" to OCR through a shared job_server.py
+STREAM_PIPELINE = False  # crop, sharpen and OCR in one streaming pass right after the grid is drawn
+STREAM_WRITE_CELLS = True  # with STREAM_PIPELINE, also write the row_N/col_M cell tree
+CELL_FORMAT = "png"  # see segmentation.CELL_FORMATS; "png_fast" writes cells quicker, "webp" is lossless and smaller
+COLUMNAR_FORMAT = None  # "parquet" or "arrow" to also write a columnar table with cell provenance (needs pyarrow)
 
 calendar_order = [
     "january", "february", "march", "april", "may", "june",
@@ -51,32 +63,59 @@ def get_csv_output_folder(image_folder: str):
     os.makedirs(base, exist_ok=True)
     return base
 
-def sharpen_image(img):
+def sharpen_segmented_images(folder_path, metrics=None, progress=None, cancel=None, cell_format=None):
 
     """
-    Applies a sharpening kernel to the given image and returns the sharpened image.
+    Iterates through all image files in the specified folder and applies sharpening to each.
+    Used after segmentation to improve OCR performance.
+    Decode, filter and encode times are added to metrics when given.
+    progress(done, total) is called after each image; the cancel event is checked between images,
+    so a cancelled pass never leaves a half-written file.
+    cell_format is the segmentation.CELL_FORMATS entry the cells were cut as; they are
+    re-encoded with its settings.
     """
 
-    kernel = np.array([[0, -1, 0],
-                       [-1, 5, -1],
-                       [0, -1, 0]])
-    return cv2.filter2D(img, -1, kernel)
-
-def sharpen_segmented_images(folder_path):
+    metrics = metrics or RunMetrics("sharpen")
+    img_paths = [
+        os.path.join(root, file)
+        for root, _, files in os.walk(folder_path)
+        for file in files
+        if file.lower().endswith(('.png', '.webp', '.jpg', '.jpeg'))
+    ]
+    for done, img_path in enumerate(img_paths, 1):
+        check_cancel(cancel)
+        with metrics.stage("sharpen_decode"):
+            img = cv2.imread(img_path)
+        if img is not None:
+            metrics.count("images_decoded")
+            metrics.count("bytes_read", os.path.getsize(img_path))
+            with metrics.stage("sharpen_filter"):
+                sharpened = sharpen_image(img)
+            with metrics.stage("sharpen_encode"):
+                cv2.imwrite(img_path, sharpened, cell_write_params(img_path, cell_format))
+            metrics.count("images_encoded")
+            metrics.count("bytes_written", os.path.getsize(img_path))
+        if progress:
+            progress(done, len(img_paths))
+    return metrics
+
+
+def warn_ignored_settings(path_name):
 
     """
-    Iterates through all image files in the specified folder and applies sharpening to each.
-    Used after segmentation to improve OCR performance.
+    Warns that the OCR settings switched on above (COLUMNAR_FORMAT, DEDUP_THRESHOLD, MOSAIC_OCR)
+    have no effect on the given OCR path, which only writes the plain CSV.
     """
 
-    for root, _, files in os.walk(folder_path):
-        for file in files:
-            if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                img_path = os.path.join(root, file)
-                img = cv2.imread(img_path)
-                if img is not None:
-                    sharpened = sharpen_image(img)
-                    cv2.imwrite(img_path, sharpened)
+    ignored = [name for name, value in (
+        ("COLUMNAR_FORMAT", COLUMNAR_FORMAT), ("DEDUP_THRESHOLD", DEDUP_THRESHOLD), ("MOSAIC_OCR", MOSAIC_OCR),
+    ) if value]
+    if ignored:
+        print(f"⚠️ {path_name} ignores {', '.join(ignored)}")
+        messagebox.showwarning(
+            "Settings Ignored",
+            f"{path_name} doesn't support {', '.join(ignored)}; this table is OCR'd without them.",
+        )
 
 
 #----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------                    
@@ -98,14 +137,17 @@ class OCRAppGUI:
 
         self.root = root
         root.title("HATTRIC")
-        root.geometry("300x250")
+        root.geometry("320x380")
 
         self.month = tk.StringVar()
         self.data_type = tk.StringVar()
         self.table_file = tk.StringVar()
         self.table_number = tk.StringVar(value="1")
+        self.page = None
 
         self.build_gui()
+        # OCR and sharpening run on a background thread; tables queue up behind each other
+        self.jobs = JobRunner(root, on_progress=self.show_progress)
 
     def build_gui(self):
         """
@@ -117,9 +159,50 @@ class OCRAppGUI:
         self.file_label.pack()
 
         tk.Button(self.root, text="Start Segmentation", command=self.run_segmentation).pack(pady=8)
+        tk.Button(self.root, text="Propagate Grid to Folder", command=self.run_propagation).pack(pady=4)
         tk.Button(self.root, text="Run OCR", command=self.run_ocr).pack(pady=4)
         tk.Button(self.root, text="Launch Error Checker", command=self.launch_checker).pack(pady=4)
 
+        self.progress_bar = ttk.Progressbar(self.root, length=260, mode="determinate")
+        self.progress_bar.pack(pady=(10, 2))
+        self.status_label = tk.Label(self.root, text="Idle")
+        self.status_label.pack()
+        self.queue_label = tk.Label(self.root, text="")
+        self.queue_label.pack()
+        tk.Button(self.root, text="Cancel", command=self.cancel_jobs).pack(pady=4)
+
+    def show_progress(self, job):
+
+        """
+        Draws the running job's progress: cells done out of total, throughput and ETA.
+        """
+
+        self.progress_bar["maximum"] = max(job.total, 1)
+        self.progress_bar["value"] = job.done
+        unit = {"Sharpen": "images", "Propagate": "pages"}.get(job.name.split()[0], "cells")
+        self.status_label.config(text=f"{job.name}: {format_progress(job.done, job.total, job.elapsed(), unit)}")
+        self.update_queue_label()
+
+    def update_queue_label(self):
+        queued = self.jobs.queued()
+        self.queue_label.config(text=f"Queued: {', '.join(queued)}" if queued else "")
+
+    def job_finished(self, message):
+        self.progress_bar["value"] = 0
+        self.status_label.config(text=message)
+        self.update_queue_label()
+
+    def cancel_jobs(self):
+
+        """
+        Stops the running job after its current cell and drops every queued table.
+        """
+
+        if not self.jobs.busy():
+            return
+        self.jobs.cancel()
+        self.status_label.config(text="Cancelling...")
+
     def select_table_file(self):
 
         """
@@ -142,7 +225,7 @@ class OCRAppGUI:
         filepath = filedialog.askopenfilename(
             initialdir=INPUT_ROOT,
             title="Select Table Image",
-            filetypes=(("Image Files", "*.png;*.jpg;*.jpeg"),)
+            filetypes=(("Image Files", "*.png;*.jpg;*.jpeg;*.tif;*.tiff;*.pdf"),)
         )
         if filepath:
             self.table_file.set(filepath)
@@ -157,12 +240,32 @@ class OCRAppGUI:
                 self.image_folder = ""
                 self.table = ""
 
+            # Each page of a multi-page TIFF or PDF is its own table
+            self.page = None
+            if filepath.lower().endswith(MULTIPAGE_EXTENSIONS) and self.table:
+                try:
+                    count = page_count(filepath)
+                except Exception as e:
+                    messagebox.showerror("Error", f"Could not read document: {e}")
+                    return
+                if count > 1 or filepath.lower().endswith(".pdf"):
+                    page = simpledialog.askinteger(
+                        "Select Page", f"This document has {count} page(s). Which page is the table?",
+                        minvalue=1, maxvalue=count, initialvalue=1
+                    )
+                    if page is None:
+                        self.table = ""
+                        return
+                    self.page = page - 1
+                    self.table = page_table_name(self.table, self.page)
+                    self.file_label.config(text=f"{os.path.basename(filepath)} (page {page} of {count})")
+
     def run_segmentation(self):
 
         """
         Starts the segmentation process on the selected table image.
         If output already exists, prompts user before overwriting.
-        Sharpens all output images post-segmentation.
+        Sharpens all output images post-segmentation in a background job.
         """
 
         # if not self.table_file.get():
@@ -190,20 +293,130 @@ class OCRAppGUI:
         # Use self.image_folder and self.table set by select_table_file
         out_dir = get_output_folder(self.image_folder, self.table)
         if os.path.exists(out_dir) and os.listdir(out_dir):
-            overwrite = messagebox.askyesno(
-                "Overwrite Existing Segmentation?",
-                f"A segmented output already exists for Table {self.table} in {self.image_folder}.",
-            )
+            message = f"A segmented output already exists for Table {self.table} in {self.image_folder}."
+            if INCREMENTAL_OCR and not STREAM_PIPELINE and load_ocr_grid(out_dir) is not None:
+                message += ("\n\nThe saved grid is loaded for editing, and the next Run OCR only "
+                            "re-reads cells whose boxes change; values already reviewed for the "
+                            "other cells are kept.")
+            overwrite = messagebox.askyesno("Overwrite Existing Segmentation?", message)
             if not overwrite:
                 return
 
-        start_segmentation(self.table_file.get(), out_dir)
-        sharpen_segmented_images(out_dir)
-        messagebox.showinfo("Segmentation Complete", f"Segmentation and sharpening saved to:\n{out_dir}")
+        metrics = RunMetrics(f"segmentation:{self.image_folder}/{self.table}")
+        if STREAM_PIPELINE:
+            self.run_streaming(out_dir, metrics)
+            return
+        # Drawing the grid is interactive and stays on the UI thread; sharpening runs in the background
+        start_segmentation(self.table_file.get(), out_dir, page=self.page, metrics=metrics, cell_format=CELL_FORMAT)
+
+        def sharpen(progress, cancel):
+            sharpen_segmented_images(out_dir, metrics, progress, cancel, cell_format=CELL_FORMAT)
+            metrics.write_json(os.path.join(out_dir, SEGMENTATION_METRICS_FILE))
+
+        def done(_):
+            self.job_finished(f"Sharpened {table}")
+            messagebox.showinfo("Segmentation Complete", f"Segmentation and sharpening saved to:\n{out_dir}")
+
+        def failed(e):
+            self.job_finished(f"Sharpening failed for {table}")
+            messagebox.showerror("Error", f"Sharpening failed: {e}")
+
+        table = self.table
+        self.jobs.submit(
+            f"Sharpen {table}", sharpen, on_done=done, on_error=failed,
+            on_cancel=lambda: self.job_finished(f"Sharpening cancelled; some cells of {table} are unsharpened"),
+        )
+        self.update_queue_label()
+    def run_streaming(self, out_dir, metrics):
+
+        """
+        Draws the grid, then cuts, sharpens and OCRs the table in one background pass
+        that writes the CSV row by row.
+        """
+
+        warn_ignored_settings("The streaming pipeline")
+        grid = start_segmentation(self.table_file.get(), out_dir, page=self.page, metrics=metrics, cut=False)
+        if grid is None:
+            return
+        from pipeline import stream_table
+        from ocr_processor import _get_vision_client
+        image_path, page, table = self.table_file.get(), self.page, self.table
+        csv_out = get_csv_output_folder(self.image_folder)
+
+        def stream(progress, cancel):
+            client = _get_vision_client()
+            if client is None:
+                raise RuntimeError("Google Cloud Vision credentials not found.")
+            csv_path = stream_table(
+                image_path, grid, csv_out, table, client, page=page,
+                write_cells_to=out_dir if STREAM_WRITE_CELLS else None, cell_format=CELL_FORMAT,
+                upload_preset=UPLOAD_PRESET, metrics=metrics, progress=progress, cancel=cancel
+            )
+            save_ocr_grid(out_dir, grid)
+            return csv_path
+
+        def failed(e):
+            self.job_finished(f"Streaming OCR failed for {table}")
+            messagebox.showerror("OCR Error", f"Streaming OCR failed: {e}")
+
+        self.jobs.submit(
+            f"Stream {table}", stream,
+            on_done=lambda csv_path: self.job_finished(f"OCR saved: {os.path.basename(csv_path)}"),
+            on_error=failed,
+            on_cancel=lambda: self.job_finished(f"Streaming cancelled for {table}"),
+        )
+        self.update_queue_label()
+
+    def run_propagation(self):
+
+        """
+        Registers every other page in the selected table's input folder against it and cuts
+        the pages that line up, using the grid drawn on the selected table.
+        Pages that don't fit well enough are listed for manual segmentation.
+        """
+
+        if not self.table:
+            messagebox.showerror("Missing info", "Please select a segmented table to use as the reference.")
+            return
+        from registration import propagate_grid, write_report, REPORT_FILE
+        from segmentation import load_grid
+
+        reference = get_output_folder(self.image_folder, self.table)
+        if load_grid(reference) is None:
+            messagebox.showerror("Missing grid", "Segment this table first; its grid is copied to the other pages.")
+            return
+        image_folder, table = self.image_folder, self.table
+        targets = [
+            (name, path, page, os.path.join(OUTPUT_ROOT, image_folder, name))
+            for name, path, page in list_tables(INPUT_ROOT, image_folder)
+            if name != table
+        ]
+
+        def propagate(progress, cancel):
+            results = propagate_grid(reference, targets, cell_format=CELL_FORMAT, progress=progress, cancel=cancel)
+            write_report(results, os.path.join(OUTPUT_ROOT, image_folder, REPORT_FILE))
+            return results
+
+        def done(results):
+            manual = [r["table"] for r in results if r["status"] == "manual"]
+            aligned = sum(r["status"] == "aligned" for r in results)
+            self.job_finished(f"Grid propagated to {aligned} page(s)")
+            message = f"Aligned and segmented {aligned} page(s)."
+            if manual:
+                message += "\n\nThese pages did not line up and need manual segmentation:\n" + "\n".join(manual)
+            messagebox.showinfo("Grid Propagation", message)
+
+        self.jobs.submit(
+            f"Propagate {table}", propagate, on_done=done,
+            on_error=lambda e: self.job_finished(f"Propagation failed: {e}"),
+            on_cancel=lambda: self.job_finished("Propagation cancelled"),
+        )
+        self.update_queue_label()
+
     def run_ocr(self):
 
         """
-        Runs OCR on the segmented table images.
+        Queues OCR of the segmented table images as a background job.
         Saves output as CSV in the appropriate folder.
         """
 
@@ -227,14 +440,30 @@ class OCRAppGUI:
 
         segment_path = get_output_folder(self.image_folder, self.table)
         csv_out = get_csv_output_folder(self.image_folder)
-        messagebox.showinfo("Running OCR", f"Hang Tight! This might take a couple minutes!")
-        try:
-            run_ocr_on_table(
+        image_folder, table = self.image_folder, self.table
+        if JOB_SERVER_URL:
+            warn_ignored_settings("The job server")
+
+        def ocr(progress, cancel):
+            if JOB_SERVER_URL:
+                from job_server import run_table_on_server
+                return run_table_on_server(JOB_SERVER_URL, segment_path, csv_out, table, UPLOAD_PRESET,
+                                           progress=progress, cancel=cancel)
+            return run_ocr_on_table(
                 segment_path, csv_out,
-                self.image_folder,
-                self.table
+                image_folder,
+                table,
+                columnar_format=COLUMNAR_FORMAT,
+                upload_preset=UPLOAD_PRESET,
+                dedup_threshold=DEDUP_THRESHOLD,
+                mosaic=MOSAIC_OCR,
+                incremental=INCREMENTAL_OCR,
+                progress=progress,
+                cancel=cancel
             )
-        except Exception as e:
+
+        def failed(e):
+            self.job_finished(f"OCR failed for {table}")
             messagebox.showerror(
                 "OCR Error",
                 (
@@ -243,6 +472,15 @@ class OCRAppGUI:
                 )
             )
 
+        # Clicking Run OCR while another table is running queues this one behind it
+        self.jobs.submit(
+            f"OCR {table}", ocr,
+            on_done=lambda csv_path: self.job_finished(f"OCR saved: {os.path.basename(csv_path)}"),
+            on_error=failed,
+            on_cancel=lambda: self.job_finished(f"OCR cancelled for {table}"),
+        )
+        self.update_queue_label()
+
     def launch_checker(self):
 
         """
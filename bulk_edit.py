@@ -0,0 +1,181 @@
+import re
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+# Letters OCR commonly reads in place of digits in handwritten numbers
+OCR_SUBSTITUTIONS = {"O": "0", "o": "0", "D": "0", "l": "1", "I": "1", "|": "1", "S": "5", "s": "5", "B": "8", "Z": "2"}
+
+# One bulk transformation: func maps a Series of cell strings to their new strings
+Operation = namedtuple("Operation", ["description", "func"])
+
+# The changed cells of one bulk edit, as parallel arrays, so it can be applied and undone
+Edit = namedtuple("Edit", ["description", "rows", "cols", "old", "new"])
+
+_INTEGER = r"^([+-]?)(\d+)$"
+
+
+def insert_decimal(places=None):
+
+    """
+    Inserts a decimal point into whole numbers: at the start when places is None
+    ("12" -> ".12", "-5" -> "-.5"), otherwise before the last places digits ("123" -> "12.3").
+    Surrounding whitespace is ignored and dropped from edited values.
+    Values that already have a decimal point, or aren't numbers, are left alone.
+    """
+
+    if places is not None and places < 1:
+        raise ValueError("Decimal places must be at least 1")
+
+    def func(s):
+        stripped = s.str.strip()
+        if places is None:
+            edited = stripped.str.replace(_INTEGER, r"\1.\2", regex=True)
+        else:
+            padded = stripped.str.replace(_INTEGER, lambda m: m.group(1) + m.group(2).zfill(places + 1), regex=True)
+            edited = padded.str.replace(rf"(\d{{{places}}})$", r".\1", regex=True)
+        return edited.where(stripped.str.match(_INTEGER).fillna(False), s)
+
+    if places is None:
+        return Operation("Insert decimal at the start", func)
+    return Operation(f"Insert decimal before the last {places} digit(s)", func)
+
+
+def substitute_characters(mapping=None, numeric_only=True):
+
+    """
+    Replaces characters OCR confuses with digits (O->0, l->1, S->5 ...). With numeric_only
+    a cell is only changed when the result is a number, so words stay untouched.
+    """
+
+    mapping = OCR_SUBSTITUTIONS if mapping is None else mapping
+    table = str.maketrans(mapping)
+
+    def func(s):
+        out = s.str.translate(table)
+        if numeric_only:
+            out = out.where(pd.to_numeric(out.str.strip(), errors="coerce").notna(), s)
+        return out
+
+    pairs = ", ".join(f"{k}->{v}" for k, v in mapping.items())
+    return Operation(f"Substitute {pairs}", func)
+
+
+def scale(factor, decimals=None):
+
+    """
+    Multiplies numeric cells by factor, rounding to decimals places when given.
+    """
+
+    def func(s):
+        values = pd.to_numeric(s.str.strip(), errors="coerce")
+        numeric = values.notna()
+        # Formatted with one vectorized call instead of a Python call per cell; adding 0.0 turns -0 into 0
+        scaled = values[numeric].to_numpy(dtype=float) * factor + 0.0
+        if decimals is not None:
+            text = np.char.mod(f"%.{decimals}f", scaled)
+        else:
+            # Up to 10 decimals, trailing zeros trimmed: 1.50 -> "1.5", 2.0 -> "2"
+            text = pd.Series(np.char.mod("%.10f", scaled)).str.rstrip("0").str.rstrip(".").to_numpy()
+        out = s.copy()
+        out[numeric] = text
+        return out
+
+    return Operation(f"Multiply by {factor:g}", func)
+
+
+def regex_replace(pattern, replacement):
+    compiled = re.compile(pattern)
+    return Operation(f"Replace /{pattern}/ with '{replacement}'", lambda s: s.str.replace(compiled, replacement, regex=True))
+
+
+def parse_index_list(text, size):
+
+    """
+    Turns a 1-based selection such as "1-5, 8" into sorted 0-based indices below size.
+    An empty selection means everything.
+    """
+
+    if not text.strip():
+        return list(range(size))
+    picked = set()
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = (int(p) for p in part.split("-", 1))
+            picked.update(range(start - 1, end))
+        else:
+            picked.add(int(part) - 1)
+    return sorted(i for i in picked if 0 <= i < size)
+
+
+def selection_mask(shape, rows=None, cols=None, flagged=None):
+
+    """
+    Returns a boolean mask of the cells to edit: the given rows x cols (None meaning all),
+    further limited to flagged cells when a flagged mask is given.
+    """
+
+    mask = np.zeros(shape, dtype=bool)
+    mask[np.ix_(range(shape[0]) if rows is None else rows, range(shape[1]) if cols is None else cols)] = True
+    if flagged is not None:
+        mask &= flagged
+    return mask
+
+
+def preview(df, operation, mask):
+
+    """
+    Runs an operation over the selected cells without touching df and returns the Edit
+    holding only the cells it would change.
+    """
+
+    rows, cols = np.nonzero(mask)
+    old = df.to_numpy(dtype=object)[rows, cols]
+    text = pd.Series(old, dtype=object).where(pd.notna(old), "").astype(str)
+    new = operation.func(text).astype(str)
+    changed = (new != text).to_numpy()
+    return Edit(operation.description, rows[changed], cols[changed], old[changed], new.to_numpy()[changed])
+
+
+def _assign(df, rows, cols, values):
+    # One vectorized write per affected column
+    for col in np.unique(cols):
+        sel = cols == col
+        df.iloc[rows[sel], col] = values[sel]
+
+
+class EditHistory:
+
+    """
+    Applies bulk edits to a frame in place and keeps them on an undo stack.
+    """
+
+    def __init__(self):
+        self.stack = []
+
+    def apply(self, df, edit):
+        if len(edit.rows):
+            _assign(df, edit.rows, edit.cols, edit.new)
+            self.stack.append(edit)
+        return edit
+
+    def undo(self, df):
+        """
+        Reverts the most recent edit and returns (edit, skipped), or None if there is nothing
+        to undo. Only cells still holding the edit's value are reverted; cells changed since
+        (manual corrections, re-OCR) are kept and listed in skipped as (row, col) pairs.
+        """
+        if not self.stack:
+            return None
+        edit = self.stack.pop()
+        current = df.to_numpy(dtype=object)[edit.rows, edit.cols]
+        unchanged = current.astype(str) == edit.new.astype(str)
+        _assign(df, edit.rows[unchanged], edit.cols[unchanged], edit.old[unchanged])
+        skipped = list(zip(edit.rows[~unchanged].tolist(), edit.cols[~unchanged].tolist()))
+        return edit, skipped
+
+    def clear(self):
+        self.stack.clear()
@@ -0,0 +1,231 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+from consistency import KEY_COL, DAY_COLS, MONTHS, series_name
+
+# Histograms of every reviewed value, per series (e.g. daily_max), month and column, so a cell
+# can be scored against what that day has looked like across all years instead of only against
+# its own column in one table. Values are binned on a fixed grid; the first and last bins
+# collect everything below BIN_MIN or above BIN_MAX.
+BIN_MIN = -100.0
+BIN_MAX = 150.0
+BIN_WIDTH = 0.5
+N_BINS = int(round((BIN_MAX - BIN_MIN) / BIN_WIDTH)) + 2
+
+# Column key of the histogram pooling all 31 day columns of a month. Column 0 is the year,
+# which is never indexed, so the key can't collide with a real column.
+ALL_DAYS = 0
+
+# A single day's history must hold this many values before it is trusted on its own;
+# below that the month's pooled histogram is used.
+MIN_SAMPLES = 30
+
+# Cells in the lowest or highest DEFAULT_TAIL of their historical distribution are outliers
+DEFAULT_TAIL = 0.01
+
+INDEX_FILE = "climatology.npz"
+
+
+def index_path(output_root):
+    return os.path.join(output_root, INDEX_FILE)
+
+
+def month_of(image_folder):
+
+    """
+    Returns the month number named by an output folder (e.g. "april" -> 4), or None.
+    """
+
+    return MONTHS.get(os.path.basename(image_folder).capitalize())
+
+
+def bin_index(values):
+    with np.errstate(invalid="ignore"):
+        bins = np.floor((values - BIN_MIN) / BIN_WIDTH) + 1
+    return np.clip(np.nan_to_num(bins, nan=0), 0, N_BINS - 1).astype(np.int64)
+
+
+def _key(series, month, col):
+    return f"{series}|{month}|{col}"
+
+
+class ClimatologyIndex:
+
+    """
+    Incrementally maintained histograms of reviewed table values.
+    Each table's contribution is kept as sparse (histogram, bin, count) triples, so saving a
+    table again replaces its old values instead of counting them twice.
+    """
+
+    def __init__(self):
+        self.keys = {}
+        self.counts = np.zeros((0, N_BINS), dtype=np.int32)
+        self.contributions = {}
+
+    @classmethod
+    def load(cls, path):
+        """Returns the index stored at path, or an empty index if there is none yet."""
+        index = cls()
+        if not os.path.isfile(path):
+            return index
+        with np.load(path, allow_pickle=False) as data:
+            index.keys = {str(k): i for i, k in enumerate(data["keys"])}
+            index.counts = data["counts"].astype(np.int32)
+            offsets = data["contrib_offsets"]
+            for i, table_id in enumerate(data["contrib_ids"]):
+                sl = slice(offsets[i], offsets[i + 1])
+                index.contributions[str(table_id)] = (
+                    data["contrib_keys"][sl], data["contrib_bins"][sl], data["contrib_counts"][sl]
+                )
+        return index
+
+    def save(self, path):
+        """Writes the index as one compressed .npz, replacing the old file atomically."""
+        ids = list(self.contributions)
+        parts = [self.contributions[t] for t in ids]
+        offsets = np.cumsum([0] + [len(p[0]) for p in parts])
+        empty = np.zeros(0, dtype=np.int32)
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            keys=np.array(list(self.keys), dtype=str),
+            counts=self.counts,
+            contrib_ids=np.array(ids, dtype=str),
+            contrib_offsets=offsets,
+            contrib_keys=np.concatenate([p[0] for p in parts]) if parts else empty,
+            contrib_bins=np.concatenate([p[1] for p in parts]).astype(np.int16) if parts else empty.astype(np.int16),
+            contrib_counts=np.concatenate([p[2] for p in parts]) if parts else empty,
+        )
+        os.replace(tmp_path, path)
+
+    def _key_index(self, key):
+        if key not in self.keys:
+            self.keys[key] = len(self.keys)
+            self.counts = np.vstack([self.counts, np.zeros((1, N_BINS), dtype=np.int32)])
+        return self.keys[key]
+
+    def remove_table(self, table_id):
+        old = self.contributions.pop(table_id, None)
+        if old is not None:
+            np.subtract.at(self.counts, (old[0], old[1]), old[2])
+
+    def update_table(self, table_id, series, month, df):
+
+        """
+        Replaces a table's contribution with the numeric values of df (a checker/CSV frame).
+        table_id names the table uniquely under OUTPUT_ROOT, e.g. "april/daily_max_1893_1912.PNG".
+        """
+
+        self.remove_table(table_id)
+        numeric = df.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+        key_idx, bins = [], []
+        for col in range(numeric.shape[1]):
+            if col == KEY_COL:
+                continue
+            values = numeric[:, col]
+            values = values[np.isfinite(values)]
+            if values.size == 0:
+                continue
+            b = bin_index(values)
+            targets = [col, ALL_DAYS] if col in DAY_COLS else [col]
+            for target in targets:
+                key_idx.append(np.full(b.size, self._key_index(_key(series, month, target)), dtype=np.int32))
+                bins.append(b)
+        if not key_idx:
+            return
+        key_idx, bins = np.concatenate(key_idx), np.concatenate(bins)
+        # Collapse to one (histogram, bin) pair per distinct bin with its count
+        code, counts = np.unique(key_idx.astype(np.int64) * N_BINS + bins, return_counts=True)
+        contribution = ((code // N_BINS).astype(np.int32), (code % N_BINS).astype(np.int16), counts.astype(np.int32))
+        np.add.at(self.counts, (contribution[0], contribution[1]), contribution[2])
+        self.contributions[table_id] = contribution
+
+    def scorer(self, series, month, n_cols, exclude=None):
+        """Returns a ClimatologyScorer for one series and month, optionally leaving one table out."""
+        hist = np.zeros((n_cols, N_BINS), dtype=np.int64)
+        pooled_idx = self.keys.get(_key(series, month, ALL_DAYS))
+        pooled = self.counts[pooled_idx].astype(np.int64) if pooled_idx is not None else np.zeros(N_BINS, dtype=np.int64)
+        col_of = np.full(len(self.keys), -1)
+        for col in range(n_cols):
+            idx = self.keys.get(_key(series, month, col)) if col != KEY_COL else None
+            if idx is not None:
+                hist[col] = self.counts[idx]
+                col_of[idx] = col
+        if exclude in self.contributions:
+            keys, bins, counts = self.contributions[exclude]
+            own = col_of[keys] >= 0
+            np.subtract.at(hist, (col_of[keys[own]], bins[own]), counts[own])
+            in_pool = keys == pooled_idx
+            np.subtract.at(pooled, bins[in_pool], counts[in_pool])
+        return ClimatologyScorer(hist, pooled)
+
+
+class ClimatologyScorer:
+
+    """
+    Cumulative distributions for each column of one series and month. Scoring a cell is a
+    single lookup of its bin in its column's CDF.
+    """
+
+    def __init__(self, hist, pooled):
+        totals = hist.sum(axis=1)
+        # Columns with too little history of their own borrow the month's pooled histogram
+        thin = (totals < MIN_SAMPLES) & np.isin(np.arange(len(hist)), DAY_COLS)
+        hist = hist.copy()
+        hist[thin] = pooled
+        totals = hist.sum(axis=1)
+        cdf = np.cumsum(hist, axis=1)
+        # Mid-rank percentile, so a value in a crowded bin scores near the middle of its ties
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.mid_cdf = (cdf - hist / 2) / totals[:, None]
+        self.mid_cdf[totals < MIN_SAMPLES] = np.nan
+
+    def percentiles(self, df):
+        """Returns the historical percentile (0-1) of every cell; NaN where unscorable."""
+        numeric = df.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+        n_cols = min(numeric.shape[1], self.mid_cdf.shape[0])
+        out = np.full(numeric.shape, np.nan)
+        cols = np.broadcast_to(np.arange(n_cols), (numeric.shape[0], n_cols))
+        values = numeric[:, :n_cols]
+        scored = self.mid_cdf[cols, bin_index(values)]
+        out[:, :n_cols] = np.where(np.isfinite(values), scored, np.nan)
+        return out
+
+    def outliers(self, df, tail=DEFAULT_TAIL):
+        """Flags cells in the lowest or highest tail of their history."""
+        pct = self.percentiles(df)
+        with np.errstate(invalid="ignore"):
+            return (pct < tail) | (pct > 1 - tail)
+
+
+def build_index(output_root):
+
+    """
+    Rebuilds the index from every CSV under OUTPUT_ROOT/<month>/csv_outputs/ and saves it.
+    Folders not named after a month are skipped. Returns the index.
+    """
+
+    index = ClimatologyIndex()
+    for folder in sorted(os.listdir(output_root)):
+        month = month_of(folder)
+        csv_dir = os.path.join(output_root, folder, "csv_outputs")
+        if month is None or not os.path.isdir(csv_dir):
+            continue
+        for fname in sorted(os.listdir(csv_dir)):
+            if fname.lower().endswith(".csv"):
+                table = fname[:-len(".csv")]
+                df = pd.read_csv(os.path.join(csv_dir, fname), header=None, dtype=str)
+                index.update_table(f"{folder}/{table}", series_name(table), month, df)
+    index.save(index_path(output_root))
+    return index
+
+
+if __name__ == "__main__":
+    root = sys.argv[1] if len(sys.argv) > 1 else "output"
+    built = build_index(root)
+    print(f"✅ Indexed {len(built.contributions)} tables into {index_path(root)}")
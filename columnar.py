@@ -0,0 +1,192 @@
+import os
+import numpy as np
+import pandas as pd
+
+from segmentation import load_grid, cell_box, find_cell_image
+
+# pyarrow is optional: without it tables are only exported as CSV
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+COLUMNAR_EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Columnar output needs pyarrow. Install it with 'pip install pyarrow'.")
+
+
+def is_columnar(path):
+
+    """
+    Returns True if the path points at a Parquet or Arrow IPC table.
+    """
+
+    return os.path.splitext(path)[1].lower() in COLUMNAR_EXTENSIONS.values()
+
+
+def columnar_path(csv_output_folder, table, fmt):
+
+    """
+    Returns the path of the columnar table written next to the table's CSV.
+    """
+
+    if fmt not in COLUMNAR_EXTENSIONS:
+        raise ValueError(f"Unknown columnar format '{fmt}'. Use one of: {', '.join(COLUMNAR_EXTENSIONS)}.")
+    return os.path.join(csv_output_folder, f"{table}{COLUMNAR_EXTENSIONS[fmt]}")
+
+
+def _schema():
+    # One record per cell, in row-major order
+    return pa.schema([
+        ("row", pa.int32()),
+        ("col", pa.int32()),
+        ("raw_text", pa.string()),
+        ("value", pa.float64()),
+        ("reviewed", pa.string()),
+        ("source_image", pa.string()),
+        ("cell_image", pa.string()),
+        ("rotation", pa.float32()),
+        ("x0", pa.int32()),
+        ("y0", pa.int32()),
+        ("x1", pa.int32()),
+        ("y1", pa.int32()),
+    ])
+
+
+def _texts(values):
+    # Blank OCR results are stored as nulls so they read back as missing, like in the CSV
+    return [v if isinstance(v, str) and v != "" else None for v in values]
+
+
+def build_table(data, table_path, reviewed=None):
+
+    """
+    Converts OCR output (a list of rows of strings) into a columnar table with one record per
+    cell. Crop boxes and the source scan come from the grid saved during segmentation.
+    reviewed (rows of strings shaped like data) fills the reviewed column; it defaults to data.
+    """
+
+    _require_pyarrow()
+    grid = load_grid(table_path)
+    rows, cols, texts, cell_images, boxes = [], [], [], [], []
+    for r, row_data in enumerate(data):
+        for c, text in enumerate(row_data):
+            rows.append(r)
+            cols.append(c)
+            texts.append(text)
+            cell_images.append(find_cell_image(table_path, r, c))
+            box = None
+            if grid and r + 1 < len(grid["row_lines"]) and c + 1 < len(grid["col_lines"]):
+                box = cell_box(grid, r, c)
+            boxes.append(box or (None, None, None, None))
+
+    texts = _texts(texts)
+    checked = texts if reviewed is None else _texts([text for row in reviewed for text in row])
+    values = pd.to_numeric(pd.Series(checked, dtype=object), errors="coerce").to_numpy(dtype=float)
+    columns = {
+        "row": rows,
+        "col": cols,
+        "raw_text": texts,
+        "value": values,
+        "reviewed": checked,
+        "source_image": [grid["image_path"] if grid else None] * len(rows),
+        "cell_image": cell_images,
+        "rotation": [grid["rotation"] if grid else None] * len(rows),
+        "x0": [b[0] for b in boxes],
+        "y0": [b[1] for b in boxes],
+        "x1": [b[2] for b in boxes],
+        "y1": [b[3] for b in boxes],
+    }
+    return pa.table(columns, schema=_schema())
+
+
+def write_table(table, path):
+
+    """
+    Writes a columnar table as Parquet or Arrow IPC depending on the file extension.
+    The file is written under a temporary name first so readers never see a partial table.
+    """
+
+    _require_pyarrow()
+    ext = os.path.splitext(path)[1].lower()
+    tmp_path = f"{path}.tmp"
+    if ext == ".parquet":
+        pq.write_table(table, tmp_path)
+    elif ext == ".arrow":
+        with pa.OSFile(tmp_path, "wb") as sink, ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        raise ValueError(f"Unsupported columnar file: {path}")
+    os.replace(tmp_path, path)
+
+
+def read_table(path, memory_map=True):
+
+    """
+    Reads a Parquet or Arrow IPC table. By default the file is memory-mapped instead of
+    copied into memory; pass memory_map=False when the file is about to be replaced.
+    """
+
+    _require_pyarrow()
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".parquet":
+        return pq.read_table(path, memory_map=memory_map)
+    if ext == ".arrow":
+        source = pa.memory_map(path, "r") if memory_map else pa.OSFile(path, "rb")
+        table = ipc.open_file(source).read_all()
+        if not memory_map:
+            source.close()
+        return table
+    raise ValueError(f"Unsupported columnar file: {path}")
+
+
+def to_grid_frame(table, column="reviewed"):
+
+    """
+    Pivots one text column of a cell table back into the row x col grid the checker edits.
+    Missing cells are NaN, matching a CSV read with dtype=str.
+    """
+
+    rows = table.column("row").to_numpy()
+    cols = table.column("col").to_numpy()
+    shape = (int(rows.max()) + 1, int(cols.max()) + 1) if len(rows) else (0, 0)
+    grid = np.full(shape, np.nan, dtype=object)
+    texts = np.array(table.column(column).to_pylist(), dtype=object)
+    present = np.array([t is not None for t in texts], dtype=bool)
+    grid[rows[present], cols[present]] = texts[present]
+    return pd.DataFrame(grid)
+
+
+def update_reviewed(path, df):
+
+    """
+    Stores the checker's current values in the reviewed and value columns of a columnar table,
+    keeping raw OCR text and provenance untouched.
+    """
+
+    table = read_table(path, memory_map=False)
+    rows = table.column("row").to_numpy()
+    cols = table.column("col").to_numpy()
+    grid = df.astype(object).where(df.notna(), None).to_numpy(dtype=object)
+    inside = (rows < grid.shape[0]) & (cols < grid.shape[1])
+    reviewed = np.full(len(rows), None, dtype=object)
+    reviewed[inside] = grid[rows[inside], cols[inside]]
+    reviewed = _texts(reviewed.tolist())
+    values = pd.to_numeric(pd.Series(reviewed, dtype=object), errors="coerce").to_numpy(dtype=float)
+
+    table = table.set_column(table.schema.get_field_index("reviewed"), "reviewed", pa.array(reviewed, pa.string()))
+    table = table.set_column(table.schema.get_field_index("value"), "value", pa.array(values, pa.float64()))
+    write_table(table, path)
+
+
+def export_csv(table, csv_path, column="reviewed"):
+
+    """
+    Writes the headerless grid CSV the rest of the pipeline expects.
+    """
+
+    to_grid_frame(table, column).to_csv(csv_path, index=False, header=False)
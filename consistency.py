@@ -0,0 +1,205 @@
+import os
+import re
+import calendar
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+# Layout of the ledger tables written by run_ocr_on_table: the first column holds the
+# year (the key every table is aligned on), the next 31 columns hold one value per day.
+KEY_COL = 0
+DAY_COLS = list(range(1, 32))
+
+MONTHS = {name: i for i, name in enumerate(calendar.month_name) if name}
+
+Finding = namedtuple("Finding", ["csv_path", "row", "col", "message"])
+
+
+class CsvTables:
+
+    """
+    Lazy view over every CSV in a csv_outputs folder.
+    Only the file listing is read up front; each table is parsed the first time it is needed.
+    """
+
+    def __init__(self, csv_dir):
+        self.csv_dir = csv_dir
+        self.paths = {
+            fname[:-len(".csv")]: os.path.join(csv_dir, fname)
+            for fname in sorted(os.listdir(csv_dir))
+            if fname.lower().endswith(".csv")
+        }
+        self._frames = {}
+
+    def names(self):
+        return list(self.paths)
+
+    def frame(self, name):
+        """Returns the table as floats (non-numeric cells become NaN)."""
+        if name not in self._frames:
+            raw = pd.read_csv(self.paths[name], header=None, dtype=str)
+            self._frames[name] = raw.apply(pd.to_numeric, errors="coerce")
+        return self._frames[name]
+
+    def keys(self, name):
+        """Returns the key column only, without parsing the rest of the table when possible."""
+        if name in self._frames:
+            return self._frames[name].iloc[:, KEY_COL]
+        raw = pd.read_csv(self.paths[name], header=None, dtype=str, usecols=[KEY_COL])
+        return pd.to_numeric(raw.iloc[:, 0], errors="coerce")
+
+
+def series_name(name):
+
+    """
+    Strips the year span from a table name so consecutive spans of one series group together,
+    e.g. daily_max_1893_1912.PNG -> daily_max.
+    """
+
+    base = name.split(".")[0]
+    return re.sub(r"[_\-\s]*\d{4}([_\-\s]+\d{4})?$", "", base)
+
+
+def name_span(name):
+
+    """
+    Returns the (first, last) years named in a table, or None when the name has no span.
+    """
+
+    match = re.search(r"(\d{4})[_\-\s]+(\d{4})", name)
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+def counterpart_name(name, names):
+
+    """
+    Returns the matching min table for a max table (or vice versa) if it exists in names.
+    """
+
+    swapped = re.sub(r"(?<![a-z])max(?![a-z])", "min", name, flags=re.IGNORECASE)
+    if swapped != name and swapped in names:
+        return swapped
+    return None
+
+
+def check_duplicate_keys(tables):
+
+    """
+    Flags years that appear more than once within a series, whether in one table or across
+    consecutive spans.
+    """
+
+    findings = []
+    groups = {}
+    for name in tables.names():
+        groups.setdefault(series_name(name), []).append(name)
+    for members in groups.values():
+        keys = pd.concat([tables.keys(n) for n in members], keys=members, names=["table", "row"])
+        keys = keys.dropna()
+        dupes = keys[keys.duplicated(keep=False)]
+        for (name, row), year in dupes.items():
+            findings.append(Finding(tables.paths[name], int(row), KEY_COL, f"Duplicate year {int(year)} in series"))
+    return findings
+
+
+def check_key_span(tables):
+
+    """
+    Flags years outside the span named in the table's file name.
+    """
+
+    findings = []
+    for name in tables.names():
+        span = name_span(name)
+        if span is None:
+            continue
+        keys = tables.keys(name).to_numpy(dtype=float)
+        bad = ~np.isnan(keys) & ((keys < span[0]) | (keys > span[1]))
+        for row in np.flatnonzero(bad):
+            findings.append(Finding(tables.paths[name], int(row), KEY_COL, f"Year {int(keys[row])} outside {span[0]}-{span[1]}"))
+    return findings
+
+
+def check_day_counts(tables, month):
+
+    """
+    Flags values recorded on days that do not exist in the given month for that row's year
+    (e.g. April 31st, or February 29th outside leap years).
+    """
+
+    findings = []
+    if month not in range(1, 13):
+        return findings
+    for name in tables.names():
+        df = tables.frame(name)
+        cols = [c for c in DAY_COLS if c < df.shape[1]]
+        if not cols:
+            continue
+        days_in_month = np.full(len(df), calendar.monthrange(2001, month)[1])
+        if month == 2:
+            # Rows without a year count as leap years so only always-impossible days are flagged
+            years = df.iloc[:, KEY_COL].to_numpy(dtype=float)
+            with np.errstate(invalid="ignore"):
+                leap = (years % 4 == 0) & ((years % 100 != 0) | (years % 400 == 0))
+            days_in_month = np.where(leap | np.isnan(years), 29, 28)
+        day_numbers = np.array(cols)
+        values = df.iloc[:, cols].to_numpy(dtype=float)
+        bad = ~np.isnan(values) & (day_numbers[None, :] > days_in_month[:, None])
+        for row, idx in np.argwhere(bad):
+            findings.append(Finding(tables.paths[name], int(row), cols[idx], f"Value on day {cols[idx]}, which does not exist in {calendar.month_name[month]}"))
+    return findings
+
+
+def check_max_min(tables):
+
+    """
+    Aligns every max table with its min counterpart on the year column and flags days where
+    the maximum is lower than the minimum. Both cells are reported.
+    """
+
+    findings = []
+    names = set(tables.names())
+    for max_name in tables.names():
+        min_name = counterpart_name(max_name, names)
+        if min_name is None:
+            continue
+        max_df = tables.frame(max_name)
+        min_df = tables.frame(min_name)
+        cols = [c for c in DAY_COLS if c < max_df.shape[1] and c < min_df.shape[1]]
+        max_keyed = max_df.reset_index().rename(columns={"index": "_row"}).dropna(subset=[KEY_COL]).drop_duplicates(KEY_COL)
+        min_keyed = min_df.reset_index().rename(columns={"index": "_row"}).dropna(subset=[KEY_COL]).drop_duplicates(KEY_COL)
+        joined = max_keyed.merge(min_keyed, on=KEY_COL, suffixes=("_max", "_min"))
+        if joined.empty:
+            continue
+        max_vals = joined[[f"{c}_max" for c in cols]].to_numpy(dtype=float)
+        min_vals = joined[[f"{c}_min" for c in cols]].to_numpy(dtype=float)
+        bad = max_vals < min_vals
+        for i, idx in np.argwhere(bad):
+            year = int(joined[KEY_COL].iat[i])
+            col = cols[idx]
+            message = f"Max {max_vals[i, idx]:g} < min {min_vals[i, idx]:g} for {year} day {col}"
+            findings.append(Finding(tables.paths[max_name], int(joined["_row_max"].iat[i]), col, message))
+            findings.append(Finding(tables.paths[min_name], int(joined["_row_min"].iat[i]), col, message))
+    return findings
+
+
+def check_folder(csv_dir, month=None):
+
+    """
+    Runs every cross-table check over a csv_outputs folder and returns a list of Findings.
+    The month defaults to the name of the folder above csv_dir (e.g. output/april/csv_outputs).
+    """
+
+    if month is None:
+        folder = os.path.basename(os.path.dirname(os.path.abspath(csv_dir)))
+        month = MONTHS.get(folder.capitalize())
+    tables = CsvTables(csv_dir)
+    findings = []
+    findings += check_duplicate_keys(tables)
+    findings += check_key_span(tables)
+    if month:
+        findings += check_day_counts(tables, month)
+    findings += check_max_min(tables)
+    return findings
@@ -0,0 +1,78 @@
+import cv2
+import numpy as np
+
+# One tile of a contact sheet: the cell thumbnail with its row number and value underneath.
+# A page is drawn as a single image, so the checker shows one PhotoImage however many cells it holds.
+THUMB_WIDTH = 150
+THUMB_HEIGHT = 60
+LABEL_HEIGHT = 22
+TILE_GAP = 4
+SHEET_COLUMNS = 8
+DEFAULT_PAGE_SIZE = 64
+
+_FONT = cv2.FONT_HERSHEY_SIMPLEX
+_HIGHLIGHT = (40, 170, 40)
+
+
+def thumbnail(img, width=THUMB_WIDTH, height=THUMB_HEIGHT):
+
+    """
+    Scales a BGR cell image to fit width x height without changing its aspect ratio,
+    centred on white. A missing image (None) gives a gray tile.
+    """
+
+    tile = np.full((height, width, 3), 255, np.uint8)
+    if img is None or img.size == 0:
+        tile[:] = 200
+        return tile
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    scale = min(width / img.shape[1], height / img.shape[0])
+    w, h = max(1, int(img.shape[1] * scale)), max(1, int(img.shape[0] * scale))
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    x, y = (width - w) // 2, (height - h) // 2
+    tile[y:y + h, x:x + w] = cv2.resize(img, (w, h), interpolation=interpolation)
+    return tile
+
+
+def render_sheet(thumbs, labels, columns=SHEET_COLUMNS, highlight=()):
+
+    """
+    Composites thumbnails (as made by thumbnail) and their labels into one BGR image,
+    columns tiles per row. Tiles whose index is in highlight get a green frame.
+    Returns (sheet, boxes), boxes[i] being the (x0, y0, x1, y1) of tile i for hit-testing clicks.
+    """
+
+    if not thumbs:
+        return np.full((THUMB_HEIGHT + LABEL_HEIGHT + 2 * TILE_GAP, THUMB_WIDTH + 2 * TILE_GAP, 3), 255, np.uint8), []
+    th, tw = thumbs[0].shape[:2]
+    step_x, step_y = tw + TILE_GAP, th + LABEL_HEIGHT + TILE_GAP
+    n_rows = -(-len(thumbs) // columns)
+    sheet = np.full((TILE_GAP + n_rows * step_y, TILE_GAP + min(columns, len(thumbs)) * step_x, 3), 255, np.uint8)
+    boxes = []
+    for i, (thumb, label) in enumerate(zip(thumbs, labels)):
+        x0, y0 = TILE_GAP + (i % columns) * step_x, TILE_GAP + (i // columns) * step_y
+        sheet[y0:y0 + th, x0:x0 + tw] = thumb
+        sheet[y0 + th:y0 + th + LABEL_HEIGHT, x0:x0 + tw] = 235
+        cv2.putText(sheet, label, (x0 + 3, y0 + th + LABEL_HEIGHT - 6), _FONT, 0.45, (0, 0, 0), 1, cv2.LINE_AA)
+        box = (x0, y0, x0 + tw, y0 + th + LABEL_HEIGHT)
+        if i in highlight:
+            cv2.rectangle(sheet, (box[0], box[1]), (box[2] - 1, box[3] - 1), _HIGHLIGHT, 2)
+        boxes.append(box)
+    return sheet, boxes
+
+
+def tile_at(boxes, x, y):
+
+    """
+    Returns the index of the tile under a click at (x, y) on the sheet, or None.
+    """
+
+    for i, (x0, y0, x1, y1) in enumerate(boxes):
+        if x0 <= x < x1 and y0 <= y < y1:
+            return i
+    return None
+
+
+def paginate(items, page_size=DEFAULT_PAGE_SIZE):
+    return [items[i:i + page_size] for i in range(0, len(items), page_size)]
@@ -0,0 +1,130 @@
+import os
+import json
+import cv2
+import numpy as np
+
+from payload import ink_mask, remove_grid_lines, MIN_INK_PIXELS
+
+# Hamming distance (out of 64 bits) below which two cells share one OCR result
+DEFAULT_DEDUP_THRESHOLD = 4
+
+# Hash given to every cell without ink, so blank and smudged cells form one cluster
+BLANK_HASH = -1
+
+DEDUP_SUFFIX = ".dedup.json"
+
+
+def perceptual_hash(img):
+
+    """
+    Returns the 64-bit DCT perceptual hash of a cell crop, or BLANK_HASH if the crop holds no ink.
+    """
+
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    gray, ink = remove_grid_lines(gray, ink_mask(gray))
+    if np.count_nonzero(ink) < MIN_INK_PIXELS:
+        return BLANK_HASH
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].ravel()
+    # The DC term only encodes overall brightness
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class HammingIndex:
+
+    """
+    Index of 64-bit hashes answering "which stored hashes are within max_dist bits".
+    Each hash is split into max_dist + 1 chunks; by the pigeonhole principle any hash within
+    max_dist bits matches at least one chunk exactly, so only those buckets are compared.
+    """
+
+    def __init__(self, max_dist):
+        self.max_dist = max_dist
+        n = min(max_dist + 1, 64)
+        bounds = np.linspace(0, 64, n + 1).round().astype(int)
+        self.chunks = [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:])]
+        self.buckets = [{} for _ in self.chunks]
+        self.items = []
+
+    def _keys(self, h):
+        return [(h >> (64 - b)) & ((1 << (b - a)) - 1) for a, b in self.chunks]
+
+    def add(self, h, item):
+        self.items.append((h, item))
+        idx = len(self.items) - 1
+        for bucket, key in zip(self.buckets, self._keys(h)):
+            bucket.setdefault(key, []).append(idx)
+
+    def query(self, h):
+        """Returns (distance, item) pairs within max_dist, nearest first."""
+        candidates = set()
+        for bucket, key in zip(self.buckets, self._keys(h)):
+            candidates.update(bucket.get(key, ()))
+        hits = []
+        for idx in candidates:
+            other, item = self.items[idx]
+            dist = bin(h ^ other).count("1")
+            if dist <= self.max_dist:
+                hits.append((dist, item))
+        return sorted(hits, key=lambda hit: hit[0])
+
+
+def cluster_cells(cells, threshold=DEFAULT_DEDUP_THRESHOLD):
+
+    """
+    Groups near-identical cell crops. cells is a list of ((row, col), image_path) in reading order.
+    Returns {(row, col): (rep_row, rep_col)} mapping every cell to the cell whose OCR result it
+    reuses (representatives map to themselves).
+    """
+
+    index = HammingIndex(threshold)
+    blank_rep = None
+    mapping = {}
+    for cell, path in cells:
+        img = cv2.imread(path)
+        h = perceptual_hash(img) if img is not None else None
+        if h is None:
+            mapping[cell] = cell
+        elif h == BLANK_HASH:
+            blank_rep = blank_rep or cell
+            mapping[cell] = blank_rep
+        else:
+            hits = index.query(h)
+            if hits:
+                mapping[cell] = hits[0][1]
+            else:
+                index.add(h, cell)
+                mapping[cell] = cell
+    return mapping
+
+
+def dedup_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + DEDUP_SUFFIX
+
+
+def save_shared_cells(path, mapping, threshold):
+
+    """
+    Records which cells reused another cell's OCR result (0-based row/col), for the checker.
+    """
+
+    shared = [
+        {"row": r, "col": c, "source_row": sr, "source_col": sc}
+        for (r, c), (sr, sc) in sorted(mapping.items()) if (r, c) != (sr, sc)
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"threshold": threshold, "shared": shared}, f, indent=2)
+
+
+def load_shared_cells(path):
+
+    """
+    Returns {(row, col): (source_row, source_col)} for cells that reused another cell's result.
+    """
+
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {(s["row"], s["col"]): (s["source_row"], s["source_col"]) for s in data.get("shared", [])}
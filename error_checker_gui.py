@@ -1,4 +1,5 @@
 import os
+import re
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from PIL import Image, ImageTk
@@ -6,6 +7,24 @@ import pandas as pd
 import cv2
 import numpy as np
 
+from jobs import JobRunner, format_progress
+from columnar import is_columnar, read_table, to_grid_frame, update_reviewed
+from consistency import check_folder, series_name
+from dedup import dedup_path_for, load_shared_cells
+from scan_io import FullResImage
+from payload import sharpen_image
+from segmentation import load_grid, cell_box, find_cell_image
+from bulk_edit import (
+    EditHistory, insert_decimal, substitute_characters, scale, regex_replace,
+    parse_index_list, selection_mask, preview,
+)
+from contact_sheet import thumbnail, render_sheet, tile_at, paginate, DEFAULT_PAGE_SIZE
+from climatology import ClimatologyIndex, DEFAULT_TAIL, index_path, month_of
+from validation import (
+    make_profile, load_profile, save_profile, profile_path_for,
+    validate_frame, find_std_outliers, clear_tokens,
+)
+
 BASE_DIR = "output"
 
 class OCRCheckerGUI:
@@ -21,6 +40,19 @@ class OCRCheckerGUI:
         self.col_idx = 0
         self.outlier_indices = set()
         self.checking_outliers = False
+        self.profile = None
+        self.invalid_mask = None
+        self.validation_key = None
+        self.findings = []
+        self.finding_idx = 0
+        self.climate_scorer = None
+        self.edit_history = EditHistory()
+        # Cells whose OCR text was reused from a near-identical cell: {(row, col): (source_row, source_col)}
+        self.shared_cells = {}
+        # Flagged cells accepted as they are in batch review; navigation and flagging skip them
+        self.accepted_cells = set()
+        # (table_path, grid, FullResImage) used to cut cells on demand when the cell images weren't written
+        self.full_image = None
 
         # Default values for min/max/std
         self.use_min_max = tk.BooleanVar(value=False)
@@ -28,9 +60,13 @@ class OCRCheckerGUI:
         self.min_val = tk.StringVar(value="-50")
         self.max_val = tk.StringVar(value="99")
         self.std_thresh = tk.StringVar(value="2")
+        self.use_climatology = tk.BooleanVar(value=False)
+        self.climate_tail = tk.StringVar(value=str(DEFAULT_TAIL * 100))
 
         self.create_widgets()
         self.master.bind('<Return>', self.handle_enter_key)
+        # Vision requests run on a background thread so the window stays responsive
+        self.jobs = JobRunner(master, on_progress=self.show_job_progress)
 
     def create_widgets(self):
         # Top input fields and buttons centered
@@ -44,6 +80,11 @@ class OCRCheckerGUI:
         self.csv_label.grid(row=1, column=0, columnspan=2)
         tk.Button(top_inner, text="Load CSV", command=self.load_csv).grid(row=2, column=0, columnspan=2, pady=5)
         tk.Button(top_inner, text="Add Decimal Prefix", command=self.add_decimal_prefix).grid(row=3, column=0, columnspan=2, pady=5)
+        tk.Button(top_inner, text="Choose Profile", command=self.select_profile_file).grid(row=4, column=0, pady=5)
+        self.profile_label = tk.Label(top_inner, text="Profile: default")
+        self.profile_label.grid(row=4, column=1)
+        tk.Button(top_inner, text="Bulk Edit...", command=self.open_bulk_edit).grid(row=5, column=0, pady=5)
+        tk.Button(top_inner, text="Undo Bulk Edit", command=self.undo_bulk_edit).grid(row=5, column=1, pady=5)
 
         # Main content with image and data display
         content_frame = tk.Frame(self.master)
@@ -62,6 +103,8 @@ class OCRCheckerGUI:
         self.current_text = tk.StringVar()
         self.entry = tk.Entry(control_frame, textvariable=self.current_text)
         self.entry.pack(pady=(0, 5))
+        self.shared_label = tk.Label(control_frame, text="", fg="gray25")
+        self.shared_label.pack()
 
         action_btns = tk.Frame(control_frame)
         action_btns.pack()
@@ -86,6 +129,10 @@ class OCRCheckerGUI:
         tk.Label(validation_frame, text="Std Threshold:").grid(row=1, column=1)
         tk.Entry(validation_frame, textvariable=self.std_thresh, width=6).grid(row=1, column=2)
 
+        tk.Checkbutton(validation_frame, text="Enable Climatology Check", variable=self.use_climatology).grid(row=2, column=0, sticky="w")
+        tk.Label(validation_frame, text="Tail %:").grid(row=2, column=1)
+        tk.Entry(validation_frame, textvariable=self.climate_tail, width=6).grid(row=2, column=2)
+
         # Right column: text frame with scrollbars
         right_column = tk.Frame(content_frame)
         right_column.pack(side="left", padx=10, fill="both", expand=True)
@@ -116,11 +163,21 @@ class OCRCheckerGUI:
         self.search_col.pack(side="left")
         tk.Button(search_frame, text="Go to Cell", command=self.goto_cell).pack(side="left", padx=5)
 
+        # Cross-table consistency findings for the current table
+        findings_frame = tk.Frame(right_column)
+        findings_frame.grid(row=4, column=0, columnspan=2, pady=(0, 10), sticky="n")
+        tk.Button(findings_frame, text="Cross-Table Check", command=self.run_cross_table_check).pack(side="left", padx=5)
+        tk.Button(findings_frame, text="Next Finding", command=self.goto_next_finding).pack(side="left", padx=5)
+        tk.Button(findings_frame, text="Re-OCR Flagged", command=self.reocr_flagged_cells).pack(side="left", padx=5)
+        tk.Button(findings_frame, text="Batch Review", command=self.open_batch_review).pack(side="left", padx=5)
+        self.finding_label = tk.Label(findings_frame, text="")
+        self.finding_label.pack(side="left", padx=5)
+
     def select_csv_file(self):
         filepath = filedialog.askopenfilename(
             initialdir=BASE_DIR,
             title="Select CSV File",
-            filetypes=(("CSV Files", "*.csv"),)
+            filetypes=(("CSV Files", "*.csv"), ("Columnar Tables", "*.parquet *.arrow"))
         )
         if filepath:
             self.csv_path = filepath
@@ -130,7 +187,7 @@ class OCRCheckerGUI:
             parts = rel_path.split(os.sep)
             if len(parts) >= 3:
                 self.image_folder = parts[0]
-                self.table = parts[2].replace(".csv", "")
+                self.table = os.path.splitext(parts[2])[0]
             else:
                 self.image_folder = ""
                 self.table = ""
@@ -144,15 +201,28 @@ class OCRCheckerGUI:
             messagebox.showerror("Error", "No CSV file selected or file does not exist.")
             return
 
-        self.current_csv = pd.read_csv(self.csv_path, header=None, dtype=str)
-        self.current_csv = self.current_csv.applymap(lambda x: "" if str(x).strip().lower() in {"x"} else x)
+        if is_columnar(self.csv_path):
+            # Columnar tables are memory-mapped and already hold text per cell, no CSV parsing needed
+            self.current_csv = to_grid_frame(read_table(self.csv_path), "reviewed")
+        else:
+            self.current_csv = pd.read_csv(self.csv_path, header=None, dtype=str)
+        self.current_csv = clear_tokens(self.current_csv, ("x",))
 
         # Set table_path for images: output/image_folder/table
         self.table_path = os.path.join(BASE_DIR, self.image_folder, self.table)
+        self.close_scan()
         self.row_idx = 0
         self.col_idx = 0
         self.checking_outliers = False
-
+        self.edit_history.clear()
+        self.accepted_cells = set()
+
+        self.shared_cells = load_shared_cells(dedup_path_for(self.csv_path))
+        self.shared_label.config(text="")
+        self.profile = load_profile(profile_path_for(self.csv_path))
+        self.profile_label.config(text=f"Profile: {self.profile['name'] if self.profile else 'default'}")
+        self.refresh_validation(force=True)
+        self.load_climatology()
         self.find_outliers()
         self.update_csv_display()
         self.load_next_invalid_cell()
@@ -169,59 +239,133 @@ class OCRCheckerGUI:
                     self.text_display.insert(tk.END, "\t")
             self.text_display.insert(tk.END, "\n")
 
-    def is_invalid(self, value, is_first_col):
-        value = value.strip()
-        if value.lower() == "x" or value == "":
-            return True
-        if value.lower() == "nan" and self.ignore_nan_var.get():
-            return False
-        try:
-            num = float(value)
-            if self.use_min_max.get():
-                min_v = float(self.min_val.get())
-                max_v = float(self.max_val.get())
-                return not (min_v <= num <= max_v)
-            else:
-                return not (-50 <= num <= 99)
-        except ValueError:
-            return True
+    def active_profile(self):
+        """
+        Returns the table's saved profile, or one built from the Min/Max fields.
+        """
+        if self.profile is not None:
+            return self.profile
+        if self.use_min_max.get():
+            try:
+                return make_profile(min_val=float(self.min_val.get()), max_val=float(self.max_val.get()))
+            except ValueError:
+                pass
+        return make_profile()
+
+    def refresh_validation(self, force=False):
+        """
+        Recomputes the invalid-cell mask for the whole sheet when the data or
+        any validation setting has changed since the last pass.
+        """
+        key = (
+            id(self.profile), self.use_min_max.get(), self.min_val.get(),
+            self.max_val.get(), self.ignore_nan_var.get(),
+        )
+        if force or self.invalid_mask is None or key != self.validation_key:
+            self.invalid_mask = validate_frame(self.current_csv, self.active_profile(), self.ignore_nan_var.get())
+            self.validation_key = key
+
+    def revalidate_cell(self, row, col):
+        """
+        Re-checks a single edited cell against the active profile.
+        """
+        if self.invalid_mask is not None:
+            cell = self.current_csv.iloc[[row], [col]]
+            self.invalid_mask[row, col] = validate_frame(cell, self.active_profile(), self.ignore_nan_var.get())[0, 0]
 
     def find_outliers(self):
         self.outlier_indices.clear()
-        if not self.use_std.get():
-            return  # Skip outlier detection if not enabled
-        try:
-            std_thresh = float(self.std_thresh.get())
-        except Exception:
-            std_thresh = 2
-        for col in range(1, self.current_csv.shape[1]):
+        mask = np.zeros(self.current_csv.shape, dtype=bool)
+        scored = np.zeros(self.current_csv.shape, dtype=bool)
+        if self.use_climatology.get() and self.climate_scorer is not None:
             try:
-                col_values = pd.to_numeric(self.current_csv.iloc[:, col], errors='coerce')
-                valid_vals = col_values.dropna()
-                if not valid_vals.empty:
-                    mean = valid_vals.mean()
-                    std = valid_vals.std()
-                    for row in range(len(col_values)):
-                        val = col_values.iat[row]
-                        if pd.notna(val) and abs(val - mean) > std_thresh * std:
-                            self.outlier_indices.add((row, col))
+                tail = float(self.climate_tail.get()) / 100
+            except ValueError:
+                tail = DEFAULT_TAIL
+            pct = self.climate_scorer.percentiles(self.current_csv)
+            scored = ~np.isnan(pct)
+            with np.errstate(invalid="ignore"):
+                mask |= (pct < tail) | (pct > 1 - tail)
+        if self.use_std.get():
+            try:
+                std_thresh = float(self.std_thresh.get())
             except Exception:
-                continue
+                std_thresh = 2
+            skip = self.active_profile().get("outlier_skip", [0])
+            # Cells with enough history are judged by the climatology instead of their column
+            mask |= find_std_outliers(self.current_csv, std_thresh, skip) & ~scored
+        self.outlier_indices.update(set(map(tuple, np.argwhere(mask).tolist())) - self.accepted_cells)
+
+    def climatology_id(self):
+        """
+        Returns (table_id, series, month) for the loaded table, or None if its folder isn't a month.
+        """
+        month = month_of(self.image_folder)
+        if month is None:
+            return None
+        return f"{self.image_folder}/{self.table}", series_name(self.table), month
+
+    def load_climatology(self):
+        """
+        Builds the per-column historical CDFs for this table's series and month from the
+        index under the output folder, leaving this table's own saved values out.
+        """
+        self.climate_scorer = None
+        ident = self.climatology_id()
+        path = index_path(BASE_DIR)
+        if ident is None or not os.path.isfile(path):
+            return
+        table_id, series, month = ident
+        index = ClimatologyIndex.load(path)
+        self.climate_scorer = index.scorer(series, month, self.current_csv.shape[1], exclude=table_id)
+
+    def update_climatology(self):
+        """
+        Adds the saved table to the climatology index, replacing what it contributed before.
+        """
+        ident = self.climatology_id()
+        if ident is None:
+            return
+        table_id, series, month = ident
+        path = index_path(BASE_DIR)
+        try:
+            index = ClimatologyIndex.load(path)
+            index.update_table(table_id, series, month, self.current_csv)
+            index.save(path)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not update climatology index: {e}")
+
+    def next_flagged_position(self, mask):
+        """
+        Returns the first flagged (row, col) at or after the current cursor, or None.
+        """
+        start = self.row_idx * mask.shape[1] + self.col_idx
+        hits = np.flatnonzero(mask.ravel()[start:])
+        if hits.size == 0:
+            return None
+        return divmod(int(hits[0]) + start, mask.shape[1])
 
     def load_next_invalid_cell(self):
-        while self.row_idx < len(self.current_csv):
-            while self.col_idx < self.current_csv.shape[1]:
-                value = self.current_csv.iat[self.row_idx, self.col_idx]
-                if not self.checking_outliers:
-                    if self.is_invalid(str(value), self.col_idx == 0):
-                        self.load_cell(value)
-                        return
-                elif self.col_idx > 0 and (self.row_idx, self.col_idx) in self.outlier_indices:
-                    self.load_cell(value)
-                    return
-                self.col_idx += 1
-            self.col_idx = 0
-            self.row_idx += 1
+        if not self.checking_outliers:
+            self.refresh_validation()
+            mask = self.invalid_mask
+        else:
+            mask = np.zeros(self.current_csv.shape, dtype=bool)
+            for row, col in self.outlier_indices:
+                mask[row, col] = True
+        if self.accepted_cells:
+            # Cells accepted in batch review have been looked at already
+            mask = mask.copy()
+            for row, col in self.accepted_cells:
+                mask[row, col] = False
+
+        position = self.next_flagged_position(mask)
+        if position is not None:
+            self.row_idx, self.col_idx = position
+            self.load_cell(self.current_csv.iat[self.row_idx, self.col_idx])
+            return
+        self.row_idx = len(self.current_csv)
+        self.col_idx = 0
 
         if not self.checking_outliers:
             self.checking_outliers = True
@@ -244,10 +388,11 @@ class OCRCheckerGUI:
         self.search_col.insert(0, str(self.col_idx + 1))
 
         self.update_csv_display()
+        if self.shared_cells:
+            self.update_shared_label()
 
-        img_path = os.path.join(self.table_path, f"row_{self.row_idx+1}", f"col_{self.col_idx+1}.png")
-        if (os.path.exists(img_path)):
-            img = cv2.imread(img_path)
+        img = self.cell_image(self.row_idx, self.col_idx)
+        if img is not None:
             img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
             img = cv2.resize(img, (300, 300))
             imgtk = ImageTk.PhotoImage(image=Image.fromarray(img))
@@ -257,14 +402,59 @@ class OCRCheckerGUI:
             self.image_panel.configure(image=None)
             self.image_panel.image = None
 
+    def cell_image(self, row, col):
+        img_path = find_cell_image(self.table_path, row, col)
+        return cv2.imread(img_path) if img_path else self.crop_from_scan(row, col)
+
+    def crop_from_scan(self, row, col):
+        """
+        Cuts one cell straight from the source scan using the table's grid.json,
+        for tables streamed without writing cell images, and sharpens it like the cells
+        that were OCR'd. Returns None if there is no grid. The grid and the scan are
+        loaded once per table.
+        """
+        if self.full_image is None or self.full_image[0] != self.table_path:
+            self.close_scan()
+            grid = load_grid(self.table_path)
+            if grid is None:
+                return None
+            try:
+                self.full_image = (self.table_path, grid, FullResImage(grid["image_path"], page=grid.get("page")))
+            except (OSError, ValueError, RuntimeError):
+                return None
+        _, grid, full = self.full_image
+        if row >= len(grid["row_lines"]) - 1 or col >= len(grid["col_lines"]) - 1:
+            return None
+        return sharpen_image(full.rotated_crop(cell_box(grid, row, col), grid.get("rotation", 0)))
+
+    def close_scan(self):
+        if self.full_image is not None:
+            self.full_image[2].close()
+            self.full_image = None
+
+    def update_shared_label(self):
+        """
+        Shows whether the current cell's OCR text was shared with near-identical cells.
+        """
+        cell = (self.row_idx, self.col_idx)
+        source = self.shared_cells.get(cell)
+        if source is not None:
+            text = f"OCR result reused from Row {source[0] + 1}, Col {source[1] + 1}"
+        else:
+            users = sum(1 for s in self.shared_cells.values() if s == cell)
+            text = f"OCR result shared with {users} similar cell(s)" if users else ""
+        self.shared_label.config(text=text)
+
     def confirm_cell(self):
         value = self.current_text.get()
         self.current_csv.iat[self.row_idx, self.col_idx] = "" if value.strip().lower() in {"x", "nan"} else value
+        self.revalidate_cell(self.row_idx, self.col_idx)
         self.col_idx += 1
         self.load_next_invalid_cell()
 
     def clear_cell(self):
         self.current_csv.iat[self.row_idx, self.col_idx] = ""
+        self.revalidate_cell(self.row_idx, self.col_idx)
         self.col_idx += 1
         self.load_next_invalid_cell()
 
@@ -281,27 +471,388 @@ class OCRCheckerGUI:
             messagebox.showerror("Invalid Input", "Please enter valid row and column numbers.")
 
     def save_csv(self):
+        self.update_climatology()
+        if is_columnar(self.csv_path):
+            # Keep the columnar table as the source of truth and refresh the CSV export next to it
+            update_reviewed(self.csv_path, self.current_csv)
+            export_path = os.path.splitext(self.csv_path)[0] + ".csv"
+            self.current_csv.to_csv(export_path, index=False, header=False)
+            messagebox.showinfo("Saved", f"Table saved to: {self.csv_path}\nCSV exported to: {export_path}")
+            return
         self.current_csv.to_csv(self.csv_path, index=False, header=False)
         messagebox.showinfo("Saved", f"CSV saved to: {self.csv_path}")
 
     def add_decimal_prefix(self):
-        confirm = messagebox.askyesno("Confirm Action", "Are you sure you want to add a decimal to the start of all values (excluding the first column)?")
+        mask = selection_mask(self.current_csv.shape, cols=range(1, self.current_csv.shape[1]))
+        edit = preview(self.current_csv, insert_decimal(), mask)
+        if not len(edit.rows):
+            messagebox.showinfo("No Changes", "There are no whole numbers to add a decimal to.")
+            return
+        confirm = messagebox.askyesno("Confirm Action", f"Are you sure you want to add a decimal to the start of {len(edit.rows)} value(s) (excluding the first column)?")
         if not confirm:
             return
 
-        for col in range(1, self.current_csv.shape[1]):
-            for row in range(len(self.current_csv)):
-                val = str(self.current_csv.iat[row, col]).strip()
-                if val and val.lower() not in {"x", "nan"}:
-                    try:
-                        float(val)
-                        if "." not in val:
-                            self.current_csv.iat[row, col] = f".{val}"
-                    except ValueError:
-                        continue
+        self.apply_bulk_edit(edit)
+        messagebox.showinfo("Success", "Decimal prefixes added. Use Undo Bulk Edit to revert.")
+
+    def apply_bulk_edit(self, edit):
+        """
+        Applies a previewed bulk edit as one undoable step and revalidates the sheet.
+        """
+        self.edit_history.apply(self.current_csv, edit)
+        self.refresh_validation(force=True)
+        self.find_outliers()
+        self.update_csv_display()
 
+    def undo_bulk_edit(self):
+        if self.current_csv is None:
+            return
+        undone = self.edit_history.undo(self.current_csv)
+        if undone is None:
+            messagebox.showinfo("Undo", "No bulk edit to undo.")
+            return
+        edit, skipped = undone
+        self.refresh_validation(force=True)
+        self.find_outliers()
         self.update_csv_display()
-        messagebox.showinfo("Success", "Decimal prefixes added.")
+        message = f"Reverted: {edit.description} ({len(edit.rows) - len(skipped)} cell(s))."
+        if skipped:
+            cells = "\n".join(f"Row {r + 1}, Col {c + 1}" for r, c in skipped[:10]) + ("\n..." if len(skipped) > 10 else "")
+            message += f"\n\nKept {len(skipped)} cell(s) changed since the edit:\n{cells}"
+        messagebox.showinfo("Undo", message)
+
+    def flagged_mask(self):
+        """
+        Returns the cells currently flagged as invalid or as outliers, less those accepted in batch review.
+        """
+        self.refresh_validation()
+        mask = self.invalid_mask.copy()
+        for row, col in self.outlier_indices:
+            mask[row, col] = True
+        for row, col in self.accepted_cells:
+            mask[row, col] = False
+        return mask
+
+    def accept_cells(self, cells):
+        """
+        Marks cells as reviewed with their current values, so they are no longer flagged.
+        """
+        for cell in cells:
+            self.accepted_cells.add(cell)
+            self.outlier_indices.discard(cell)
+
+    def open_batch_review(self):
+        """
+        Shows the flagged cells of one column as a contact sheet: a page of thumbnails, each
+        labelled with its row and current value, drawn as a single image. Click a tile to
+        correct that cell; Accept Page keeps the values of every cell on the page.
+        """
+        if self.current_csv is None:
+            messagebox.showerror("Error", "Load a CSV first.")
+            return
+        dialog = tk.Toplevel(self.master)
+        dialog.title("Batch Review")
+
+        column = tk.StringVar(value=str(self.col_idx + 1))
+        state = {"col": self.col_idx, "rows": [], "page": 0, "boxes": [], "selected": None, "edited": set()}
+        thumbs = {}
+
+        header = tk.Frame(dialog)
+        header.pack(pady=5)
+        tk.Label(header, text="Column:").pack(side="left")
+        tk.Entry(header, textvariable=column, width=5).pack(side="left")
+        status = tk.Label(header, text="")
+        sheet_canvas = tk.Canvas(dialog, highlightthickness=0)
+        sheet_canvas.pack(padx=5)
+        editor = tk.Frame(dialog)
+        editor.pack(pady=5)
+        cell_label = tk.Label(editor, text="Click a cell to correct it", width=22, anchor="e")
+        cell_label.pack(side="left")
+        value = tk.StringVar()
+        value_entry = tk.Entry(editor, textvariable=value, width=15)
+        value_entry.pack(side="left", padx=5)
+
+        def page_rows():
+            pages = paginate(state["rows"], DEFAULT_PAGE_SIZE)
+            return pages[state["page"]] if pages else []
+
+        def render():
+            rows = page_rows()
+            c = state["col"]
+            for r in rows:
+                if (r, c) not in thumbs:
+                    thumbs[(r, c)] = thumbnail(self.cell_image(r, c))
+            labels = []
+            for r in rows:
+                text = self.current_csv.iat[r, c]
+                labels.append(f"R{r + 1}: {'' if pd.isna(text) else text}")
+            highlight = {i for i, r in enumerate(rows) if r in state["edited"]}
+            sheet, state["boxes"] = render_sheet([thumbs[(r, c)] for r in rows], labels, highlight=highlight)
+            photo = ImageTk.PhotoImage(image=Image.fromarray(cv2.cvtColor(sheet, cv2.COLOR_BGR2RGB)))
+            sheet_canvas.config(width=sheet.shape[1], height=sheet.shape[0])
+            sheet_canvas.delete("all")
+            sheet_canvas.create_image(0, 0, anchor="nw", image=photo)
+            sheet_canvas.image = photo
+            n_pages = max(1, -(-len(state["rows"]) // DEFAULT_PAGE_SIZE))
+            status.config(text=f"{len(state['rows'])} flagged cell(s) - page {state['page'] + 1} of {n_pages}")
+
+        def show():
+            try:
+                c = int(column.get()) - 1
+                if not 0 <= c < self.current_csv.shape[1]:
+                    raise ValueError
+            except ValueError:
+                messagebox.showerror("Invalid Input", "Please enter a valid column number.", parent=dialog)
+                return
+            state["rows"] = np.nonzero(self.flagged_mask()[:, c])[0].tolist()
+            state.update(col=c, page=0, selected=None, edited=set())
+            render()
+
+        def select(event):
+            i = tile_at(state["boxes"], event.x, event.y)
+            if i is None:
+                return
+            state["selected"] = page_rows()[i]
+            text = self.current_csv.iat[state["selected"], state["col"]]
+            cell_label.config(text=f"Row {state['selected'] + 1}, Col {state['col'] + 1}:")
+            value.set("" if pd.isna(text) else text)
+            value_entry.select_range(0, tk.END)
+            value_entry.focus_set()
+
+        def apply_value(event=None):
+            if state["selected"] is None:
+                return
+            r, c = state["selected"], state["col"]
+            text = value.get()
+            self.current_csv.iat[r, c] = "" if text.strip().lower() in {"x", "nan"} else text
+            self.revalidate_cell(r, c)
+            state["edited"].add(r)
+            self.update_csv_display()
+            render()
+
+        def accept_page():
+            rows = set(page_rows())
+            self.accept_cells((r, state["col"]) for r in rows)
+            state["rows"] = [r for r in state["rows"] if r not in rows]
+            state["page"] = min(state["page"], max(0, -(-len(state["rows"]) // DEFAULT_PAGE_SIZE) - 1))
+            self.update_csv_display()
+            render()
+
+        def turn(step):
+            n_pages = -(-len(state["rows"]) // DEFAULT_PAGE_SIZE)
+            if 0 <= state["page"] + step < n_pages:
+                state["page"] += step
+                render()
+
+        tk.Button(header, text="Show", command=show).pack(side="left", padx=5)
+        status.pack(side="left", padx=5)
+        tk.Button(editor, text="Apply", command=apply_value, width=8).pack(side="left")
+        value_entry.bind("<Return>", apply_value)
+        sheet_canvas.bind("<Button-1>", select)
+        nav = tk.Frame(dialog)
+        nav.pack(pady=(0, 5))
+        tk.Button(nav, text="< Prev Page", command=lambda: turn(-1), width=12).pack(side="left", padx=5)
+        tk.Button(nav, text="Accept Page", command=accept_page, width=12).pack(side="left", padx=5)
+        tk.Button(nav, text="Next Page >", command=lambda: turn(1), width=12).pack(side="left", padx=5)
+        show()
+
+    def open_bulk_edit(self):
+        """
+        Opens a dialog that previews and applies one transformation (decimal insertion,
+        OCR character substitutions, scaling or a regex replace) to a block of cells or
+        to the flagged cells only.
+        """
+        if self.current_csv is None:
+            messagebox.showerror("Error", "Load a CSV first.")
+            return
+        dialog = tk.Toplevel(self.master)
+        dialog.title("Bulk Edit")
+
+        operations = ["Insert decimal", "OCR substitutions", "Scale", "Regex replace"]
+        op_var = tk.StringVar(value=operations[0])
+        param = tk.StringVar()
+        param2 = tk.StringVar()
+        rows_var = tk.StringVar()
+        cols_var = tk.StringVar(value=f"2-{self.current_csv.shape[1]}")
+        flagged_only = tk.BooleanVar(value=False)
+
+        tk.Label(dialog, text="Operation:").grid(row=0, column=0, sticky="e")
+        ttk.Combobox(dialog, textvariable=op_var, values=operations, state="readonly", width=20).grid(row=0, column=1, sticky="w")
+        tk.Label(dialog, text="Places / factor / pattern:").grid(row=1, column=0, sticky="e")
+        tk.Entry(dialog, textvariable=param, width=20).grid(row=1, column=1, sticky="w")
+        tk.Label(dialog, text="Decimals / replacement:").grid(row=2, column=0, sticky="e")
+        tk.Entry(dialog, textvariable=param2, width=20).grid(row=2, column=1, sticky="w")
+        tk.Label(dialog, text="Rows (e.g. 1-5, 8; blank = all):").grid(row=3, column=0, sticky="e")
+        tk.Entry(dialog, textvariable=rows_var, width=20).grid(row=3, column=1, sticky="w")
+        tk.Label(dialog, text="Columns:").grid(row=4, column=0, sticky="e")
+        tk.Entry(dialog, textvariable=cols_var, width=20).grid(row=4, column=1, sticky="w")
+        tk.Checkbutton(dialog, text="Flagged cells only", variable=flagged_only).grid(row=5, column=1, sticky="w")
+        preview_text = tk.Text(dialog, height=12, width=60)
+        preview_text.grid(row=7, column=0, columnspan=2, padx=5, pady=5)
+
+        def build_edit():
+            name, p, p2 = op_var.get(), param.get().strip(), param2.get()
+            try:
+                if name == "Insert decimal":
+                    operation = insert_decimal(int(p) if p else None)
+                elif name == "OCR substitutions":
+                    operation = substitute_characters()
+                elif name == "Scale":
+                    operation = scale(float(p), int(p2) if p2.strip() else None)
+                else:
+                    operation = regex_replace(p, p2)
+                rows = parse_index_list(rows_var.get(), self.current_csv.shape[0])
+                cols = parse_index_list(cols_var.get(), self.current_csv.shape[1])
+            except (ValueError, re.error) as e:
+                messagebox.showerror("Invalid Settings", str(e), parent=dialog)
+                return None
+            flagged = self.flagged_mask() if flagged_only.get() else None
+            return preview(self.current_csv, operation, selection_mask(self.current_csv.shape, rows, cols, flagged))
+
+        def show_preview():
+            edit = build_edit()
+            if edit is None:
+                return
+            preview_text.delete(1.0, tk.END)
+            preview_text.insert(tk.END, f"{edit.description}: {len(edit.rows)} cell(s) change\n\n")
+            for r, c, old, new in list(zip(edit.rows, edit.cols, edit.old, edit.new))[:200]:
+                preview_text.insert(tk.END, f"Row {r + 1}, Col {c + 1}: {old} -> {new}\n")
+
+        def apply():
+            edit = build_edit()
+            if edit is None:
+                return
+            self.apply_bulk_edit(edit)
+            dialog.destroy()
+            messagebox.showinfo("Bulk Edit", f"{edit.description}: {len(edit.rows)} cell(s) changed.")
+
+        buttons = tk.Frame(dialog)
+        buttons.grid(row=6, column=0, columnspan=2, pady=5)
+        tk.Button(buttons, text="Preview", command=show_preview, width=10).pack(side="left", padx=5)
+        tk.Button(buttons, text="Apply", command=apply, width=10).pack(side="left", padx=5)
+
+    def select_profile_file(self):
+        """
+        Picks a named validation profile and stores a copy alongside the current table.
+        """
+        filepath = filedialog.askopenfilename(
+            initialdir="profiles",
+            title="Select Validation Profile",
+            filetypes=(("Profile Files", "*.json"),)
+        )
+        if not filepath:
+            return
+        try:
+            profile = load_profile(filepath)
+        except (ValueError, OSError) as e:
+            messagebox.showerror("Invalid Profile", f"Could not load profile: {e}")
+            return
+        profile.setdefault("name", os.path.splitext(os.path.basename(filepath))[0])
+        self.profile = profile
+        self.profile_label.config(text=f"Profile: {profile['name']}")
+        if self.csv_path:
+            save_profile(profile, profile_path_for(self.csv_path))
+        if self.current_csv is not None:
+            self.refresh_validation(force=True)
+
+    def run_cross_table_check(self):
+        """
+        Checks every CSV next to the current one (max vs min, duplicate years, impossible days)
+        and queues the findings that belong to the loaded table.
+        """
+        if self.current_csv is None:
+            messagebox.showerror("Error", "Load a CSV first.")
+            return
+        findings = check_folder(os.path.dirname(self.csv_path))
+        here = os.path.abspath(self.csv_path)
+        self.findings = sorted(
+            (f for f in findings if os.path.abspath(f.csv_path) == here),
+            key=lambda f: (f.row, f.col)
+        )
+        self.finding_idx = 0
+        others = len(findings) - len(self.findings)
+        summary = f"{len(self.findings)} finding(s) in this table"
+        if others:
+            summary += f", {others} in other tables of this folder"
+        messagebox.showinfo("Cross-Table Check", summary + ".")
+        if self.findings:
+            self.goto_next_finding()
+        else:
+            self.finding_label.config(text="")
+
+    def goto_next_finding(self):
+        """
+        Jumps to the next cross-table finding and shows its message.
+        """
+        if not self.findings:
+            self.finding_label.config(text="No findings")
+            return
+        finding = self.findings[self.finding_idx % len(self.findings)]
+        self.finding_idx += 1
+        if finding.row >= len(self.current_csv) or finding.col >= self.current_csv.shape[1]:
+            return
+        self.row_idx = finding.row
+        self.col_idx = finding.col
+        self.load_cell(self.current_csv.iat[finding.row, finding.col])
+        self.finding_label.config(text=finding.message)
+
+    def reocr_flagged_cells(self):
+        """
+        Sends every invalid or outlier cell back to Vision, packed onto a few mosaic
+        canvases instead of one request per cell, and puts the new text in the sheet.
+        """
+        if self.current_csv is None:
+            messagebox.showerror("Error", "Load a CSV first.")
+            return
+        mask = self.flagged_mask()
+        flagged = [tuple(p) for p in np.argwhere(mask).tolist()]
+        if not flagged:
+            messagebox.showinfo("Re-OCR", "No flagged cells to re-OCR.")
+            return
+        if self.jobs.busy():
+            messagebox.showinfo("Re-OCR", "A re-OCR is already running.")
+            return
+        if not messagebox.askyesno("Confirm Action", f"Re-OCR {len(flagged)} flagged cell(s)?"):
+            return
+
+        from mosaic import ocr_cells_mosaic
+        from ocr_processor import _get_vision_client
+        client = _get_vision_client()
+        if client is None:
+            messagebox.showerror("Error", "Google Cloud Vision credentials not found.")
+            return
+        # Cells without an image (streamed without writing cells) can't be re-read
+        cells = [((r, c), find_cell_image(self.table_path, r, c)) for r, c in flagged]
+        cells = [(cell, path) for cell, path in cells if path]
+        frame = self.current_csv
+
+        def done(texts):
+            # Drop the results if another CSV was loaded while the job ran
+            if self.current_csv is not frame:
+                return
+            for (r, c), text in texts.items():
+                self.current_csv.iat[r, c] = text.strip()
+            self.refresh_validation(force=True)
+            self.find_outliers()
+            self.update_csv_display()
+            self.finding_label.config(text="")
+            messagebox.showinfo("Re-OCR", f"Re-OCR'd {len(texts)} cell(s).")
+
+        def failed(e):
+            self.finding_label.config(text="")
+            messagebox.showerror("Re-OCR", f"Re-OCR failed: {e}")
+
+        self.jobs.submit(
+            "Re-OCR",
+            lambda progress, cancel: ocr_cells_mosaic(cells, client, progress=progress, cancel=cancel),
+            on_done=done,
+            on_error=failed,
+            on_cancel=lambda: self.finding_label.config(text=""),
+        )
+        self.finding_label.config(text=f"Re-OCR: 0/{len(cells)} cells")
+
+    def show_job_progress(self, job):
+        self.finding_label.config(text=f"{job.name}: {format_progress(job.done, job.total, job.elapsed())}")
 
     def handle_enter_key(self, event):
         self.confirm_cell()
@@ -358,4 +909,5 @@ class OCRCheckerGUI:
 if __name__ == "__main__":
     root = tk.Tk()
     app = OCRCheckerGUI(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
+    app.close_scan()
\ No newline at end of file
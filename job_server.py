@@ -0,0 +1,484 @@
+import os
+import sys
+import json
+import time
+import uuid
+import hashlib
+import argparse
+import threading
+import urllib.request
+import urllib.error
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from jobs import JobCancelled, check_cancel
+from metrics import RunMetrics
+from payload import encode_for_upload, sharpen_image
+from scan_io import FullResImage
+from segmentation import load_grid, save_ocr_grid, cell_box
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 8
+
+# Vision requests per second shared by every operator using the server
+DEFAULT_RATE = 10.0
+
+# Tables cropped at the same time; their cells share the OCR worker pool
+MAX_ACTIVE_TABLES = 2
+
+# Finished jobs kept for status and result requests; older ones are dropped as new jobs arrive
+MAX_FINISHED_JOBS = 200
+
+# OCR results kept in the shared cache, least recently used dropped first
+MAX_CACHED_RESULTS = 100000
+
+
+class RateLimiter:
+
+    """
+    Token bucket shared by all OCR workers: at most rate requests per second on average,
+    with bursts of up to burst requests. rate None disables the limit.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(rate or 1, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class VisionBackend:
+
+    """
+    Sends cell uploads to Google Cloud Vision with the server's credentials.
+    """
+
+    def __init__(self):
+        from ocr_processor import _get_vision_client
+        self.client = _get_vision_client()
+        if self.client is None:
+            raise RuntimeError("Google Cloud Vision credentials not found.")
+
+    def detect(self, content, metrics=None):
+        from ocr_processor import detect_text
+        return detect_text(content, self.client, metrics)
+
+
+class FakeOCRBackend:
+
+    """
+    Offline stand-in for Vision. Each upload is decoded and answered with text_for(gray_image),
+    by default the crop's mean gray level, so identical crops always get identical text.
+    """
+
+    def __init__(self, text_for=None, latency=0.0):
+        self.text_for = text_for or (lambda gray: str(int(gray.mean())))
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def detect(self, content, metrics=None):
+        with self._lock:
+            self.calls += 1
+        if metrics is not None:
+            metrics.count("api_calls")
+            metrics.count("bytes_uploaded", len(content))
+        if self.latency:
+            time.sleep(self.latency)
+        gray = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_GRAYSCALE)
+        return self.text_for(gray)
+
+
+class JobRecord:
+    def __init__(self, job_id, spec):
+        self.id = job_id
+        self.spec = spec
+        self.status = "queued"
+        self.done = 0
+        self.total = 0
+        self.rows = None
+        self.error = None
+        self.submitted = time.time()
+        self.finished = None
+        self.cancel_event = threading.Event()
+        self.metrics = RunMetrics(f"job:{spec.get('table', '')}")
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "table": self.spec.get("table", ""),
+            "status": self.status,
+            "done": self.done,
+            "total": self.total,
+            "error": self.error,
+            "submitted": self.submitted,
+            "finished": self.finished,
+            "metrics": self.metrics.to_dict(),
+        }
+
+
+class OCRJobService:
+
+    """
+    Queues table jobs (a scan plus its grid) and OCRs their cells on one shared worker pool,
+    behind a single rate limiter and a result cache keyed by the uploaded bytes.
+
+    A job spec is a dict with "table" and either "grid" (as saved in grid.json, with row_lines,
+    col_lines and rotation) or "table_path" (a segmented table folder holding grid.json).
+    "image_path" and "page" default to the grid's own; "upload_preset" to "raw".
+    Crops are sharpened before upload like segmented cells, unless "sharpen" is false.
+    Only the latest MAX_FINISHED_JOBS finished jobs and MAX_CACHED_RESULTS results are kept.
+    """
+
+    def __init__(self, backend, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE):
+        self.backend = backend
+        self.limiter = RateLimiter(rate)
+        self.metrics = RunMetrics("job_server")
+        self.cache = OrderedDict()
+        self._inflight = {}
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._cells = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr")
+        self._tables = ThreadPoolExecutor(max_workers=MAX_ACTIVE_TABLES, thread_name_prefix="table")
+
+    def submit(self, spec):
+        """Validates a job spec, queues it and returns its record."""
+        grid = spec.get("grid") or (load_grid(spec["table_path"]) if spec.get("table_path") else None)
+        if grid is None:
+            raise ValueError("Job needs a 'grid' or a 'table_path' with grid.json")
+        spec = dict(spec, grid=grid)
+        spec.setdefault("image_path", grid.get("image_path"))
+        spec.setdefault("page", grid.get("page"))
+        if not spec["image_path"]:
+            raise ValueError("Job needs an 'image_path'")
+
+        job = JobRecord(uuid.uuid4().hex[:12], spec)
+        with self._lock:
+            self._evict_finished()
+            self.jobs[job.id] = job
+        self._tables.submit(self._run, job)
+        return job
+
+    def _evict_finished(self):
+        # Called with the lock held
+        finished = sorted((job for job in self.jobs.values() if job.finished is not None), key=lambda job: job.finished)
+        for job in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self.jobs[job.id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None and job.status in ("queued", "running"):
+            job.cancel_event.set()
+        return job
+
+    def stats(self):
+        stats = self.metrics.to_dict()
+        stats["cached_results"] = len(self.cache)
+        return stats
+
+    def shutdown(self):
+        for job in list(self.jobs.values()):
+            job.cancel_event.set()
+        self._tables.shutdown(wait=True)
+        self._cells.shutdown(wait=True)
+
+    def _ocr(self, content, job):
+        check_cancel(job.cancel_event)
+        if content is None:
+            job.metrics.count("blank_cells_skipped")
+            return ""
+        key = hashlib.sha256(content).hexdigest()
+        while True:
+            with self._lock:
+                if key in self.cache:
+                    self.cache.move_to_end(key)
+                    self.metrics.count("cache_hits")
+                    job.metrics.count("cache_hits")
+                    return self.cache[key]
+                pending = self._inflight.get(key)
+                if pending is None:
+                    # This worker sends the request; identical uploads wait for its answer
+                    pending = self._inflight[key] = threading.Event()
+                    break
+            pending.wait()
+
+        try:
+            self.limiter.acquire()
+            check_cancel(job.cancel_event)
+            with self.metrics.stage("ocr"):
+                text = self.backend.detect(content, self.metrics)
+            job.metrics.count("api_calls")
+            job.metrics.count("bytes_uploaded", len(content))
+            with self._lock:
+                self.cache[key] = text
+                if len(self.cache) > MAX_CACHED_RESULTS:
+                    self.cache.popitem(last=False)
+            return text
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            pending.set()
+
+    def _run(self, job):
+        try:
+            check_cancel(job.cancel_event)
+            job.status = "running"
+            grid = job.spec["grid"]
+            n_rows, n_cols = len(grid["row_lines"]) - 1, len(grid["col_lines"]) - 1
+            job.total = n_rows * n_cols
+            preset = job.spec.get("upload_preset", "raw")
+            sharpen = job.spec.get("sharpen", True)
+
+            futures = []
+            with job.metrics.stage("crop"), FullResImage(job.spec["image_path"], page=job.spec["page"]) as full:
+                for r in range(n_rows):
+                    for c in range(n_cols):
+                        check_cancel(job.cancel_event)
+                        crop = full.rotated_crop(cell_box(grid, r, c), grid.get("rotation", 0))
+                        if sharpen:
+                            with job.metrics.stage("sharpen_filter"):
+                                crop = sharpen_image(crop)
+                        with job.metrics.stage("encode_upload"):
+                            content = encode_for_upload(crop, preset)
+                        job.metrics.count("images_encoded")
+                        futures.append(self._cells.submit(self._ocr, content, job))
+
+            texts = []
+            for future in futures:
+                texts.append(future.result())
+                job.done = len(texts)
+            job.rows = [texts[r * n_cols:(r + 1) * n_cols] for r in range(n_rows)]
+            job.status = "done"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished = time.time()
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    """
+    POST   /jobs             submit a job spec (JSON), returns {"id": ...}
+    GET    /jobs             status of every job
+    GET    /jobs/<id>        status of one job
+    GET    /jobs/<id>/result OCR text as {"rows": [[...], ...]} once the job is done
+    DELETE /jobs/<id>        cancel a job
+    GET    /stats            API calls, cache hits and timings of the server
+    """
+
+    service = None
+
+    def log_message(self, fmt, *args):
+        pass  # Keep the console for job output
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job_or_404(self, job_id):
+        job = self.service.get(job_id)
+        if job is None:
+            self._send(404, {"error": f"No job {job_id}"})
+        return job
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            return self._send(404, {"error": "Not found"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            job = self.service.submit(json.loads(self.rfile.read(length) or b"{}"))
+        except (ValueError, KeyError, OSError) as e:
+            return self._send(400, {"error": str(e)})
+        self._send(202, job.to_dict())
+
+    def do_GET(self):
+        parts = [p for p in self.path.split("/") if p]
+        if parts == ["jobs"]:
+            return self._send(200, {"jobs": self.service.list()})
+        if parts == ["stats"]:
+            return self._send(200, self.service.stats())
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self._job_or_404(parts[1])
+            if job is None:
+                return
+            if len(parts) == 2:
+                return self._send(200, job.to_dict())
+            if parts[2] == "result":
+                if job.status != "done":
+                    return self._send(409, {"error": f"Job is {job.status}", "status": job.status})
+                return self._send(200, {"id": job.id, "rows": job.rows})
+        self._send(404, {"error": "Not found"})
+
+    def do_DELETE(self):
+        parts = [p for p in self.path.split("/") if p]
+        if len(parts) != 2 or parts[0] != "jobs":
+            return self._send(404, {"error": "Not found"})
+        job = self._job_or_404(parts[1])
+        if job is not None:
+            self.service.cancel(job.id)
+            self._send(200, job.to_dict())
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+
+    """
+    Returns a ThreadingHTTPServer exposing the service. Port 0 picks a free port
+    (see server.server_address). Call serve_forever() to start handling requests.
+    """
+
+    handler = type("JobHandler", (_Handler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+class JobClient:
+
+    """
+    Talks to a running job server, e.g. JobClient("http://127.0.0.1:8765").
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def _request(self, method, path, body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req) as resp:
+                return json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            detail = json.loads(e.read() or b"{}").get("error", e.reason)
+            raise RuntimeError(f"Job server returned {e.code}: {detail}") from None
+
+    def submit(self, spec):
+        return self._request("POST", "/jobs", spec)["id"]
+
+    def status(self, job_id):
+        return self._request("GET", f"/jobs/{job_id}")
+
+    def result(self, job_id):
+        return self._request("GET", f"/jobs/{job_id}/result")["rows"]
+
+    def cancel(self, job_id):
+        return self._request("DELETE", f"/jobs/{job_id}")
+
+    def stats(self):
+        return self._request("GET", "/stats")
+
+    def wait(self, job_id, poll_interval=1.0, progress=None, cancel=None):
+        """Polls until the job ends and returns its rows. Setting cancel cancels it on the server."""
+        while True:
+            if cancel is not None and cancel.is_set():
+                self.cancel(job_id)
+                raise JobCancelled()
+            status = self.status(job_id)
+            if progress and status["total"]:
+                progress(status["done"], status["total"])
+            if status["status"] == "done":
+                return self.result(job_id)
+            if status["status"] == "cancelled":
+                raise JobCancelled()
+            if status["status"] == "failed":
+                raise RuntimeError(f"OCR job failed on the server: {status['error']}")
+            time.sleep(poll_interval)
+
+
+def run_table_on_server(server_url, table_path, csv_output_folder, table, upload_preset="raw",
+                        progress=None, cancel=None):
+
+    """
+    Sends a segmented table (its grid.json and source scan) to the job server, waits for the
+    result and writes it as a headerless CSV like run_ocr_on_table. Returns the CSV path.
+    The job's counters and timings from the server are written to <table>.metrics.json, and the
+    grid is recorded in ocr_grid.json so a later incremental run compares against it.
+    """
+
+    metrics = RunMetrics(f"ocr:{table}")
+    # Send the grid itself so the one recorded below is exactly the one the server OCR'd
+    grid = load_grid(table_path)
+    if grid is None:
+        raise ValueError(f"No grid.json in {table_path}; segment the table first")
+    client = JobClient(server_url)
+    job_id = client.submit({"table": table, "table_path": os.path.abspath(table_path), "grid": grid,
+                            "upload_preset": upload_preset})
+    with metrics.stage("server_job"):
+        rows = client.wait(job_id, progress=progress, cancel=cancel)
+    server = client.status(job_id)["metrics"]
+    for name, n in server["counters"].items():
+        metrics.count(name, n)
+    for name, stage in server["stages"].items():
+        metrics.add_time(f"server_{name}", stage["seconds"])
+
+    os.makedirs(csv_output_folder, exist_ok=True)
+    csv_path = os.path.join(csv_output_folder, f"{table}.csv")
+    with metrics.stage("write_csv"):
+        pd.DataFrame(rows).to_csv(csv_path, index=False, header=False)
+    metrics.count("bytes_written", os.path.getsize(csv_path))
+    save_ocr_grid(table_path, grid)
+    print(f"✅ OCR finished on the job server and saved: {csv_path}")
+    metrics_path = metrics.write_json(os.path.join(csv_output_folder, f"{table}.metrics.json"))
+    print(f"📊 Run metrics saved: {metrics_path}")
+    return csv_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared OCR job server for several operators.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="OCR requests in flight at once")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="Vision requests per second across all jobs")
+    parser.add_argument("--fake", action="store_true", help="Answer with the offline fake backend instead of Vision")
+    args = parser.parse_args(argv)
+
+    service = OCRJobService(FakeOCRBackend() if args.fake else VisionBackend(),
+                            workers=args.workers, rate=args.rate)
+    server = make_server(service, args.host, args.port)
+    print(f"🚀 OCR job server listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import time
+import queue
+import threading
+from collections import deque
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when the operator cancels it."""
+
+
+def check_cancel(cancel):
+
+    """
+    Stops the running job if its cancel event has been set. Safe to call with cancel None.
+    """
+
+    if cancel is not None and cancel.is_set():
+        raise JobCancelled()
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds}s"
+
+
+def format_progress(done, total, elapsed, unit="cells"):
+
+    """
+    Returns a status line such as "120/992 cells - 4.1 cells/s - ETA 3m 32s".
+    """
+
+    text = f"{done}/{total} {unit}"
+    if done and elapsed > 0:
+        rate = done / elapsed
+        text += f" - {rate:.1f} {unit}/s"
+        if total > done:
+            text += f" - ETA {format_duration((total - done) / rate)}"
+    return text
+
+
+class Job:
+
+    """
+    One queued unit of background work. func is called as func(progress=..., cancel=...)
+    on the worker thread; progress(done, total) reports how far it got and cancel is a
+    threading.Event it should check between items.
+    """
+
+    def __init__(self, name, func, on_done=None, on_error=None, on_cancel=None):
+        self.name = name
+        self.func = func
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_cancel = on_cancel
+        self.cancel_event = threading.Event()
+        self.finished = threading.Event()
+        self.started = None
+        self.done = 0
+        self.total = 0
+
+    def elapsed(self):
+        return time.perf_counter() - self.started if self.started else 0.0
+
+
+class JobRunner:
+
+    """
+    Runs jobs one after another on a background thread so the Tk mainloop never blocks.
+    Progress and results are handed back through a queue that the UI thread drains with
+    root.after, so callbacks always run on the UI thread and may touch widgets.
+    """
+
+    def __init__(self, root, on_progress=None, poll_ms=100):
+        self.root = root
+        self.on_progress = on_progress
+        self.poll_ms = poll_ms
+        self.current = None
+        self._pending = deque()
+        self._events = queue.Queue()
+        self._lock = threading.Lock()
+        self._running = False
+        self._polling = False
+
+    def submit(self, name, func, on_done=None, on_error=None, on_cancel=None):
+        """Queues a job behind any running one and returns it."""
+        job = Job(name, func, on_done, on_error, on_cancel)
+        with self._lock:
+            self._pending.append(job)
+            if not self._running:
+                self._running = True
+                threading.Thread(target=self._work, daemon=True).start()
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_ms, self.poll)
+        return job
+
+    def queued(self):
+        """Returns the names of jobs waiting behind the current one."""
+        with self._lock:
+            return [job.name for job in self._pending]
+
+    def busy(self):
+        with self._lock:
+            return self._running
+
+    def cancel(self):
+        """Cancels the running job and drops every queued one."""
+        with self._lock:
+            dropped = list(self._pending)
+            self._pending.clear()
+            current = self.current
+        if current is not None:
+            current.cancel_event.set()
+        for job in dropped:
+            job.cancel_event.set()
+            job.finished.set()
+            self._events.put(("cancelled", job, None))
+
+    def _work(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self.current = None
+                    self._running = False
+                    return
+                job = self._pending.popleft()
+                self.current = job
+
+            job.started = time.perf_counter()
+
+            def progress(done, total, job=job):
+                job.done, job.total = done, total
+                self._events.put(("progress", job, None))
+
+            try:
+                result = job.func(progress=progress, cancel=job.cancel_event)
+                event = ("done", job, result)
+            except JobCancelled:
+                event = ("cancelled", job, None)
+            except Exception as e:
+                event = ("error", job, e)
+            self._events.put(event)
+            job.finished.set()
+
+    def poll(self):
+        """Delivers queued job events on the UI thread and reschedules itself while work remains."""
+        latest = None
+        while True:
+            try:
+                kind, job, value = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                latest = job  # Only the newest progress update is worth drawing
+                continue
+            if latest is job:
+                latest = None
+            if kind == "done" and job.on_done is not None:
+                job.on_done(value)
+            elif kind == "error" and job.on_error is not None:
+                job.on_error(value)
+            elif kind == "cancelled" and job.on_cancel is not None:
+                job.on_cancel()
+        if latest is not None and self.on_progress is not None:
+            self.on_progress(latest)
+
+        if self.busy() or not self._events.empty():
+            self.root.after(self.poll_ms, self.poll)
+        else:
+            self._polling = False
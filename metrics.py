@@ -0,0 +1,91 @@
+import os
+import json
+import time
+import cProfile
+import threading
+from contextlib import contextmanager
+
+# Google Cloud Vision TEXT_DETECTION list price per 1000 images (beyond the monthly free tier)
+VISION_COST_PER_1000 = 1.50
+
+SEGMENTATION_METRICS_FILE = "segmentation_metrics.json"
+
+# Counters every run reports, even when they stay at zero
+COUNTERS = (
+    "images_decoded", "images_encoded", "bytes_read", "bytes_written",
+    "api_calls", "bytes_uploaded", "retries",
+)
+
+
+class RunMetrics:
+
+    """
+    Timers and counters for one pipeline run (a segmentation or an OCR pass over a table).
+    Safe to update from worker threads.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.stages = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """Times the enclosed block and adds it to the stage's total."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            stage = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+            stage["seconds"] += seconds
+            stage["calls"] += 1
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "run": self.name,
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                "wall_seconds": round(time.time() - self.started, 3),
+                "stages": {k: {"seconds": round(v["seconds"], 4), "calls": v["calls"]} for k, v in self.stages.items()},
+                "counters": dict(self.counters),
+                "estimated_api_cost_usd": round(self.counters.get("api_calls", 0) * VISION_COST_PER_1000 / 1000, 4),
+            }
+
+    def write_json(self, path):
+        """Writes the metrics next to the run's output and returns the path."""
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return path
+
+
+@contextmanager
+def profile_to(path):
+
+    """
+    Runs the enclosed block under cProfile and dumps the stats to path (view with pstats or snakeviz).
+    With path None the block runs unprofiled.
+    """
+
+    if path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
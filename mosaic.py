@@ -0,0 +1,173 @@
+import cv2
+import numpy as np
+
+from metrics import RunMetrics
+from payload import UPLOAD_PRESETS, prepare_for_upload
+from ocr_processor import annotate_image
+from jobs import check_cancel
+
+# Canvas limits for one mosaic request. Vision accepts much larger images, but small canvases
+# keep each request quick and limit the damage of a failed call.
+MOSAIC_MAX_WIDTH = 2048
+MOSAIC_MAX_HEIGHT = 2048
+MOSAIC_MAX_CELLS = 120
+
+# White space left between cells so Vision never joins strokes from neighbouring cells
+MOSAIC_GUTTER = 40
+
+
+def plan_mosaics(sizes, max_width=MOSAIC_MAX_WIDTH, max_height=MOSAIC_MAX_HEIGHT,
+                 max_cells=MOSAIC_MAX_CELLS, gutter=MOSAIC_GUTTER):
+
+    """
+    Packs cells of the given (height, width) sizes onto shelves, left to right in the order given.
+    Returns a list of canvases, each a (canvas_height, canvas_width, [(index, x, y)]) tuple.
+    """
+
+    canvases = []
+    placed, x, y, shelf_h, canvas_w = [], gutter, gutter, 0, 0
+    for i, (h, w) in enumerate(sizes):
+        if x > gutter and x + w + gutter > max_width:
+            x, y, shelf_h = gutter, y + shelf_h + gutter, 0
+        if placed and (y + h + gutter > max_height or len(placed) >= max_cells):
+            canvases.append((y + shelf_h + gutter, canvas_w, placed))
+            placed, x, y, shelf_h, canvas_w = [], gutter, gutter, 0, 0
+        placed.append((i, x, y))
+        x += w + gutter
+        shelf_h = max(shelf_h, h)
+        canvas_w = max(canvas_w, x)
+    if placed:
+        canvases.append((y + shelf_h + gutter, canvas_w, placed))
+    return canvases
+
+
+def fit_to_canvas(img, max_width=MOSAIC_MAX_WIDTH, max_height=MOSAIC_MAX_HEIGHT, gutter=MOSAIC_GUTTER):
+
+    """
+    Shrinks a cell image that would not fit on an empty canvas inside the gutters,
+    keeping its aspect ratio, so no canvas grows past the limits. Smaller cells are returned as is.
+    """
+
+    h, w = img.shape[:2]
+    scale = min((max_width - 2 * gutter) / w, (max_height - 2 * gutter) / h)
+    if scale >= 1:
+        return img
+    return cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+def build_mosaic(images, placement, height, width):
+
+    """
+    Pastes cell images onto a white canvas at their planned offsets.
+    Returns the canvas and the offset map {index: (x, y, w, h)}.
+    """
+
+    canvas = np.full((height, width, 3), 255, dtype=np.uint8)
+    offsets = {}
+    for i, x, y in placement:
+        img = images[i]
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        h, w = img.shape[:2]
+        canvas[y:y+h, x:x+w] = img
+        offsets[i] = (x, y, w, h)
+    return canvas, offsets
+
+
+def _word_boxes(annotations):
+    # The first annotation is the full text of the canvas; the rest are single words
+    words = []
+    for ann in annotations[1:]:
+        vertices = ann.bounding_poly.vertices
+        xs = [v.x for v in vertices]
+        ys = [v.y for v in vertices]
+        words.append((ann.description, min(xs), min(ys), max(xs), max(ys)))
+    return words
+
+
+def split_annotations(annotations, offsets):
+
+    """
+    Assigns each detected word to the cell whose rectangle is nearest its centre, then rebuilds
+    each cell's text line by line. Returns {index: text}; cells without words get "".
+    """
+
+    keys = list(offsets)
+    texts = {key: "" for key in keys}
+    words = _word_boxes(annotations)
+    if not words or not keys:
+        return texts
+
+    rects = np.array([offsets[k] for k in keys], dtype=float)
+    x0, y0 = rects[:, 0], rects[:, 1]
+    x1, y1 = x0 + rects[:, 2], y0 + rects[:, 3]
+    boxes = np.array([w[1:] for w in words], dtype=float)
+    cx = (boxes[:, 0] + boxes[:, 2]) / 2
+    cy = (boxes[:, 1] + boxes[:, 3]) / 2
+
+    # Distance from every word centre to every cell rectangle (0 inside)
+    dx = np.maximum(np.maximum(x0[None, :] - cx[:, None], 0), cx[:, None] - x1[None, :])
+    dy = np.maximum(np.maximum(y0[None, :] - cy[:, None], 0), cy[:, None] - y1[None, :])
+    owner = np.argmin(np.hypot(dx, dy), axis=1)
+
+    per_cell = {}
+    for w, (desc, bx0, by0, bx1, by1) in enumerate(words):
+        per_cell.setdefault(keys[owner[w]], []).append((cy[w], bx0, by1 - by0, desc))
+    for key, cell_words in per_cell.items():
+        cell_words.sort()
+        lines, current, line_y = [], [], None
+        for wy, wx, wh, desc in cell_words:
+            if line_y is not None and wy - line_y > max(wh, 1) * 0.6:
+                lines.append(current)
+                current = []
+            if not current:
+                line_y = wy
+            current.append((wx, desc))
+        lines.append(current)
+        texts[key] = "\n".join(" ".join(d for _, d in sorted(line)) for line in lines).strip()
+    return texts
+
+
+def ocr_cells_mosaic(cells, client, metrics=None, preset="raw", progress=None, cancel=None, **limits):
+
+    """
+    OCRs any subset of cells by packing them onto composite canvases, one Vision request per
+    canvas instead of one per cell. cells is a list of (key, image_path), e.g. ((row, col), path).
+    Returns {key: text}. Extra keyword arguments override the canvas limits of plan_mosaics.
+    Cells too large for a canvas on their own are scaled down to fit.
+    progress(done, total) is called after each canvas; the cancel event is checked between canvases.
+    """
+
+    metrics = metrics or RunMetrics("mosaic")
+    keys, images = [], []
+    results = {}
+    for key, path in cells:
+        check_cancel(cancel)
+        img = cv2.imread(path)
+        if img is None:
+            results[key] = ""
+            continue
+        metrics.count("images_decoded")
+        if UPLOAD_PRESETS.get(preset) is not None:
+            img = prepare_for_upload(img, preset)
+            if img is None:
+                metrics.count("blank_cells_skipped")
+                results[key] = ""
+                continue
+        keys.append(key)
+        images.append(fit_to_canvas(img, **{k: v for k, v in limits.items() if k != "max_cells"}))
+
+    sizes = [img.shape[:2] for img in images]
+    for height, width, placement in plan_mosaics(sizes, **limits):
+        check_cancel(cancel)
+        with metrics.stage("mosaic_build"):
+            canvas, offsets = build_mosaic(images, placement, height, width)
+            ok, buf = cv2.imencode(".png", canvas, [cv2.IMWRITE_PNG_COMPRESSION, 9])
+        metrics.count("images_encoded")
+        annotations = annotate_image(buf.tobytes(), client, metrics)
+        metrics.count("mosaic_cells", len(placement))
+        for i, text in split_annotations(annotations, offsets).items():
+            results[keys[i]] = text
+        if progress:
+            progress(len(results), len(cells))
+    return results
@@ -1,7 +1,25 @@
 import os
+import time
 import pandas as pd
 from google.cloud import vision
 from google.auth.exceptions import DefaultCredentialsError
+from google.api_core import exceptions as api_exceptions
+
+from metrics import RunMetrics, profile_to
+from payload import UPLOAD_PRESETS, encode_file_for_upload
+from dedup import cluster_cells, dedup_path_for, save_shared_cells
+from jobs import check_cancel
+from pages import source_bytes
+from segmentation import load_grid, load_ocr_grid, save_ocr_grid, diff_grids, CELL_EXTENSIONS
+
+# Transient Vision API failures worth retrying before giving up on a cell
+RETRYABLE_ERRORS = (
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.DeadlineExceeded,
+    api_exceptions.InternalServerError,
+    api_exceptions.TooManyRequests,
+)
+MAX_RETRIES = 3
 
 # Lazily create the Vision client so importing this module doesn't require credentials
 
@@ -31,44 +49,207 @@ def _get_vision_client():
         return None
 
 
-def process_image(image_path, client):
-    with open(image_path, "rb") as f:
-        content = f.read()
+def process_image(image_path, client, metrics=None, preset="raw"):
+    metrics = metrics or RunMetrics("process_image")
+    metrics.count("bytes_read", source_bytes(image_path))
+    # The upload preset shrinks the payload (grayscale, trimmed, capped resolution) before sending
+    with metrics.stage("read_cell" if UPLOAD_PRESETS.get(preset) is None else "encode_upload"):
+        content = encode_file_for_upload(image_path, preset)
+    if UPLOAD_PRESETS.get(preset) is not None:
+        metrics.count("images_decoded")
+        if content is None:
+            metrics.count("blank_cells_skipped")
+            return ""
+        metrics.count("images_encoded")
+    return detect_text(content, client, metrics)
+
+
+def detect_text(content, client, metrics=None):
+    """
+    Sends encoded image bytes to Vision text detection and returns the full detected text.
+    """
+    texts = annotate_image(content, client, metrics)
+    return texts[0].description.strip() if texts else ""
+
+
+def annotate_image(content, client, metrics=None):
+    """
+    Sends encoded image bytes to Vision text detection, retrying transient errors, and returns
+    the text annotations (the full text first, then one entry per word with its bounding box).
+    """
+    metrics = metrics or RunMetrics("annotate_image")
     image = vision.Image(content=content)
     image_context = vision.ImageContext(language_hints=["en"])
-    response = client.text_detection(image=image, image_context=image_context)
-    texts = response.text_annotations
-    return texts[0].description.strip() if texts else ""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            with metrics.stage("vision_request"):
+                metrics.count("api_calls")
+                metrics.count("bytes_uploaded", len(content))
+                response = client.text_detection(image=image, image_context=image_context)
+            break
+        except RETRYABLE_ERRORS:
+            if attempt == MAX_RETRIES:
+                raise
+            metrics.count("retries")
+            time.sleep(2 ** attempt)
+    return response.text_annotations
 
 
-def run_ocr_on_table(table_path, csv_output_folder, image_folder, table):
-    client = _get_vision_client()
-    if client is None:
-        raise RuntimeError(
-            "Google Cloud Vision credentials not found. Place your service account .json in the 'key' folder or set the GOOGLE_APPLICATION_CREDENTIALS environment variable."
-        )
+def list_cells(table_path):
 
-    data = []
+    """
+    Returns the segmented cell images of a table as rows of ((row, col), path), 0-based and
+    sorted numerically.
+    """
+
+    rows = []
     # Sort row folders numerically
     row_folders = sorted(
         [d for d in os.listdir(table_path) if d.startswith("row_") and os.path.isdir(os.path.join(table_path, d))],
         key=lambda x: int(x.split("_")[1])
     )
-    for row_folder in row_folders:
+    for r, row_folder in enumerate(row_folders):
         row_path = os.path.join(table_path, row_folder)
-        row_data = []
         # Sort col images numerically
         col_files = sorted(
-            [f for f in os.listdir(row_path) if f.startswith("col_") and f.lower().endswith(".png")],
+            [f for f in os.listdir(row_path) if f.startswith("col_") and f.lower().endswith(CELL_EXTENSIONS)],
             key=lambda x: int(x.split("_")[1].split(".")[0])
         )
-        for col_file in col_files:
-            col_path = os.path.join(row_path, col_file)
-            text = process_image(col_path, client)
-            row_data.append(text)
-        data.append(row_data)
+        rows.append([((r, c), os.path.join(row_path, col_file)) for c, col_file in enumerate(col_files)])
+    return rows
+
+
+def read_previous_csv(csv_path):
+
+    """
+    Returns a table's existing CSV as text (blank cells as ""), or None if there isn't one.
+    """
+
+    if not os.path.isfile(csv_path):
+        return None
+    try:
+        return pd.read_csv(csv_path, header=None, dtype=str, keep_default_na=False)
+    except pd.errors.EmptyDataError:
+        return None
+
+
+def run_ocr_on_table(table_path, csv_output_folder, image_folder, table, columnar_format=None, profile=False,
+                     upload_preset="raw", dedup_threshold=None, mosaic=False, incremental=False,
+                     progress=None, cancel=None):
+    """
+    OCRs every segmented cell of a table and writes the result as a headerless CSV.
+    With columnar_format set to "parquet" or "arrow", a columnar table holding the raw text,
+    parsed value, reviewed value and crop provenance of every cell is written alongside it.
+    Timings and counters for the run are written to <table>.metrics.json; with profile set,
+    a cProfile snapshot is written to <table>.prof as well.
+    upload_preset names an entry of payload.UPLOAD_PRESETS used to encode cells before upload.
+    With dedup_threshold set, cells whose perceptual hashes are within that many bits of an
+    earlier cell reuse its result instead of making their own request; the shared cells are
+    listed in <table>.dedup.json for the checker.
+    With mosaic set, the cells are packed onto composite canvases and OCR'd a canvas at a time.
+    With incremental set, the grid is compared with the one the existing CSV was OCR'd from
+    (ocr_grid.json) and only cells whose crop box changed are sent; every other cell keeps
+    its value from the CSV, including corrections made in the checker.
+    progress(done, total) is called as cells are OCR'd; setting the cancel event stops the run
+    with jobs.JobCancelled before any output is written. Returns the CSV path.
+    """
     os.makedirs(csv_output_folder, exist_ok=True)
-    csv_filename = f"{table}.csv"
-    csv_path = os.path.join(csv_output_folder, csv_filename)
-    pd.DataFrame(data).to_csv(csv_path, index=False, header=False)
-    print(f"✅ OCR finished and saved: {csv_path}")
\ No newline at end of file
+    profile_path = os.path.join(csv_output_folder, f"{table}.prof") if profile else None
+    metrics = RunMetrics(f"ocr:{image_folder}/{table}")
+    with profile_to(profile_path):
+        csv_path = _run_ocr_on_table(table_path, csv_output_folder, table, columnar_format, metrics,
+                                     upload_preset, dedup_threshold, mosaic, incremental, progress, cancel)
+    metrics_path = metrics.write_json(os.path.join(csv_output_folder, f"{table}.metrics.json"))
+    print(f"📊 Run metrics saved: {metrics_path}")
+    return csv_path
+
+
+def _run_ocr_on_table(table_path, csv_output_folder, table, columnar_format, metrics, upload_preset,
+                      dedup_threshold, mosaic, incremental, progress, cancel):
+    client = _get_vision_client()
+    if client is None:
+        raise RuntimeError(
+            "Google Cloud Vision credentials not found. Place your service account .json in the 'key' folder or set the GOOGLE_APPLICATION_CREDENTIALS environment variable."
+        )
+
+    rows = list_cells(table_path)
+    csv_path = os.path.join(csv_output_folder, f"{table}.csv")
+    grid = load_grid(table_path)
+    # Cells whose crop box is unchanged since the last run map to where they were in its CSV
+    unchanged, previous = {}, None
+    if incremental and grid is not None:
+        previous = read_previous_csv(csv_path)
+        if previous is not None:
+            unchanged = {
+                cell: old for cell, old in diff_grids(load_ocr_grid(table_path), grid).items()
+                if old[0] < previous.shape[0] and old[1] < previous.shape[1]
+            }
+    pending = [(cell, path) for row in rows for cell, path in row if cell not in unchanged]
+    metrics.count("cells_reused", sum(len(row) for row in rows) - len(pending))
+
+    shared = {}
+    if dedup_threshold is not None:
+        with metrics.stage("dedup_hash"):
+            shared = cluster_cells(pending, dedup_threshold)
+        metrics.count("images_decoded", len(pending))
+
+    # Only cluster representatives are sent; the other cells copy their text
+    to_ocr = [(cell, path) for cell, path in pending if shared.get(cell, cell) == cell]
+    if mosaic:
+        from mosaic import ocr_cells_mosaic
+        texts = ocr_cells_mosaic(to_ocr, client, metrics, upload_preset, progress=progress, cancel=cancel)
+    else:
+        texts = {}
+        for cell, path in to_ocr:
+            check_cancel(cancel)
+            texts[cell] = process_image(path, client, metrics, upload_preset)
+            if progress:
+                progress(len(texts), len(to_ocr))
+    check_cancel(cancel)
+
+    data = []
+    for row in rows:
+        row_data = []
+        for cell, _ in row:
+            if cell in unchanged:
+                row_data.append(previous.iat[unchanged[cell]])
+                continue
+            source = shared.get(cell, cell)
+            if source != cell:
+                metrics.count("dedup_reused")
+            row_data.append(texts[source])
+        data.append(row_data)
+    dedup_path = dedup_path_for(csv_path)
+    if shared:
+        save_shared_cells(dedup_path, shared, dedup_threshold)
+    elif os.path.exists(dedup_path):
+        os.remove(dedup_path)
+    with metrics.stage("write_csv"):
+        pd.DataFrame(data).to_csv(csv_path, index=False, header=False)
+    metrics.count("bytes_written", os.path.getsize(csv_path))
+    if grid is not None:
+        save_ocr_grid(table_path, grid)
+    if unchanged:
+        print(f"✅ OCR finished: {len(pending)} changed cell(s) re-read, {len(unchanged)} kept. Saved: {csv_path}")
+    else:
+        print(f"✅ OCR finished and saved: {csv_path}")
+    if columnar_format:
+        from columnar import build_table, write_table, columnar_path, read_table, to_grid_frame
+        out_path = columnar_path(csv_output_folder, table, columnar_format)
+        raw = data
+        if unchanged and os.path.isfile(out_path):
+            # Kept cells carry their original OCR text over; data holds their reviewed values
+            old_raw = to_grid_frame(read_table(out_path, memory_map=False), "raw_text")
+            raw = [
+                [
+                    old_raw.iat[unchanged[cell]] if cell in unchanged and unchanged[cell][0] < old_raw.shape[0]
+                    and unchanged[cell][1] < old_raw.shape[1] else text
+                    for (cell, _), text in zip(row, row_data)
+                ]
+                for row, row_data in zip(rows, data)
+            ]
+        with metrics.stage("write_columnar"):
+            write_table(build_table(raw, table_path, reviewed=data), out_path)
+        metrics.count("bytes_written", os.path.getsize(out_path))
+        print(f"✅ Columnar table saved: {out_path}")
+    return csv_path
\ No newline at end of file
@@ -0,0 +1,174 @@
+import os
+import cv2
+import numpy as np
+from PIL import Image
+
+# PyMuPDF is optional: without it PDFs can't be opened, multi-page TIFFs still work
+try:
+    import fitz
+except ImportError:
+    fitz = None
+
+# Folio scans at 600 dpi exceed Pillow's decompression-bomb guard; they are trusted local files
+Image.MAX_IMAGE_PIXELS = None
+
+# Resolution PDF pages are rendered at for segmentation and OCR
+PDF_DPI = 300
+
+MULTIPAGE_EXTENSIONS = (".tif", ".tiff", ".pdf")
+TABLE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".pdf")
+
+
+def is_pdf(path):
+    return path.lower().endswith(".pdf")
+
+
+def _open_pdf(path):
+    if fitz is None:
+        raise RuntimeError("Reading PDF files needs PyMuPDF. Install it with 'pip install pymupdf'.")
+    return fitz.open(path)
+
+
+def pil_to_bgr(im):
+
+    """
+    Converts a Pillow image of any mode to a 3-channel BGR array, as cv2.imread would return.
+    """
+
+    if im.mode not in ("RGB", "L"):
+        im = im.convert("RGB")
+    arr = np.asarray(im)
+    if arr.ndim == 2:
+        return cv2.cvtColor(arr, cv2.COLOR_GRAY2BGR)
+    return cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
+
+
+def page_count(path):
+
+    """
+    Returns the number of pages in a document. Single-page images count as one page.
+    """
+
+    if is_pdf(path):
+        with _open_pdf(path) as doc:
+            return doc.page_count
+    with Image.open(path) as im:
+        return getattr(im, "n_frames", 1)
+
+
+def page_size(path, index):
+
+    """
+    Returns (height, width) of one page in pixels without decoding its pixels.
+    """
+
+    if is_pdf(path):
+        with _open_pdf(path) as doc:
+            rect = doc.load_page(index).rect
+        zoom = PDF_DPI / 72
+        return int(round(rect.height * zoom)), int(round(rect.width * zoom))
+    with Image.open(path) as im:
+        im.seek(index)
+        width, height = im.size
+    return height, width
+
+
+def source_bytes(path, page=None):
+
+    """
+    Returns the bytes a table reads from its source for the bytes_read counter: the file
+    size of a single image, or the decoded size of one page of a multi-page document,
+    which would otherwise count the whole file once for every page.
+    """
+
+    if page is None:
+        return os.path.getsize(path)
+    height, width = page_size(path, page)
+    return height * width * 3
+
+
+def read_page(path, index, max_side=None):
+
+    """
+    Decodes a single page of a multi-page TIFF or PDF as a BGR array.
+    Only that page is read from the file. With max_side set the page is decoded
+    (PDF) or reduced (TIFF) so its longest side fits.
+    """
+
+    if is_pdf(path):
+        with _open_pdf(path) as doc:
+            page = doc.load_page(index)
+            zoom = PDF_DPI / 72
+            if max_side:
+                zoom = min(zoom, max_side / max(page.rect.width, page.rect.height))
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            arr = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+            return cv2.cvtColor(arr, cv2.COLOR_RGB2BGR if pix.n == 3 else cv2.COLOR_GRAY2BGR)
+
+    with Image.open(path) as im:
+        im.seek(index)
+        if max_side:
+            im.thumbnail((max_side, max_side))
+        return pil_to_bgr(im)
+
+
+def iter_pdf_bands(path, index, band_height):
+
+    """
+    Renders one PDF page at PDF_DPI as horizontal BGR bands of band_height rows,
+    yielding (y, band) so a full-resolution page never has to be held in memory at once.
+    """
+
+    with _open_pdf(path) as doc:
+        page = doc.load_page(index)
+        zoom = PDF_DPI / 72
+        matrix = fitz.Matrix(zoom, zoom)
+        height = int(round(page.rect.height * zoom))
+        for y0 in range(0, height, band_height):
+            clip = fitz.Rect(page.rect.x0, page.rect.y0 + y0 / zoom, page.rect.x1, page.rect.y0 + min(y0 + band_height, height) / zoom)
+            pix = page.get_pixmap(matrix=matrix, clip=clip, alpha=False)
+            arr = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+            yield y0, cv2.cvtColor(arr, cv2.COLOR_RGB2BGR if pix.n == 3 else cv2.COLOR_GRAY2BGR)
+
+
+def iter_pages(path, max_side=None):
+
+    """
+    Yields (index, page) for every page of a document, decoding one page at a time
+    so the whole document is never held in memory.
+    """
+
+    for index in range(page_count(path)):
+        yield index, read_page(path, index, max_side)
+
+
+def page_table_name(doc_name, index):
+
+    """
+    Returns the table name of one page of a document, e.g. ledger.tiff page 3 -> ledger.tiff_page_3.
+    Output for that page goes to OUTPUT_ROOT/<folder>/<table name>.
+    """
+
+    return f"{doc_name}_page_{index + 1}"
+
+
+def list_tables(input_root, folder):
+
+    """
+    Lists every table under INPUT_ROOT/<folder>/ as (table, path, page) tuples.
+    Single images are one table with page None; each page of a multi-page TIFF or PDF
+    is its own table. Only document headers are read.
+    """
+
+    tables = []
+    folder_path = os.path.join(input_root, folder)
+    for fname in sorted(os.listdir(folder_path)):
+        path = os.path.join(folder_path, fname)
+        if not fname.lower().endswith(TABLE_EXTENSIONS) or not os.path.isfile(path):
+            continue
+        count = page_count(path) if fname.lower().endswith(MULTIPAGE_EXTENSIONS) else 1
+        if count == 1 and not is_pdf(path):
+            tables.append((fname, path, None))
+        else:
+            tables.extend((page_table_name(fname, i), path, i) for i in range(count))
+    return tables
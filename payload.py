@@ -0,0 +1,246 @@
+import os
+import sys
+import time
+import argparse
+import cv2
+import numpy as np
+
+from segmentation import CELL_EXTENSIONS
+
+# Encoding presets applied to a cell crop before it is uploaded to Vision.
+#   mode          "color" keeps the crop as-is, "gray" drops colour, "bilevel" thresholds to black/white
+#   remove_lines  erase residual grid lines that run along most of the crop
+#   trim          crop to the ink bounding box plus pad pixels
+#   max_side      downscale so the longest side fits (None keeps the resolution)
+#   format        ".png", ".webp" (lossless) or ".jpg"
+#   skip_blank    return no payload for crops without ink so no request is sent
+UPLOAD_PRESETS = {
+    "raw": None,
+    "gray": {"mode": "gray", "format": ".png"},
+    "compact": {
+        "mode": "gray", "remove_lines": True, "trim": True, "pad": 4,
+        "max_side": 320, "format": ".png",
+    },
+    "bilevel": {
+        "mode": "bilevel", "remove_lines": True, "trim": True, "pad": 4,
+        "max_side": 320, "format": ".png",
+    },
+    "webp": {
+        "mode": "gray", "remove_lines": True, "trim": True, "pad": 4,
+        "max_side": 320, "format": ".webp",
+    },
+    "compact_skip_blank": {
+        "mode": "gray", "remove_lines": True, "trim": True, "pad": 4,
+        "max_side": 320, "format": ".png", "skip_blank": True,
+    },
+}
+
+# Ink must be this much darker than the paper (median gray level) to count
+INK_CONTRAST = 40
+MIN_INK_PIXELS = 6
+
+
+def ink_mask(gray):
+
+    """
+    Returns a boolean mask of pen strokes in a grayscale crop: pixels darker than both the
+    Otsu threshold and the paper tone by INK_CONTRAST.
+    """
+
+    paper = float(np.median(gray))
+    otsu, _ = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # Otsu's threshold is the last value of the dark class, so it counts as ink
+    return gray <= min(otsu, paper - INK_CONTRAST)
+
+
+def remove_grid_lines(gray, ink):
+
+    """
+    Erases strokes spanning most of the crop's width or height (ruling, not handwriting).
+    Returns the cleaned grayscale crop and the remaining ink mask.
+    """
+
+    h, w = gray.shape
+    mask = ink.astype(np.uint8) * 255
+    horizontal = cv2.morphologyEx(mask, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (max(int(w * 0.7), 1), 1)))
+    vertical = cv2.morphologyEx(mask, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, max(int(h * 0.7), 1))))
+    lines = cv2.dilate(horizontal | vertical, np.ones((3, 3), np.uint8)) > 0
+    cleaned = gray.copy()
+    cleaned[lines] = int(np.median(gray))
+    return cleaned, ink & ~lines
+
+
+def sharpen_image(img):
+
+    """
+    Applies a sharpening kernel to the given image and returns the sharpened image.
+    """
+
+    kernel = np.array([[0, -1, 0],
+                       [-1, 5, -1],
+                       [0, -1, 0]])
+    return cv2.filter2D(img, -1, kernel)
+
+
+def prepare_for_upload(img, preset):
+
+    """
+    Applies an upload preset to a BGR cell crop and returns the processed image,
+    or None when the preset skips blank crops and no ink was found.
+    """
+
+    settings = UPLOAD_PRESETS[preset] if isinstance(preset, str) else preset
+    if settings is None:
+        return img
+
+    out = img if settings.get("mode", "color") == "color" else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    gray = out if out.ndim == 2 else cv2.cvtColor(out, cv2.COLOR_BGR2GRAY)
+    ink = ink_mask(gray)
+    if settings.get("remove_lines"):
+        gray, ink = remove_grid_lines(gray, ink)
+        if out.ndim == 2:
+            out = gray
+
+    if settings.get("skip_blank") and np.count_nonzero(ink) < MIN_INK_PIXELS:
+        return None
+
+    if settings.get("trim") and np.count_nonzero(ink) >= MIN_INK_PIXELS:
+        x, y, w, h = cv2.boundingRect(ink.astype(np.uint8))
+        pad = settings.get("pad", 0)
+        y0, y1 = max(y - pad, 0), min(y + h + pad, out.shape[0])
+        x0, x1 = max(x - pad, 0), min(x + w + pad, out.shape[1])
+        out = out[y0:y1, x0:x1]
+        ink = ink[y0:y1, x0:x1]
+
+    if settings.get("mode") == "bilevel":
+        out = np.where(ink, 0, 255).astype(np.uint8)
+
+    max_side = settings.get("max_side")
+    if max_side and max(out.shape[:2]) > max_side:
+        ratio = max_side / max(out.shape[:2])
+        size = (max(int(out.shape[1] * ratio), 1), max(int(out.shape[0] * ratio), 1))
+        out = cv2.resize(out, size, interpolation=cv2.INTER_AREA)
+        if settings.get("mode") == "bilevel":
+            out = np.where(out < 128, 0, 255).astype(np.uint8)
+    return out
+
+
+def encode_for_upload(img, preset):
+
+    """
+    Returns the bytes to upload for a BGR cell crop under the given preset, or None for a
+    skipped blank crop.
+    """
+
+    settings = UPLOAD_PRESETS[preset] if isinstance(preset, str) else preset
+    prepared = prepare_for_upload(img, settings)
+    if prepared is None:
+        return None
+    fmt = (settings or {}).get("format", ".png")
+    if fmt == ".webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, 101]  # >100 selects lossless
+    elif fmt == ".jpg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, 90]
+    elif (settings or {}).get("mode") == "bilevel":
+        params = [cv2.IMWRITE_PNG_COMPRESSION, 9, cv2.IMWRITE_PNG_BILEVEL, 1]
+    else:
+        params = [cv2.IMWRITE_PNG_COMPRESSION, 9]
+    ok, buf = cv2.imencode(fmt, prepared, params)
+    if not ok:
+        raise ValueError(f"Could not encode cell as {fmt}")
+    return buf.tobytes()
+
+
+def encode_file_for_upload(image_path, preset):
+
+    """
+    Reads a cell image and returns its upload bytes. The raw preset sends the file unchanged.
+    """
+
+    settings = UPLOAD_PRESETS[preset] if isinstance(preset, str) else preset
+    if settings is None:
+        with open(image_path, "rb") as f:
+            return f.read()
+    img = cv2.imread(image_path)
+    if img is None:
+        raise ValueError(f"Could not read cell image: {image_path}")
+    return encode_for_upload(img, settings)
+
+
+def sample_cells(table_path, sample):
+
+    """
+    Picks up to sample cell images spread evenly over a segmented table.
+    """
+
+    cells = []
+    for root, _, files in os.walk(table_path):
+        for fname in files:
+            if fname.startswith("col_") and fname.lower().endswith(CELL_EXTENSIONS):
+                cells.append(os.path.join(root, fname))
+    cells.sort()
+    if sample and len(cells) > sample:
+        idx = np.linspace(0, len(cells) - 1, sample).round().astype(int)
+        cells = [cells[i] for i in idx]
+    return cells
+
+
+def benchmark_presets(table_path, client, presets=None, sample=40):
+
+    """
+    OCRs a sample of a table's cells once per preset and reports bytes uploaded, mean request
+    latency and agreement with the raw upload. Returns one result dict per preset.
+    """
+
+    from ocr_processor import detect_text
+
+    # Raw goes first: every other preset is compared against its text
+    presets = ["raw"] + [p for p in (presets or UPLOAD_PRESETS) if p != "raw"]
+    cells = sample_cells(table_path, sample)
+
+    texts = {}
+    results = []
+    for preset in presets:
+        total_bytes, latencies, outputs = 0, [], []
+        for cell in cells:
+            content = encode_file_for_upload(cell, preset)
+            if content is None:
+                outputs.append("")
+                continue
+            total_bytes += len(content)
+            start = time.perf_counter()
+            outputs.append(detect_text(content, client))
+            latencies.append(time.perf_counter() - start)
+        texts[preset] = outputs
+        agree = sum(a == b for a, b in zip(outputs, texts["raw"]))
+        results.append({
+            "preset": preset,
+            "cells": len(cells),
+            "bytes_uploaded": total_bytes,
+            "requests": len(latencies),
+            "mean_latency_s": round(sum(latencies) / len(latencies), 4) if latencies else 0.0,
+            "agreement_with_raw": round(agree / len(cells), 3) if cells else 1.0,
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare upload presets on a segmented table.")
+    parser.add_argument("table_path", help="Segmented table folder, e.g. output/april/daily_max_1893_1912.PNG")
+    parser.add_argument("--sample", type=int, default=40, help="Number of cells to OCR per preset")
+    parser.add_argument("--presets", nargs="*", default=None, choices=list(UPLOAD_PRESETS))
+    args = parser.parse_args(argv)
+
+    from ocr_processor import _get_vision_client
+    client = _get_vision_client()
+    if client is None:
+        print("❌ Google Cloud Vision credentials not found.")
+        return 1
+    print(f"{'preset':<20}{'bytes':>10}{'requests':>10}{'latency s':>12}{'agreement':>11}")
+    for r in benchmark_presets(args.table_path, client, args.presets, args.sample):
+        print(f"{r['preset']:<20}{r['bytes_uploaded']:>10}{r['requests']:>10}{r['mean_latency_s']:>12}{r['agreement_with_raw']:>11}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+import os
+import csv
+import queue
+import shutil
+import threading
+import cv2
+
+from jobs import JobCancelled
+from metrics import RunMetrics
+from payload import encode_for_upload, sharpen_image
+from scan_io import FullResImage
+from segmentation import cell_box, replace_table_cells, CELL_FORMATS, DEFAULT_CELL_FORMAT
+
+# Cells waiting between stages. Each queue holds at most this many crops or uploads, so
+# memory stays bounded however large the table is: a full queue blocks the stage feeding it.
+DEFAULT_QUEUE_SIZE = 64
+
+DEFAULT_PREPROCESS_WORKERS = 2
+DEFAULT_OCR_WORKERS = 8
+
+_DONE = object()
+
+
+class _Stop(Exception):
+    """Raised inside a stage when another stage failed or the run was cancelled."""
+
+
+def _put(q, item, stop):
+    while True:
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            if stop.is_set():
+                raise _Stop()
+
+
+def _get(q, stop):
+    while True:
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            if stop.is_set():
+                raise _Stop()
+
+
+def stream_table(image_path, grid, csv_output_folder, table, client, page=None, write_cells_to=None,
+                 sharpen=True, upload_preset="raw", cell_format=DEFAULT_CELL_FORMAT,
+                 preprocess_workers=DEFAULT_PREPROCESS_WORKERS,
+                 ocr_workers=DEFAULT_OCR_WORKERS, queue_size=DEFAULT_QUEUE_SIZE, metrics=None,
+                 progress=None, cancel=None):
+
+    """
+    Cuts, sharpens and OCRs a table in one pass, without the per-stage disk round trips of
+    segmentation -> sharpening -> run_ocr_on_table:
+
+        crop (this scan, rotated) -> preprocess workers -> OCR workers -> ordered row writer
+
+    Stages are joined by bounded queues, so OCR of the first rows overlaps with cropping the
+    last ones. Rows are written to the CSV as soon as they and every row above them are done.
+    The row_N/col_M cell tree (encoded as segmentation.CELL_FORMATS[cell_format]) is only
+    written when write_cells_to names the table's output folder. Like cut_cells, cells go to a
+    staging folder that replaces the table's cells only when the run completes.
+    Raises jobs.JobCancelled when cancel is set; no CSV or cells are left behind in that case.
+    Returns the CSV path.
+    """
+
+    metrics = metrics or RunMetrics(f"pipeline:{table}")
+    cancel = cancel or threading.Event()
+    stop = threading.Event()
+    errors = []
+    n_rows, n_cols = len(grid["row_lines"]) - 1, len(grid["col_lines"]) - 1
+    total = n_rows * n_cols
+    rotation = grid.get("rotation", 0)
+    cell_ext, cell_params = CELL_FORMATS[cell_format]
+    staging = os.path.normpath(write_cells_to) + ".partial" if write_cells_to else None
+
+    crops = queue.Queue(maxsize=queue_size)
+    uploads = queue.Queue(maxsize=queue_size)
+    results = queue.Queue(maxsize=queue_size)
+    remaining = {"crop": 1, "preprocess": preprocess_workers, "ocr": ocr_workers}
+    lock = threading.Lock()
+
+    def stage(name, body, downstream, downstream_workers):
+        # Runs one worker; the last worker of a stage to finish tells the next stage to stop
+        try:
+            body()
+        except _Stop:
+            pass
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            with lock:
+                remaining[name] -= 1
+                last = remaining[name] == 0
+            if last:
+                for _ in range(downstream_workers):
+                    try:
+                        _put(downstream, _DONE, stop)
+                    except _Stop:
+                        break
+
+    def crop_cells():
+        with metrics.stage("decode_full"):
+            full = FullResImage(image_path, page=page)
+        metrics.count("images_decoded")
+        with full:
+            for r in range(n_rows):
+                for c in range(n_cols):
+                    if cancel.is_set():
+                        stop.set()
+                        raise _Stop()
+                    with metrics.stage("crop"):
+                        crop = full.rotated_crop(cell_box(grid, r, c), rotation)
+                    _put(crops, ((r, c), crop), stop)
+
+    def preprocess():
+        while True:
+            item = _get(crops, stop)
+            if item is _DONE:
+                return
+            (r, c), crop = item
+            if sharpen:
+                with metrics.stage("sharpen_filter"):
+                    crop = sharpen_image(crop)
+            if staging:
+                cell_path = os.path.join(staging, f"row_{r+1}", f"col_{c+1}{cell_ext}")
+                with metrics.stage("encode_write"):
+                    if not cv2.imwrite(cell_path, crop, cell_params):
+                        raise OSError(f"Could not write cell image: {cell_path}")
+                metrics.count("bytes_written", os.path.getsize(cell_path))
+            with metrics.stage("encode_upload"):
+                content = encode_for_upload(crop, upload_preset)
+            metrics.count("images_encoded")
+            _put(uploads, ((r, c), content), stop)
+
+    def ocr():
+        from ocr_processor import detect_text
+        while True:
+            item = _get(uploads, stop)
+            if item is _DONE:
+                return
+            (r, c), content = item
+            if content is None:
+                metrics.count("blank_cells_skipped")
+                text = ""
+            else:
+                text = detect_text(content, client, metrics)
+            _put(results, ((r, c), text), stop)
+
+    threads = [threading.Thread(target=stage, args=("crop", crop_cells, crops, preprocess_workers), daemon=True)]
+    threads += [threading.Thread(target=stage, args=("preprocess", preprocess, uploads, ocr_workers), daemon=True)
+                for _ in range(preprocess_workers)]
+    threads += [threading.Thread(target=stage, args=("ocr", ocr, results, 1), daemon=True)
+                for _ in range(ocr_workers)]
+    if staging:
+        shutil.rmtree(staging, ignore_errors=True)
+        for r in range(n_rows):
+            os.makedirs(os.path.join(staging, f"row_{r+1}"))
+    for t in threads:
+        t.start()
+
+    os.makedirs(csv_output_folder, exist_ok=True)
+    csv_path = os.path.join(csv_output_folder, f"{table}.csv")
+    tmp_path = csv_path + ".partial"
+    pending = {}
+    next_row, done = 0, 0
+    try:
+        try:
+            with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f, lineterminator=os.linesep)
+                while next_row < n_rows:
+                    if cancel.is_set():
+                        raise _Stop()
+                    item = _get(results, stop)
+                    if item is _DONE:
+                        break  # The OCR stage ended early because another stage failed
+                    (r, c), text = item
+                    pending.setdefault(r, {})[c] = text
+                    done += 1
+                    # Flush every row that is now complete and has no gap above it
+                    while len(pending.get(next_row, ())) == n_cols:
+                        row = pending.pop(next_row)
+                        with metrics.stage("write_csv"):
+                            writer.writerow([row[c] for c in range(n_cols)])
+                        next_row += 1
+                    if progress:
+                        progress(done, total)
+        except _Stop:
+            pass
+        finally:
+            # Also reached when the writer or progress raised: the stages must stop before cleanup
+            stop.set()
+            for t in threads:
+                t.join()
+
+        if next_row < n_rows:
+            if errors:
+                raise errors[0]
+            raise JobCancelled()
+        os.replace(tmp_path, csv_path)
+        if staging:
+            replace_table_cells(staging, write_cells_to)
+    except BaseException:
+        # Whatever went wrong, leave neither a partial CSV nor staged cells behind
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if staging:
+            shutil.rmtree(staging, ignore_errors=True)
+        raise
+    metrics.count("bytes_written", os.path.getsize(csv_path))
+    metrics.write_json(os.path.join(csv_output_folder, f"{table}.metrics.json"))
+    print(f"✅ Streamed OCR finished and saved: {csv_path}")
+    return csv_path
@@ -0,0 +1,245 @@
+import os
+import sys
+import json
+import math
+import argparse
+import cv2
+import numpy as np
+
+from scan_io import load_display_image, image_size, FullResImage
+from pages import page_size, list_tables
+from segmentation import load_grid, save_grid, cut_cells, CELL_FORMATS, DEFAULT_CELL_FORMAT
+from metrics import RunMetrics, SEGMENTATION_METRICS_FILE
+from payload import sharpen_image
+
+# Pages are registered on copies whose longest side is at most this many pixels
+REGISTRATION_MAX_SIDE = 1000
+
+# ECC correlation (0-1) a page must reach for its propagated grid to be trusted;
+# pages below it go back to manual drawing
+DEFAULT_MIN_SCORE = 0.6
+
+REPORT_FILE = "registration_report.json"
+
+_ECC_CRITERIA = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 100, 1e-5)
+
+
+def _page_shape(image_path, page=None):
+    return page_size(image_path, page) if page is not None else image_size(image_path)
+
+
+class RegistrationReference:
+
+    """
+    A segmented reference page prepared once for registering many new pages against it:
+    its grid and a small, blurred grayscale copy.
+    """
+
+    def __init__(self, table_path, max_side=REGISTRATION_MAX_SIDE):
+        self.grid = load_grid(table_path)
+        if self.grid is None:
+            raise ValueError(f"No grid.json in {table_path}; segment the reference page first")
+        self.max_side = max_side
+        self.small, self.scale = _small_gray(self.grid["image_path"], self.grid.get("page"), max_side)
+
+
+def _small_gray(image_path, page, max_side):
+    img, scale = load_display_image(image_path, max_side, page=page)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY).astype(np.float32)
+    # Blurring widens thin ruling so ECC converges from further away
+    return cv2.GaussianBlur(gray, (5, 5), 0), scale
+
+
+def _pad_to(img, shape):
+    out = np.full(shape, float(np.median(img)), dtype=np.float32)
+    out[:img.shape[0], :img.shape[1]] = img
+    return out
+
+
+def estimate_transform(ref_small, new_small):
+
+    """
+    Finds the affine warp W (2x3) mapping reference pixels to new-page pixels on the small
+    copies: phase correlation gives the starting shift, ECC refines it to a full affine.
+    Returns (W, score), score being the correlation of the aligned images (1 is perfect).
+    """
+
+    shape = (max(ref_small.shape[0], new_small.shape[0]), max(ref_small.shape[1], new_small.shape[1]))
+    window = cv2.createHanningWindow(shape[::-1], cv2.CV_32F)
+    (dx, dy), _ = cv2.phaseCorrelate(_pad_to(ref_small, shape), _pad_to(new_small, shape), window)
+    warp = np.array([[1, 0, dx], [0, 1, dy]], dtype=np.float32)
+
+    ref_pad, new_pad = _pad_to(ref_small, shape), _pad_to(new_small, shape)
+    try:
+        _, warp = cv2.findTransformECC(ref_pad, new_pad, warp, cv2.MOTION_AFFINE, _ECC_CRITERIA, None, 5)
+    except cv2.error:
+        pass  # ECC did not converge; keep the phase-correlation shift and let the score decide
+
+    # Replicate the border so pixels warped in from outside the page don't read as a mismatch
+    aligned = cv2.warpAffine(new_pad, warp, shape[::-1], flags=cv2.INTER_LINEAR + cv2.WARP_INVERSE_MAP,
+                             borderMode=cv2.BORDER_REPLICATE)
+    h, w = ref_small.shape
+    score = cv2.computeECC(ref_small, np.ascontiguousarray(aligned[:h, :w]))
+    # A featureless page has no variance to correlate with and scores NaN
+    return warp.astype(float), float(score) if np.isfinite(score) else 0.0
+
+
+def _rotation_matrix(shape, angle):
+    height, width = shape[:2]
+    return np.vstack([cv2.getRotationMatrix2D((width // 2, height // 2), angle, 1.0), [0, 0, 1]])
+
+
+def transform_grid(grid, affine, new_shape):
+
+    """
+    Moves a grid onto a new page. affine (2x3) maps unrotated reference pixels to unrotated
+    new-page pixels at full resolution. Returns a new grid dict with row_lines, col_lines
+    and rotation fitted to the new page; lines still include 0 and the image edges.
+    """
+
+    ref_shape = grid["image_shape"]
+    alpha_ref = grid.get("rotation", 0.0)
+    A = np.vstack([affine, [0, 0, 1]])
+    ref_rot = _rotation_matrix(ref_shape, alpha_ref)
+
+    # Rotation that straightens the new page: the reference's rotation plus the page's own tilt
+    linear = ref_rot[:2, :2] @ np.linalg.inv(A[:2, :2])
+    alpha_new = math.degrees(math.atan2(linear[0, 1], linear[0, 0]))
+    new_rot = _rotation_matrix(new_shape, alpha_new)
+    to_new = new_rot @ A @ np.linalg.inv(ref_rot)
+
+    height, width = int(new_shape[0]), int(new_shape[1])
+    rows, cols = grid["row_lines"], grid["col_lines"]
+    # Sample each line across the table's extent and keep the mean of its moved coordinate
+    xs = np.linspace(cols[0], cols[-1], 9)
+    ys = np.linspace(rows[0], rows[-1], 9)
+
+    def move(points):
+        pts = np.column_stack([points, np.ones(len(points))]) @ to_new.T
+        return pts[:, :2]
+
+    new_rows = [move(np.column_stack([xs, np.full_like(xs, y)]))[:, 1].mean() for y in rows[1:-1]]
+    new_cols = [move(np.column_stack([np.full_like(ys, x), ys]))[:, 0].mean() for x in cols[1:-1]]
+    # Lines are not clamped to the page or merged; grid_fits rejects grids that would need it
+    new_rows = [int(round(y)) for y in new_rows]
+    new_cols = [int(round(x)) for x in new_cols]
+
+    return dict(
+        grid,
+        image_shape=[height, width],
+        rotation=alpha_new - 360 * round(alpha_new / 360),
+        row_lines=[0] + new_rows + [height],
+        col_lines=[0] + new_cols + [width],
+    )
+
+
+def grid_fits(grid):
+
+    """
+    Checks that every line of a moved grid lands inside the page and that the lines are still
+    strictly increasing, so the page has exactly the reference's rows and columns. A grid that
+    fails would lose or merge rows or day columns, and the page is left for manual drawing.
+    """
+
+    height, width = grid["image_shape"][:2]
+    for lines, size in ((grid["row_lines"], height), (grid["col_lines"], width)):
+        if lines[0] != 0 or lines[-1] != size or any(b <= a for a, b in zip(lines, lines[1:])):
+            return False
+    return True
+
+
+def register_page(reference, image_path, page=None):
+
+    """
+    Aligns a new page to the reference and returns (grid, score) with the reference grid
+    moved onto it. Only the small registration copies are decoded.
+    """
+
+    new_small, new_scale = _small_gray(image_path, page, reference.max_side)
+    warp, score = estimate_transform(reference.small, new_small)
+    # Lift the small-copy warp to full resolution (full = small * scale on each page)
+    affine = np.hstack([warp[:, :2] * new_scale / reference.scale, warp[:, 2:] * new_scale])
+    grid = transform_grid(reference.grid, affine, _page_shape(image_path, page))
+    grid.update(image_path=os.path.abspath(image_path), page=page)
+    return grid, score
+
+
+def propagate_grid(reference_path, targets, min_score=DEFAULT_MIN_SCORE, overwrite=False,
+                   cell_format=DEFAULT_CELL_FORMAT, progress=None, cancel=None):
+
+    """
+    Registers every target page against a segmented reference table and cuts the cells of
+    pages that fit well enough. targets is a list of (table, image_path, page, output_dir).
+    Pages scoring below min_score, or that the moved grid doesn't fit inside (see grid_fits),
+    are left for manual segmentation, and so are pages that already have a grid unless
+    overwrite is set. Cells are sharpened and written as cell_format (see segmentation.CELL_FORMATS). Returns one result dict per page.
+    """
+
+    from jobs import check_cancel
+
+    reference = RegistrationReference(reference_path)
+    results = []
+    for done, (table, image_path, page, output_dir) in enumerate(targets, 1):
+        check_cancel(cancel)
+        result = {"table": table, "image_path": image_path, "page": page}
+        if not overwrite and load_grid(output_dir) is not None:
+            result.update(status="skipped", score=None)
+        else:
+            metrics = RunMetrics(f"registration:{table}")
+            with metrics.stage("register"):
+                grid, score = register_page(reference, image_path, page)
+            result.update(score=round(score, 4), rotation=grid["rotation"])
+            if score < min_score:
+                result["status"] = "manual"
+            elif not grid_fits(grid):
+                result.update(status="manual", reason="grid lines fall off the page")
+            else:
+                with metrics.stage("decode_full"), FullResImage(image_path, page=page) as full:
+                    # Sharpened as they are cut, like cells of a hand-drawn grid after segmentation
+                    cut_cells(full, output_dir, grid["row_lines"], grid["col_lines"], grid["rotation"], metrics,
+                              cell_format, transform=sharpen_image)
+                save_grid(output_dir, image_path, grid["image_shape"], grid["row_lines"], grid["col_lines"],
+                          grid["rotation"], page)
+                metrics.write_json(os.path.join(output_dir, SEGMENTATION_METRICS_FILE))
+                result["status"] = "aligned"
+        results.append(result)
+        if progress:
+            progress(done, len(targets))
+    return results
+
+
+def write_report(results, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Propagate a segmented page's grid to the other pages of a folder.")
+    parser.add_argument("reference", help="Segmented reference table, e.g. output/april/ledger.tiff_page_1")
+    parser.add_argument("folder", help="Input folder under the input root, e.g. april")
+    parser.add_argument("--input-root", default="input_tables")
+    parser.add_argument("--output-root", default="output")
+    parser.add_argument("--min-score", type=float, default=DEFAULT_MIN_SCORE)
+    parser.add_argument("--overwrite", action="store_true", help="Re-cut pages that already have a grid")
+    parser.add_argument("--cell-format", choices=list(CELL_FORMATS), default=DEFAULT_CELL_FORMAT)
+    args = parser.parse_args(argv)
+
+    ref_name = os.path.basename(os.path.normpath(args.reference))
+    targets = [
+        (table, path, page, os.path.join(args.output_root, args.folder, table))
+        for table, path, page in list_tables(args.input_root, args.folder)
+        if table != ref_name
+    ]
+    results = propagate_grid(args.reference, targets, args.min_score, args.overwrite, args.cell_format)
+    for r in results:
+        score = "-" if r["score"] is None else f"{r['score']:.3f}"
+        print(f"{r['status']:<8}{score:>7}  {r['table']}")
+    report = write_report(results, os.path.join(args.output_root, args.folder, REPORT_FILE))
+    manual = sum(r["status"] == "manual" for r in results)
+    print(f"✅ {len(results) - manual} page(s) aligned or skipped, {manual} need manual drawing. Report: {report}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
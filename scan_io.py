@@ -0,0 +1,234 @@
+import os
+import tempfile
+import cv2
+import numpy as np
+from PIL import Image
+
+from pages import pil_to_bgr, page_size, read_page, is_pdf, iter_pdf_bands
+
+# Longest side of the image shown in the grid drawing window
+DISPLAY_MAX_SIDE = 3000
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff")
+
+# libjpeg can decode at 1/2, 1/4 or 1/8 scale; other formats are always decoded in full
+JPEG_EXTENSIONS = (".jpg", ".jpeg")
+
+# Pillow modes decoded straight into the memory map, as (storage mode, channels).
+# Pillow keeps RGB pixels 4 bytes wide, so RGB scans are stored as RGBX.
+_MAPPED_MODES = {
+    "RGB": ("RGBX", 4),
+    "RGBA": ("RGBA", 4),
+    "L": ("L", 1),
+    "1": ("L", 1),
+    "P": ("P", 1),
+}
+
+# Rows of a PDF page rendered at a time
+PDF_BAND_HEIGHT = 512
+
+_REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def image_size(image_path):
+
+    """
+    Returns (height, width) of an image by reading its header only.
+    """
+
+    with Image.open(image_path) as im:
+        width, height = im.size
+    return height, width
+
+
+def load_display_image(image_path, max_side=DISPLAY_MAX_SIDE, page=None):
+
+    """
+    Decodes a reduced-resolution copy of a scan for drawing the grid.
+    Returns (image, scale) where full-resolution coordinates = display coordinates * scale.
+    Images already smaller than max_side are returned at full resolution with scale 1.
+    page selects one page of a multi-page TIFF or PDF.
+    JPEGs are scaled down while decoding and PDF pages are rendered at the display size.
+    Other formats can't be decoded at a lower resolution, so they are decoded into a
+    disk-backed FullResImage and shrunk a band at a time, never held in RAM in full.
+    """
+
+    if page is not None and is_pdf(image_path):
+        width = page_size(image_path, page)[1]
+        img = read_page(image_path, page, max_side)
+        return img, width / img.shape[1]
+
+    if page is None and image_path.lower().endswith(JPEG_EXTENSIONS):
+        height, width = image_size(image_path)
+        factor = 1
+        while factor < 8 and max(height, width) / factor > max_side:
+            factor *= 2
+        img = cv2.imread(image_path, _REDUCED_FLAGS[factor])
+        if img is not None:
+            # Keep shrinking past 8x for extremely large scans
+            if max(img.shape[:2]) > max_side:
+                ratio = max_side / max(img.shape[:2])
+                img = cv2.resize(img, (int(img.shape[1] * ratio), int(img.shape[0] * ratio)), interpolation=cv2.INTER_AREA)
+            return img, width / img.shape[1]
+
+    with FullResImage(image_path, page=page) as full:
+        img = full.reduced(max_side)
+        return img, full.shape[1] / img.shape[1]
+
+
+class FullResImage:
+
+    """
+    Full-resolution pixels of a scan (or one page of a multi-page document) kept in a
+    disk-backed memory map.
+    The scan is decoded straight into the map (PDF pages are rendered into it in bands), so
+    decoding never holds a full-size copy in RAM, and crops only touch the pages they need.
+    """
+
+    def __init__(self, image_path, cache_dir=None, page=None):
+        self.cache_dir = cache_dir
+        self.cache_path = None
+        self._lut = None
+        try:
+            if page is not None and is_pdf(image_path):
+                self._render_pdf(image_path, page)
+            else:
+                self._decode(image_path, page)
+            self.pixels.flush()
+        except BaseException:
+            self.close()
+            raise
+        self.shape = self.pixels.shape[:2] + (3,)
+
+    def _new_map(self, shape):
+        fd, self.cache_path = tempfile.mkstemp(suffix=".npy", dir=self.cache_dir)
+        os.close(fd)
+        self.pixels = np.lib.format.open_memmap(self.cache_path, mode="w+", dtype=np.uint8, shape=shape)
+        return self.pixels
+
+    def _decode(self, image_path, page):
+        try:
+            im = Image.open(image_path)
+        except OSError:
+            im = None
+        if im is None:
+            # Formats only OpenCV can read are decoded in memory, then copied into the map
+            img = cv2.imread(image_path, cv2.IMREAD_COLOR)
+            if img is None:
+                raise ValueError(f"Could not read image: {image_path}")
+            self._new_map(img.shape)[:] = img
+            return
+        with im:
+            if page is not None:
+                im.seek(page)
+            storage = _MAPPED_MODES.get(im.mode)
+            if storage is None:
+                # Uncommon modes (16-bit, CMYK ...) need a full conversion first
+                img = pil_to_bgr(im)
+                self._new_map(img.shape)[:] = img
+                return
+            mode, channels = storage
+            width, height = im.size
+            pixels = self._new_map((height, width, channels) if channels > 1 else (height, width))
+            # Point Pillow's image memory at the map, so the decoder writes its rows to disk
+            im.im = Image.frombuffer(mode, im.size, pixels, "raw", mode, 0, 1).im
+            im.load()
+            if im.mode == "P":
+                palette = np.array(im.getpalette("RGB") or [], dtype=np.uint8).reshape(-1, 3)
+                lut = np.zeros((256, 3), dtype=np.uint8)
+                lut[:len(palette)] = palette[:256, ::-1]
+                self._lut = lut
+
+    def _render_pdf(self, image_path, page):
+        height, width = page_size(image_path, page)
+        pixels = self._new_map((height, width, 3))
+        for y0, band in iter_pdf_bands(image_path, page, PDF_BAND_HEIGHT):
+            rows = min(band.shape[0], height - y0)
+            cols = min(band.shape[1], width)
+            pixels[y0:y0 + rows, :cols] = band[:rows, :cols]
+
+    def _to_bgr(self, region):
+        # Converts a block of the map from its stored layout to BGR
+        if self._lut is not None:
+            return self._lut[region]
+        if region.ndim == 2:
+            return cv2.cvtColor(np.ascontiguousarray(region), cv2.COLOR_GRAY2BGR)
+        if region.shape[2] == 4:
+            return cv2.cvtColor(np.ascontiguousarray(region), cv2.COLOR_RGBA2BGR)
+        return np.array(region)
+
+    def crop(self, x0, y0, x1, y1):
+
+        """
+        Returns a copy of an axis-aligned region of the unrotated scan.
+        """
+
+        return self._to_bgr(self.pixels[y0:y1, x0:x1])
+
+    def reduced(self, max_side):
+
+        """
+        Returns the scan shrunk so its longest side is at most max_side, converting and
+        resizing one band of rows at a time.
+        """
+
+        height, width = self.shape[:2]
+        factor = max(1, -(-max(height, width) // max_side))
+        if factor == 1:
+            return self.crop(0, 0, width, height)
+        out_width = max(1, width // factor)
+        band = factor * 64
+        parts = []
+        for y0 in range(0, height, band):
+            y1 = min(y0 + band, height)
+            rows = max(1, (y1 - y0) // factor)
+            parts.append(cv2.resize(self.crop(0, y0, width, y1), (out_width, rows), interpolation=cv2.INTER_AREA))
+        return np.vstack(parts)
+
+    def rotated_crop(self, box, angle):
+
+        """
+        Returns the region box = (x0, y0, x1, y1) of the scan rotated by angle degrees about its
+        center, as cv2.warpAffine on the whole image would produce, while reading only the
+        source pixels that land inside the box.
+        """
+
+        x0, y0, x1, y1 = box
+        if angle == 0:
+            return self.crop(x0, y0, x1, y1)
+
+        height, width = self.shape[:2]
+        rot_matrix = cv2.getRotationMatrix2D((width // 2, height // 2), angle, 1.0)
+        inverse = cv2.invertAffineTransform(rot_matrix)
+
+        # Source footprint of the box corners, with a margin for interpolation
+        corners = np.array([[x0, y0, 1], [x1, y0, 1], [x0, y1, 1], [x1, y1, 1]], dtype=float)
+        src = corners @ inverse.T
+        sx0 = max(int(np.floor(src[:, 0].min())) - 2, 0)
+        sy0 = max(int(np.floor(src[:, 1].min())) - 2, 0)
+        sx1 = min(int(np.ceil(src[:, 0].max())) + 3, width)
+        sy1 = min(int(np.ceil(src[:, 1].max())) + 3, height)
+        if sx0 >= sx1 or sy0 >= sy1:
+            return np.zeros((y1 - y0, x1 - x0) + self.shape[2:], dtype=np.uint8)
+
+        region = self.crop(sx0, sy0, sx1, sy1)
+        local = rot_matrix.copy()
+        local[:, 2] = rot_matrix[:, :2] @ np.array([sx0, sy0], dtype=float) + rot_matrix[:, 2] - np.array([x0, y0], dtype=float)
+        return cv2.warpAffine(region, local, (x1 - x0, y1 - y0))
+
+    def close(self):
+        # Dropping the last reference unmaps the file so it can be removed
+        self.pixels = None
+        if self.cache_path and os.path.exists(self.cache_path):
+            os.remove(self.cache_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,35 +1,290 @@
 import cv2
 import os
+import json
 import math
+import time
+import shutil
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from scan_io import load_display_image, image_size, FullResImage
+from pages import page_size, source_bytes
+from metrics import RunMetrics, SEGMENTATION_METRICS_FILE
+
+GRID_FILE = "grid.json"
+
+# Copy of the grid a table's CSV was OCR'd from; re-running OCR after the grid is redrawn
+# only sends the cells whose crop boxes differ from it
+OCR_GRID_FILE = "ocr_grid.json"
+
+# Encodings for the row_N/col_M cell images, as (extension, cv2.imwrite parameters).
+# "png" is plain cv2.imwrite (level 1 with run-length matching). Uncompressed PNG is a little
+# faster but larger; level 9 is about a third smaller but slower. WebP above quality 100 is
+# lossless and usually the smallest, but the slowest to encode.
+CELL_FORMATS = {
+    "png": (".png", []),
+    "png_fast": (".png", [cv2.IMWRITE_PNG_COMPRESSION, 0]),
+    "png_small": (".png", [cv2.IMWRITE_PNG_COMPRESSION, 9]),
+    "webp": (".webp", [cv2.IMWRITE_WEBP_QUALITY, 101]),
+}
+DEFAULT_CELL_FORMAT = "png"
+CELL_EXTENSIONS = (".png", ".webp")
+
+# A right click this close to a line (in display pixels) removes that line instead of the last one
+LINE_PICK_RADIUS = 8
+
+# Threads cropping and encoding cells; OpenCV releases the GIL while it works
+EXPORT_WORKERS = min(8, os.cpu_count() or 1)
 
 for filename in os.listdir(os.path.join(os.path.dirname(__file__), "key")):
     if filename.endswith(".json"):
         os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.path.join(os.path.dirname(__file__), "key", filename)
         break
 
-def start_segmentation(image_path, output_dir):
-    img = cv2.imread(image_path)
+def save_grid(output_dir, image_path, image_shape, row_lines, col_lines, rotation, page=None):
+
+    """
+    Stores the grid used to cut a table (including the outer image edges) as grid.json,
+    so every cell's crop box can be traced back to the source scan.
+    """
+
+    grid = {
+        "image_path": os.path.abspath(image_path),
+        "page": page,
+        "image_shape": [int(image_shape[0]), int(image_shape[1])],
+        "rotation": float(rotation),
+        "row_lines": [int(y) for y in row_lines],
+        "col_lines": [int(x) for x in col_lines],
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, GRID_FILE), "w", encoding="utf-8") as f:
+        json.dump(grid, f, indent=2)
+    return grid
+
+
+def load_grid(output_dir):
+
+    """
+    Returns the grid saved for a segmented table, or None if it was never recorded.
+    """
+
+    path = os.path.join(output_dir, GRID_FILE)
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_ocr_grid(output_dir, grid):
+
+    """
+    Records grid as the one the table's current CSV was OCR'd from.
+    """
+
+    with open(os.path.join(output_dir, OCR_GRID_FILE), "w", encoding="utf-8") as f:
+        json.dump(grid, f, indent=2)
+
+
+def load_ocr_grid(output_dir):
+    path = os.path.join(output_dir, OCR_GRID_FILE)
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def diff_grids(old, new):
+
+    """
+    Matches the cells of a new grid to an older grid of the same scan by crop box.
+    Returns {new_cell: old_cell} (0-based (row, col)) for every cell whose box is unchanged;
+    the cells left out need OCR again. Cells keep their match when lines are added or
+    removed elsewhere, even though their indices shift. A different scan, page, image size
+    or rotation changes every box, so nothing matches.
+    """
+
+    if old is None or any(old.get(k) != new.get(k) for k in ("image_path", "page", "image_shape", "rotation")):
+        return {}
+    old_cells = {
+        cell_box(old, r, c): (r, c)
+        for r in range(len(old["row_lines"]) - 1)
+        for c in range(len(old["col_lines"]) - 1)
+    }
+    matches = {}
+    for r in range(len(new["row_lines"]) - 1):
+        for c in range(len(new["col_lines"]) - 1):
+            old_cell = old_cells.get(cell_box(new, r, c))
+            if old_cell is not None:
+                matches[(r, c)] = old_cell
+    return matches
+
+
+def find_cell_image(table_path, row, col):
+
+    """
+    Returns the image of a 0-based cell in whichever of CELL_EXTENSIONS it was written as,
+    or None if the cell has no image.
+    """
+
+    base = os.path.join(table_path, f"row_{row+1}", f"col_{col+1}")
+    for ext in CELL_EXTENSIONS:
+        if os.path.exists(base + ext):
+            return base + ext
+    return None
+
+
+def cell_write_params(path, cell_format=None):
+
+    """
+    Returns the cv2.imwrite parameters for rewriting a cell image in its own format
+    without loss. cell_format names the CELL_FORMATS entry the cells were written as, so
+    png_fast and png_small cells keep their compression level; without it WebP cells stay
+    lossless and PNG cells use the default level.
+    """
+
+    ext = os.path.splitext(path)[1].lower()
+    if cell_format is not None and CELL_FORMATS[cell_format][0] == ext:
+        return CELL_FORMATS[cell_format][1]
+    return next((params for e, params in CELL_FORMATS.values() if e == ext), [])
+
+
+def cell_box(grid, row, col):
+
+    """
+    Returns the (x0, y0, x1, y1) crop box of a 0-based cell in the rotated image.
+    """
+
+    return (grid["col_lines"][col], grid["row_lines"][row],
+            grid["col_lines"][col + 1], grid["row_lines"][row + 1])
+
+
+def cut_cells(full, output_dir, row_lines, col_lines, rotation, metrics,
+              cell_format=DEFAULT_CELL_FORMAT, workers=EXPORT_WORKERS, transform=None):
+
+    """
+    Writes every cell of the grid as output_dir/row_N/col_M.<ext>, cut from a FullResImage
+    rotated by rotation degrees. Lines are full-resolution and include the image edges.
+    cell_format names an entry of CELL_FORMATS. Cells are cropped and encoded on workers
+    threads into a staging folder that replaces the table folder only once every cell is
+    written, so a failed export leaves the previous cells untouched and no cells of an
+    earlier, larger grid are left behind. transform, when given, is applied to each crop
+    before it is written (e.g. payload.sharpen_image). Returns the number of cells written.
+    """
+
+    ext, params = CELL_FORMATS[cell_format]
+    output_dir = os.path.normpath(output_dir)
+    staging = output_dir + ".partial"
+    shutil.rmtree(staging, ignore_errors=True)
+    cells = [(i, j) for i in range(len(row_lines) - 1) for j in range(len(col_lines) - 1)]
+    for i in range(len(row_lines) - 1):
+        os.makedirs(os.path.join(staging, f"row_{i+1}"))
+
+    def export(cell):
+        i, j = cell
+        box = (col_lines[j], row_lines[i], col_lines[j+1], row_lines[i+1])
+        with metrics.stage("crop"):
+            cell_crop = full.rotated_crop(box, rotation)
+        if transform is not None:
+            with metrics.stage("filter"):
+                cell_crop = transform(cell_crop)
+        cell_path = os.path.join(staging, f"row_{i+1}", f"col_{j+1}{ext}")
+        with metrics.stage("encode_write"):
+            if not cv2.imwrite(cell_path, cell_crop, params):
+                raise OSError(f"Could not write cell image: {cell_path}")
+        size = os.path.getsize(cell_path)
+        metrics.count("images_encoded")
+        metrics.count("bytes_written", size)
+        return size
+
+    start = time.perf_counter()
+    try:
+        with metrics.stage("export"), ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            total_bytes = sum(pool.map(export, cells))
+        replace_table_cells(staging, output_dir)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print(f"📦 Exported {len(cells)} cells ({total_bytes / 1e6:.1f} MB, {cell_format}) in {elapsed:.2f}s"
+          f" - {len(cells) / elapsed:.0f} cells/s")
+    return len(cells)
+
+
+def replace_table_cells(staging, output_dir):
+
+    """
+    Swaps a fully written staging folder of row_N/col_M cells in for the table's cells.
+    Everything in output_dir that isn't a cell (grid.json, metrics ...) is carried over,
+    and cells of the previous export, whatever their grid or format, are dropped.
+    """
+
+    if not os.path.isdir(output_dir):
+        os.replace(staging, output_dir)
+        return
+    for name in os.listdir(output_dir):
+        path = os.path.join(output_dir, name)
+        if name.startswith("row_") and os.path.isdir(path):
+            continue
+        if os.path.isdir(path):
+            shutil.copytree(path, os.path.join(staging, name))
+        else:
+            shutil.copy2(path, os.path.join(staging, name))
+    retired = output_dir + ".old"
+    shutil.rmtree(retired, ignore_errors=True)
+    os.replace(output_dir, retired)
+    os.replace(staging, output_dir)
+    shutil.rmtree(retired, ignore_errors=True)
+
+
+def start_segmentation(image_path, output_dir, page=None, metrics=None, cut=True,
+                       cell_format=DEFAULT_CELL_FORMAT, export_workers=EXPORT_WORKERS):
+    # Grid lines are drawn on a reduced-resolution copy; full-resolution pixels are only
+    # read (from a disk-backed map) when the cells are cut out at the end.
+    # page selects one page of a multi-page TIFF or PDF.
+    # Stage timings and counters go to segmentation_metrics.json in output_dir.
+    # With cut False only grid.json is written, for pipeline.stream_table to cut the cells.
+    # Cells are written as cell_format (see CELL_FORMATS) by export_workers threads.
+    # Returns the saved grid, or None if the image could not be read or drawing was canceled.
+    metrics = metrics or RunMetrics(f"segmentation:{os.path.basename(output_dir)}")
+    try:
+        with metrics.stage("decode_display"):
+            img, scale = load_display_image(image_path, page=page)
+    except (OSError, ValueError, EOFError, RuntimeError):
+        img = None
     if img is None:
         print(f"❌ Could not load image: {image_path}")
         return
+    metrics.count("images_decoded")
+    metrics.count("bytes_read", source_bytes(image_path, page))
+    interactive_start = time.perf_counter()
 
-    img_original = img.copy()
     img_copy = img.copy()
     row_lines = []
     col_lines = []
     drawing_mode = ["row"]  # Can be "row", "col", or "rotate"
     rotation_angle = [0.0]  # float for precise angle control
 
+    # Re-segmenting a table starts from its saved grid, so a fix only touches the lines that
+    # need it. Saved lines are kept as exact fractions of display pixels and map back to their
+    # full-resolution values unchanged; only lines drawn now are rounded from the display copy.
+    full_size = page_size(image_path, page) if page is not None else image_size(image_path)
+    saved = load_grid(output_dir)
+    if (saved is not None and saved["image_path"] == os.path.abspath(image_path) and saved.get("page") == page
+            and tuple(saved["image_shape"][:2]) == tuple(full_size)):
+        row_lines = [y / scale for y in saved["row_lines"][1:-1]]
+        col_lines = [x / scale for x in saved["col_lines"][1:-1]]
+        rotation_angle[0] = saved.get("rotation", 0.0)
+        print(f"📂 Loaded the saved grid ({len(row_lines) + 1} rows, {len(col_lines) + 1} columns); adjust only the lines that need it.")
+
     def redraw_lines():
         nonlocal img_copy
         center = (img.shape[1] // 2, img.shape[0] // 2)
         rot_matrix = cv2.getRotationMatrix2D(center, rotation_angle[0], 1.0)
         rotated = cv2.warpAffine(img, rot_matrix, (img.shape[1], img.shape[0]))
         img_copy = rotated.copy()
-        for y in row_lines:
+        for y in map(round, row_lines):
             cv2.line(img_copy, (0, y), (img.shape[1], y), (0, 255, 0), 2)
-        for x in col_lines:
+        for x in map(round, col_lines):
             cv2.line(img_copy, (x, 0), (x, img.shape[0]), (255, 0, 0), 2)
         if drawing_mode[0] == "rotate":
             cv2.putText(img_copy, f"Rotation: {rotation_angle[0]:.2f}", (10, 30),
@@ -46,10 +301,11 @@ def start_segmentation(image_path, output_dir):
                 redraw_lines()
                 cv2.imshow("Draw Grid", img_copy)
             elif event == cv2.EVENT_RBUTTONDOWN:
-                if drawing_mode[0] == "row" and row_lines:
-                    row_lines.pop()
-                elif drawing_mode[0] == "col" and col_lines:
-                    col_lines.pop()
+                lines, pos = (row_lines, y) if drawing_mode[0] == "row" else (col_lines, x)
+                if lines:
+                    # Remove the line under the cursor, otherwise the last one drawn
+                    nearest = min(range(len(lines)), key=lambda i: abs(lines[i] - pos))
+                    lines.pop(nearest if abs(lines[nearest] - pos) <= LINE_PICK_RADIUS else -1)
                 redraw_lines()
                 cv2.imshow("Draw Grid", img_copy)
         
@@ -78,7 +334,7 @@ def start_segmentation(image_path, output_dir):
     cv2.resizeWindow("Draw Grid", 1600, 800)
     cv2.setMouseCallback("Draw Grid", draw_line)
 
-    print("📏 Draw ROW lines (left click to add, right click to undo). Press 'r' to rotate. Press any key to continue to columns.")
+    print("📏 Draw ROW lines (left click to add, right click on a line to remove it or elsewhere to undo). Press 'r' to rotate. Press any key to continue to columns.")
     drawing_mode[0] = "row"
     redraw_lines()
     cv2.imshow("Draw Grid", img_copy)
@@ -123,24 +379,34 @@ def start_segmentation(image_path, output_dir):
             break
 
     cv2.destroyAllWindows()
+    metrics.add_time("interactive", time.perf_counter() - interactive_start)
+
+    if cut:
+        with metrics.stage("decode_full"):
+            full = FullResImage(image_path, page=page)
+        metrics.count("images_decoded")
+        height, width = full.shape[:2]
+    else:
+        full = None
+        height, width = full_size
 
-    row_lines = sorted(set(row_lines))
-    col_lines = sorted(set(col_lines))
+    # Map lines drawn on the display copy back to full-resolution pixels
+    row_lines = sorted({min(int(round(y * scale)), height) for y in row_lines} - {0, height})
+    col_lines = sorted({min(int(round(x * scale)), width) for x in col_lines} - {0, width})
     row_lines.insert(0, 0)
-    row_lines.append(img.shape[0])
+    row_lines.append(height)
     col_lines.insert(0, 0)
-    col_lines.append(img.shape[1])
+    col_lines.append(width)
 
-    center = (img.shape[1] // 2, img.shape[0] // 2)
-    rot_matrix = cv2.getRotationMatrix2D(center, rotation_angle[0], 1.0)
-    rotated_img = cv2.warpAffine(img, rot_matrix, (img.shape[1], img.shape[0]))
+    if full is not None:
+        with full:
+            cut_cells(full, output_dir, row_lines, col_lines, rotation_angle[0], metrics,
+                      cell_format, export_workers)
 
-    for i in range(len(row_lines) - 1):
-        row_folder = os.path.join(output_dir, f"row_{i+1}")
-        os.makedirs(row_folder, exist_ok=True)
-        for j in range(len(col_lines) - 1):
-            cell_crop = rotated_img[row_lines[i]:row_lines[i+1], col_lines[j]:col_lines[j+1]]
-            cell_path = os.path.join(row_folder, f"col_{j+1}.png")
-            cv2.imwrite(cell_path, cell_crop)
-
-    print(f"✅ Saved {len(row_lines)-1} rows and {len(col_lines)-1} columns to {output_dir}")
+    grid = save_grid(output_dir, image_path, (height, width), row_lines, col_lines, rotation_angle[0], page)
+    metrics.write_json(os.path.join(output_dir, SEGMENTATION_METRICS_FILE))
+    if cut:
+        print(f"✅ Saved {len(row_lines)-1} rows and {len(col_lines)-1} columns to {output_dir}")
+    else:
+        print(f"✅ Saved a {len(row_lines)-1} x {len(col_lines)-1} grid to {output_dir}")
+    return grid
@@ -177,6 +177,9 @@ def test_load_cell(monkeypatch, tmp_path):
     gui.col_idx = 0
     gui.image_panel = mock.Mock()
     gui.current_csv = pd.DataFrame([["a", "b"], ["c", "d"]])
+    gui.shared_cells = {}
+    gui.accepted_cells = set()
+    gui.full_image = None
 
     # Test when image does not exist
     monkeypatch.setattr("os.path.exists", lambda path: False)
@@ -227,4 +230,800 @@ def test_min_max_std_validation():
 
     # Test value outside std threshold
     gui.std_thresh.get.return_value = "0.1"  # Very strict
-    assert gui.validate_value("18", values_list) is False
\ No newline at end of file
+    assert gui.validate_value("18", values_list) is False
+
+def test_validate_frame_with_profile():
+    """Test per-column dtype, range, regex and allowed-token rules."""
+    from validation import validate_frame, find_std_outliers
+
+    df = pd.DataFrame([
+        ["1893", "45", "x", "A1"],
+        ["1894.5", "120", "nan", "b2"],
+        ["1895", "", "12", "A3"],
+    ])
+    profile = {
+        "name": "test",
+        "columns": {
+            "0": {"dtype": "int", "min": 1800, "max": 2100},
+            "1": {"dtype": "float", "min": -50, "max": 99},
+            "2": {"dtype": "float", "allow": ["x"]},
+            "3": {"dtype": "str", "regex": r"[A-Z]\d"},
+        },
+    }
+    mask = validate_frame(df, profile)
+    expected = [
+        [False, False, False, False],
+        [True, True, True, True],
+        [False, True, False, False],
+    ]
+    assert mask.tolist() == expected
+
+    # Ignoring NaN accepts the "nan" cell in column 2
+    assert not validate_frame(df, profile, ignore_nan=True)[1, 2]
+
+    numeric = pd.DataFrame([[1, 10], [2, 10], [3, 10], [4, 10], [5, 500]]).astype(str)
+    outliers = find_std_outliers(numeric, 1.5, skip_columns=[0])
+    assert outliers[:, 0].sum() == 0
+    assert outliers[4, 1]
+
+
+def test_load_next_invalid_cell_uses_mask():
+    """Test that the checker jumps straight to the next invalid cell."""
+    gui = OCRCheckerGUI.__new__(OCRCheckerGUI)
+    gui.current_csv = pd.DataFrame([["1", "2", "abc"], ["4", "", "6"]])
+    gui.profile = None
+    gui.invalid_mask = None
+    gui.validation_key = None
+    gui.use_min_max = mock.Mock(get=mock.Mock(return_value=False))
+    gui.min_val = mock.Mock(get=mock.Mock(return_value="-50"))
+    gui.max_val = mock.Mock(get=mock.Mock(return_value="99"))
+    gui.ignore_nan_var = mock.Mock(get=mock.Mock(return_value=False))
+    gui.checking_outliers = False
+    gui.outlier_indices = set()
+    gui.accepted_cells = set()
+    gui.row_idx = 0
+    gui.col_idx = 0
+    gui.load_cell = mock.Mock()
+
+    gui.load_next_invalid_cell()
+    assert (gui.row_idx, gui.col_idx) == (0, 2)
+    gui.col_idx += 1
+    gui.load_next_invalid_cell()
+    assert (gui.row_idx, gui.col_idx) == (1, 1)
+
+
+def test_cross_table_consistency(tmp_path):
+    """Test max < min, duplicate year and impossible day checks across a csv_outputs folder."""
+    from consistency import check_folder
+
+    csv_dir = tmp_path / "april" / "csv_outputs"
+    csv_dir.mkdir(parents=True)
+    max_row = ["1893"] + ["50"] * 31
+    max_row[31] = "40"  # April 31st does not exist
+    dup_row = ["1893"] + ["1"] * 30 + [""]
+    pd.DataFrame([max_row, dup_row]).to_csv(csv_dir / "daily_max_1893_1912.PNG.csv", index=False, header=False)
+    min_row = ["1893", "60"] + ["10"] * 29 + [""]
+    pd.DataFrame([min_row]).to_csv(csv_dir / "daily_min_1893_1912.PNG.csv", index=False, header=False)
+
+    findings = check_folder(str(csv_dir))
+    messages = {(os.path.basename(f.csv_path), f.row, f.col): f.message for f in findings}
+
+    assert ("daily_max_1893_1912.PNG.csv", 0, 31) in messages
+    assert ("daily_max_1893_1912.PNG.csv", 1, 0) in messages
+    assert ("daily_max_1893_1912.PNG.csv", 0, 1) in messages
+    assert ("daily_min_1893_1912.PNG.csv", 0, 1) in messages
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_columnar_roundtrip(tmp_path, fmt):
+    """Test columnar output keeps raw text, provenance and reviewed values."""
+    pytest.importorskip("pyarrow")
+    from segmentation import save_grid
+    from columnar import build_table, write_table, read_table, to_grid_frame, update_reviewed, columnar_path
+
+    table_path = tmp_path / "table"
+    save_grid(str(table_path), "scan.png", (100, 60), [0, 50, 100], [0, 20, 60], 0.5)
+    data = [["1893", "4S"], ["1894", ""]]
+    path = columnar_path(str(tmp_path), "table", fmt)
+    write_table(build_table(data, str(table_path)), path)
+
+    table = read_table(path)
+    assert table.column("x1").to_pylist() == [20, 60, 20, 60]
+    assert table.column("y0").to_pylist() == [0, 0, 50, 50]
+    assert table.column("value").to_pylist()[0] == 1893.0
+    frame = to_grid_frame(table)
+    assert frame.iat[0, 1] == "4S"
+    assert pd.isna(frame.iat[1, 1])
+
+    frame.iat[0, 1] = "45"
+    update_reviewed(path, frame)
+    table = read_table(path)
+    assert table.column("raw_text").to_pylist()[1] == "4S"
+    assert table.column("reviewed").to_pylist()[1] == "45"
+    assert table.column("value").to_pylist()[1] == 45.0
+
+
+def test_full_res_rotated_crop_matches_full_warp(tmp_path):
+    """Test that cropping from the disk-backed scan matches rotating the whole image."""
+    from scan_io import FullResImage
+
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 255, (300, 400, 3), dtype=np.uint8)
+    path = str(tmp_path / "scan.png")
+    cv2.imwrite(path, img)
+
+    angle = 1.75
+    rot = cv2.getRotationMatrix2D((200, 150), angle, 1.0)
+    rotated = cv2.warpAffine(img, rot, (400, 300))
+    with FullResImage(path, cache_dir=str(tmp_path)) as full:
+        for box in [(0, 0, 50, 40), (120, 90, 260, 200), (350, 260, 400, 300)]:
+            crop = full.rotated_crop(box, angle)
+            expected = rotated[box[1]:box[3], box[0]:box[2]]
+            assert crop.shape == expected.shape
+            assert np.abs(crop.astype(int) - expected.astype(int)).max() <= 1
+        assert np.array_equal(full.rotated_crop((10, 20, 30, 40), 0), img[20:40, 10:30])
+    assert not list(tmp_path.glob("*.npy"))
+
+
+def test_full_res_image_decodes_each_mode_into_the_map(tmp_path):
+    """Test that grayscale, bilevel and palette scans are stored compactly and crop to BGR like cv2."""
+    from PIL import Image
+    from scan_io import FullResImage
+
+    rng = np.random.default_rng(1)
+    img = rng.integers(0, 255, (120, 160, 3), dtype=np.uint8)
+    Image.fromarray(img[..., 0]).save(tmp_path / "gray.png")
+    Image.fromarray(img[..., 0] > 128).save(tmp_path / "bilevel.tiff", compression="group4")
+    Image.fromarray(img[..., ::-1]).convert("P").save(tmp_path / "palette.png")
+    for name in ["gray.png", "bilevel.tiff", "palette.png"]:
+        path = str(tmp_path / name)
+        with FullResImage(path, cache_dir=str(tmp_path)) as full:
+            assert full.pixels.ndim == 2
+            assert full.shape == (120, 160, 3)
+            assert np.array_equal(full.crop(5, 10, 90, 100), cv2.imread(path, cv2.IMREAD_COLOR)[10:100, 5:90])
+
+
+def test_load_display_image_reduces_compressed_tiff(tmp_path):
+    """Test that large compressed TIFF scans are decoded at reduced resolution for display."""
+    from PIL import Image
+    from scan_io import load_display_image
+
+    path = str(tmp_path / "folio.tiff")
+    Image.new("RGB", (2400, 1600), "white").save(path, compression="tiff_lzw")
+    img, scale = load_display_image(path, max_side=1000)
+    assert max(img.shape[:2]) <= 1000
+    assert scale == pytest.approx(2400 / img.shape[1])
+
+
+def test_multipage_tiff_pages_are_tables(tmp_path):
+    """Test that every page of a multi-page TIFF is listed and read as its own table."""
+    from PIL import Image
+    from pages import list_tables, read_page, iter_pages, source_bytes
+
+    folder = tmp_path / "april"
+    folder.mkdir()
+    first = Image.new("RGB", (120, 80), (10, 10, 10))
+    second = Image.new("RGB", (100, 60), (200, 200, 200))
+    first.save(folder / "ledger.tiff", save_all=True, append_images=[second], compression="tiff_deflate")
+    Image.new("RGB", (50, 50)).save(folder / "single.png")
+
+    tables = list_tables(str(tmp_path), "april")
+    assert [(t, p) for t, _, p in tables] == [("ledger.tiff_page_1", 0), ("ledger.tiff_page_2", 1), ("single.png", None)]
+
+    page = read_page(str(folder / "ledger.tiff"), 1)
+    assert page.shape == (60, 100, 3)
+    assert page[0, 0, 0] == 200
+    assert [img.shape[:2] for _, img in iter_pages(str(folder / "ledger.tiff"), max_side=60)] == [(40, 60), (36, 60)]
+    # A page's metrics count that page's pixels, not the whole document once per page
+    assert source_bytes(str(folder / "ledger.tiff"), 1) == 60 * 100 * 3
+    assert source_bytes(str(folder / "single.png")) == os.path.getsize(folder / "single.png")
+
+
+def test_run_ocr_on_table_writes_metrics(tmp_path, monkeypatch):
+    """Test that an OCR run emits per-stage timings and counters, retrying transient errors."""
+    import json
+    import ocr_processor
+    from google.api_core.exceptions import ServiceUnavailable
+
+    table_path = tmp_path / "table"
+    for r in (1, 2):
+        (table_path / f"row_{r}").mkdir(parents=True)
+        for c in (1, 2):
+            cv2.imwrite(str(table_path / f"row_{r}" / f"col_{c}.png"), np.full((10, 10, 3), 255, np.uint8))
+
+    calls = []
+
+    def text_detection(image, image_context):
+        calls.append(1)
+        if len(calls) == 1:
+            raise ServiceUnavailable("try again")
+        return mock.Mock(text_annotations=[mock.Mock(description=f"{len(calls)} ")])
+
+    monkeypatch.setattr(ocr_processor, "_get_vision_client", lambda: mock.Mock(text_detection=text_detection))
+    monkeypatch.setattr(ocr_processor.time, "sleep", lambda s: None)
+
+    csv_dir = tmp_path / "csv_outputs"
+    ocr_processor.run_ocr_on_table(str(table_path), str(csv_dir), "april", "table", profile=True)
+
+    assert pd.read_csv(csv_dir / "table.csv", header=None).shape == (2, 2)
+    metrics = json.loads((csv_dir / "table.metrics.json").read_text())
+    assert metrics["counters"]["api_calls"] == 5
+    assert metrics["counters"]["retries"] == 1
+    assert metrics["counters"]["bytes_uploaded"] > 0
+    assert metrics["stages"]["vision_request"]["calls"] == 5
+    assert metrics["estimated_api_cost_usd"] > 0
+    assert (csv_dir / "table.prof").exists()
+
+
+def test_upload_presets_shrink_payload(tmp_path):
+    """Test that upload presets trim to the ink, drop grid lines and skip blank cells."""
+    from payload import prepare_for_upload, encode_for_upload, encode_file_for_upload, benchmark_presets
+
+    cell = np.full((120, 200, 3), 235, np.uint8)
+    cv2.line(cell, (0, 115), (199, 115), (40, 40, 40), 2)  # residual grid line
+    cv2.putText(cell, "42", (80, 70), cv2.FONT_HERSHEY_SIMPLEX, 1, (20, 20, 20), 2)
+    path = str(tmp_path / "col_1.png")
+    cv2.imwrite(path, cell)
+
+    compact = prepare_for_upload(cell, "compact")
+    assert compact.ndim == 2
+    assert compact.shape[0] < 60 and compact.shape[1] < 80
+    assert len(encode_for_upload(cell, "bilevel")) < len(encode_file_for_upload(path, "raw"))
+    assert encode_file_for_upload(path, "raw") == open(path, "rb").read()
+
+    blank = np.full((40, 40, 3), 235, np.uint8)
+    cv2.line(blank, (0, 38), (39, 38), (40, 40, 40), 1)
+    assert encode_for_upload(blank, "compact_skip_blank") is None
+    assert encode_for_upload(blank, "compact") is not None
+
+    # Presets are benchmarked against raw, wherever raw appears in the list
+    client = mock.Mock()
+    client.text_detection.return_value = mock.Mock(text_annotations=[mock.Mock(description="42")])
+    results = benchmark_presets(str(tmp_path), client, ["gray", "raw"])
+    assert [r["preset"] for r in results] == ["raw", "gray"]
+    assert results[1]["agreement_with_raw"] == 1.0
+
+    # A clean two-tone crop: every dark pixel sits exactly at Otsu's threshold
+    two_tone = np.full((40, 60, 3), 235, np.uint8)
+    two_tone[12:28, 20:26] = 20
+    assert encode_for_upload(two_tone, "compact_skip_blank") is not None
+
+
+def test_dedup_shares_results_between_identical_cells(tmp_path, monkeypatch):
+    """Test that near-identical cells reuse one OCR request and are recorded for the checker."""
+    import ocr_processor
+    from dedup import HammingIndex, load_shared_cells
+
+    index = HammingIndex(3)
+    index.add(0b1011 << 40, "a")
+    index.add((1 << 64) - 1, "b")
+    assert [item for _, item in index.query((0b1011 << 40) | 0b111)] == ["a"]
+    assert index.query(0b1011 << 40 | 0b1111) == []
+
+    table_path = tmp_path / "table"
+    for r in (1, 2):
+        (table_path / f"row_{r}").mkdir(parents=True)
+    ditto = np.full((40, 60, 3), 235, np.uint8)
+    cv2.putText(ditto, "11", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (20, 20, 20), 2)
+    other = np.full((40, 60, 3), 235, np.uint8)
+    cv2.circle(other, (30, 20), 12, (20, 20, 20), 3)
+    blank = np.full((40, 60, 3), 235, np.uint8)
+    for r in (1, 2):
+        cv2.imwrite(str(table_path / f"row_{r}" / "col_1.png"), ditto)
+        cv2.imwrite(str(table_path / f"row_{r}" / "col_2.png"), other if r == 1 else blank)
+    cv2.imwrite(str(table_path / "row_1" / "col_3.png"), blank)
+
+    client = mock.Mock()
+    client.text_detection.side_effect = lambda image, image_context: mock.Mock(
+        text_annotations=[mock.Mock(description=str(client.text_detection.call_count))]
+    )
+    monkeypatch.setattr(ocr_processor, "_get_vision_client", lambda: client)
+
+    csv_dir = tmp_path / "csv"
+    ocr_processor.run_ocr_on_table(str(table_path), str(csv_dir), "april", "table", dedup_threshold=4)
+
+    assert client.text_detection.call_count == 3
+    df = pd.read_csv(csv_dir / "table.csv", header=None, dtype=str)
+    assert df.iat[1, 0] == df.iat[0, 0]
+    assert df.iat[1, 1] == df.iat[0, 2]
+    shared = load_shared_cells(str(csv_dir / "table.dedup.json"))
+    assert shared == {(1, 0): (0, 0), (1, 1): (0, 2)}
+
+
+def test_mosaic_routes_words_back_to_cells(tmp_path):
+    """Test that cells packed onto mosaic canvases get back the words detected over them."""
+    from mosaic import plan_mosaics, ocr_cells_mosaic, fit_to_canvas
+
+    canvases = plan_mosaics([(30, 50)] * 5, max_width=200, max_cells=4, gutter=10)
+    assert [len(placement) for _, _, placement in canvases] == [4, 1]
+    assert canvases[0][2][:3] == [(0, 10, 10), (1, 70, 10), (2, 130, 10)]
+    assert canvases[0][2][3] == (3, 10, 50)
+
+    # A cell larger than an empty canvas is shrunk rather than overflowing it
+    big = fit_to_canvas(np.zeros((500, 120, 3), np.uint8), max_width=200, max_height=200, gutter=10)
+    assert big.shape[0] <= 180 and big.shape[1] <= 180
+    assert plan_mosaics([big.shape[:2]], max_width=200, max_height=200, gutter=10)[0][0] <= 200
+
+    # Each cell is a solid block of its own gray level; the fake client reads the level back
+    cells = []
+    for i, level in enumerate((20, 60, 100, 140, 180)):
+        img = np.full((30 + 5 * i, 50, 3), level, np.uint8)
+        path = str(tmp_path / f"col_{i}.png")
+        cv2.imwrite(path, img)
+        cells.append(((0, i), path))
+
+    def fake_detection(image, image_context):
+        canvas = cv2.imdecode(np.frombuffer(image.content, np.uint8), cv2.IMREAD_GRAYSCALE)
+        n, labels, stats, _ = cv2.connectedComponentsWithStats((canvas < 250).astype(np.uint8))
+        words = [mock.Mock(description="full text")]
+        for label in range(1, n):
+            x, y, w, h = stats[label][:4]
+            level = int(canvas[labels == label][0])
+            vertices = [mock.Mock(x=vx, y=vy) for vx, vy in ((x, y), (x + w, y), (x + w, y + h), (x, y + h))]
+            words.append(mock.Mock(description=str(level), bounding_poly=mock.Mock(vertices=vertices)))
+        return mock.Mock(text_annotations=words)
+
+    client = mock.Mock()
+    client.text_detection.side_effect = fake_detection
+    texts = ocr_cells_mosaic(cells[::2] + cells[1::2], client, max_cells=3)
+
+    assert client.text_detection.call_count == 2
+    assert texts == {(0, i): str(level) for i, level in enumerate((20, 60, 100, 140, 180))}
+
+
+def test_job_runner_reports_progress_and_cancels(tmp_path, monkeypatch):
+    """Test that background jobs report progress on the UI thread and that cancelling OCR writes nothing."""
+    import threading
+    import ocr_processor
+    from jobs import JobRunner, JobCancelled, check_cancel, format_progress
+
+    assert format_progress(50, 150, 10.0) == "50/150 cells - 5.0 cells/s - ETA 20s"
+
+    root = mock.Mock()
+    seen, results = [], []
+    runner = JobRunner(root, on_progress=lambda job: seen.append((job.name, job.done, job.total)))
+    reported, release = threading.Event(), threading.Event()
+
+    def work(progress, cancel):
+        for i in range(1, 4):
+            progress(i, 3)
+        reported.set()
+        release.wait(5)
+        check_cancel(cancel)
+        return "ok"
+
+    first = runner.submit("first", work, on_cancel=lambda: results.append("first cancelled"))
+    runner.submit("second", work, on_cancel=lambda: results.append("second cancelled"))
+    reported.wait(5)
+    assert runner.queued() == ["second"]
+    runner.poll()
+    assert seen == [("first", 3, 3)]
+
+    runner.cancel()
+    release.set()
+    first.finished.wait(5)
+    runner.poll()
+    assert results == ["second cancelled", "first cancelled"]
+    assert root.after.called
+
+    table_path = tmp_path / "table" / "row_1"
+    table_path.mkdir(parents=True)
+    for c in (1, 2, 3):
+        cv2.imwrite(str(table_path / f"col_{c}.png"), np.full((20, 20, 3), 200, np.uint8))
+    cancel = threading.Event()
+    client = mock.Mock()
+    client.text_detection.side_effect = lambda image, image_context: (cancel.set(), mock.Mock(text_annotations=[]))[1]
+    monkeypatch.setattr(ocr_processor, "_get_vision_client", lambda: client)
+    progress = mock.Mock()
+    with pytest.raises(JobCancelled):
+        ocr_processor.run_ocr_on_table(str(tmp_path / "table"), str(tmp_path / "csv"), "april", "table",
+                                       progress=progress, cancel=cancel)
+    assert client.text_detection.call_count == 1
+    progress.assert_called_once_with(1, 3)
+    assert not (tmp_path / "csv" / "table.csv").exists()
+
+
+def test_job_server_runs_table_jobs_offline(tmp_path, monkeypatch):
+    """Test that the job server OCRs a scan plus grid with the fake backend and caches repeated cells."""
+    import json
+    import threading
+    import job_server
+    from job_server import OCRJobService, FakeOCRBackend, JobClient, make_server, run_table_on_server
+    from segmentation import save_grid, load_grid, load_ocr_grid
+
+    scan = np.full((60, 90, 3), 255, np.uint8)
+    scan[:30, :30] = 40
+    scan[30:, 60:] = 40
+    image_path = str(tmp_path / "scan.png")
+    cv2.imwrite(image_path, scan)
+    table_path = tmp_path / "output" / "april" / "scan.png"
+    save_grid(str(table_path), image_path, scan.shape, [0, 30, 60], [0, 30, 60, 90], 0)
+
+    backend = FakeOCRBackend()
+    service = OCRJobService(backend, workers=4, rate=None)
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = JobClient(f"http://127.0.0.1:{server.server_address[1]}")
+        csv_path = run_table_on_server(client.base_url, str(table_path), str(tmp_path / "csv"), "scan.png")
+        df = pd.read_csv(csv_path, header=None, dtype=str)
+        assert df.values.tolist() == [["40", "255", "255"], ["255", "255", "40"]]
+        # Only two distinct crops exist, so everything else came from the shared cache
+        assert backend.calls == 2
+        assert client.stats()["counters"]["cache_hits"] == 4
+        assert load_ocr_grid(str(table_path)) == load_grid(str(table_path))
+        metrics = json.loads((tmp_path / "csv" / "scan.png.metrics.json").read_text())
+        assert metrics["counters"]["api_calls"] == 2
+        assert metrics["counters"]["cache_hits"] == 4
+
+        # Only the latest finished jobs are kept once new ones arrive
+        monkeypatch.setattr(job_server, "MAX_FINISHED_JOBS", 1)
+        first = [job["id"] for job in client._request("GET", "/jobs")["jobs"]]
+        job_id = client.submit({"table": "again", "table_path": str(table_path)})
+        assert client.wait(job_id, poll_interval=0.01) == df.values.tolist()
+        assert backend.calls == 2
+        client.submit({"table": "third", "table_path": str(table_path), "sharpen": False})
+        ids = [job["id"] for job in client._request("GET", "/jobs")["jobs"]]
+        assert first[0] not in ids and job_id in ids
+        with pytest.raises(RuntimeError, match="404"):
+            client.status("missing")
+        with pytest.raises(RuntimeError, match="400"):
+            client.submit({"table": "no grid"})
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.shutdown()
+
+
+def test_climatology_index_scores_cells_against_history(tmp_path):
+    """Test incremental histogram updates, save/load and percentile scoring against other years."""
+    from climatology import ClimatologyIndex, build_index, index_path
+
+    rng = np.random.default_rng(0)
+    csv_dir = tmp_path / "april" / "csv_outputs"
+    csv_dir.mkdir(parents=True)
+    for start in (1873, 1893):
+        years = np.arange(start, start + 20)
+        days = rng.normal(60, 5, size=(20, 31)).round(1)
+        pd.DataFrame(np.column_stack([years, days])).to_csv(csv_dir / f"daily_max_{start}_{start + 19}.PNG.csv", index=False, header=False)
+    index = build_index(str(tmp_path))
+    assert len(index.contributions) == 2
+
+    index = ClimatologyIndex.load(index_path(str(tmp_path)))
+    total = index.counts.sum()
+    current = pd.DataFrame([["1913"] + ["60"] * 29 + ["95", "20"]])
+    index.update_table("april/daily_max_1913_1932.PNG", "daily_max", 4, current)
+    index.update_table("april/daily_max_1913_1932.PNG", "daily_max", 4, current)
+    assert index.counts.sum() == total + 2 * 31  # day columns count once per day and once in the pool
+
+    scorer = index.scorer("daily_max", 4, current.shape[1], exclude="april/daily_max_1913_1932.PNG")
+    pct = scorer.percentiles(current)
+    assert np.isnan(pct[0, 0])  # the year column is never scored
+    assert 0.2 < pct[0, 1] < 0.8
+    outliers = scorer.outliers(current, tail=0.01)
+    assert outliers[0].tolist() == [False] * 30 + [True, True]
+    # Nothing learned about a series that was never indexed
+    assert np.isnan(index.scorer("daily_min", 4, 32).percentiles(current)).all()
+
+
+def test_grid_propagates_to_shifted_page(tmp_path):
+    """Test that a reference grid is registered onto a rotated, scaled and shifted copy of its page."""
+    import json
+    from segmentation import save_grid, load_grid
+    from registration import propagate_grid
+
+    rng = np.random.default_rng(1)
+    height, width = 800, 1200
+    ref = np.full((height, width, 3), 235, np.uint8)
+    rows, cols = list(range(100, 750, 50)), list(range(75, 1150, 75))
+    for y in rows:
+        cv2.line(ref, (50, y), (1175, y), (40, 40, 40), 2)
+    for x in cols:
+        cv2.line(ref, (x, 75), (x, 775), (40, 40, 40), 2)
+    for _ in range(100):
+        org = (int(rng.integers(75, 1125)), int(rng.integers(100, 750)))
+        cv2.putText(ref, str(rng.integers(10, 99)), org, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (30, 30, 30), 1)
+    cv2.imwrite(str(tmp_path / "ref.png"), ref)
+    save_grid(str(tmp_path / "out" / "ref.png"), str(tmp_path / "ref.png"), ref.shape, [0] + rows + [height], [0] + cols + [width], 0)
+
+    tilt = cv2.getRotationMatrix2D((width // 2, height // 2), 1.2, 1.02)
+    tilt[:, 2] += (12, -9)
+    cv2.imwrite(str(tmp_path / "new.png"), cv2.warpAffine(ref, tilt, (width + 30, height + 20), borderValue=(235, 235, 235)))
+    cv2.imwrite(str(tmp_path / "other.png"), np.full((height, width, 3), 235, np.uint8))
+    # Shifted up past the top edge: the first row lines would have to be clamped and merged
+    shifted = cv2.warpAffine(ref, np.float32([[1, 0, 0], [0, 1, -130]]), (width, height), borderValue=(235, 235, 235))
+    cv2.imwrite(str(tmp_path / "shifted.png"), shifted)
+
+    names = ("new.png", "other.png", "shifted.png")
+    targets = [(name, str(tmp_path / name), None, str(tmp_path / "out" / name)) for name in names]
+    results = propagate_grid(str(tmp_path / "out" / "ref.png"), targets)
+    assert [r["status"] for r in results] == ["aligned", "manual", "manual"]
+    assert results[2]["score"] > 0.9 and load_grid(str(tmp_path / "out" / "shifted.png")) is None
+    assert results[0]["score"] > 0.9
+    assert abs(results[0]["rotation"] + 1.2) < 0.1
+
+    # Every propagated line sits on ruling of the straightened new page
+    grid = load_grid(str(tmp_path / "out" / "new.png"))
+    new = cv2.imread(str(tmp_path / "new.png"), cv2.IMREAD_GRAYSCALE)
+    turn = cv2.getRotationMatrix2D((new.shape[1] // 2, new.shape[0] // 2), grid["rotation"], 1.0)
+    straight = cv2.warpAffine(new, turn, new.shape[::-1])
+    assert all(straight[y - 2:y + 3, 600].min() < 100 for y in grid["row_lines"][1:-1])
+    assert all(straight[400, x - 2:x + 3].min() < 100 for x in grid["col_lines"][1:-1])
+    assert (tmp_path / "out" / "new.png" / "row_14" / "col_15.png").exists()
+    assert load_grid(str(tmp_path / "out" / "other.png")) is None
+    metrics = json.loads((tmp_path / "out" / "new.png" / "segmentation_metrics.json").read_text())
+    assert metrics["stages"]["filter"]["calls"] == 14 * 16  # every propagated cell was sharpened
+
+
+def test_stream_table_writes_rows_in_order(tmp_path):
+    """Test that the streaming pipeline OCRs every cell into an ordered CSV and leaves nothing when cancelled."""
+    import threading
+    from jobs import JobCancelled
+    from pipeline import stream_table
+    from segmentation import save_grid
+
+    scan = np.full((90, 120, 3), 255, np.uint8)
+    for r in range(3):
+        for c in range(4):
+            scan[r * 30 + 5:r * 30 + 25, c * 30 + 5:c * 30 + 5 + 2 * (r * 4 + c + 1)] = 0
+    image_path = str(tmp_path / "scan.png")
+    cv2.imwrite(image_path, scan)
+    grid = save_grid(str(tmp_path / "out"), image_path, scan.shape, [0, 30, 60, 90], [0, 30, 60, 90, 120], 0)
+
+    def ink_width(image, image_context):
+        gray = cv2.imdecode(np.frombuffer(image.content, np.uint8), cv2.IMREAD_GRAYSCALE)
+        return mock.Mock(text_annotations=[mock.Mock(description=str(int((gray < 128).any(axis=0).sum())))])
+
+    client = mock.Mock()
+    client.text_detection.side_effect = ink_width
+    csv_path = stream_table(image_path, grid, str(tmp_path / "csv"), "scan", client, sharpen=False,
+                            ocr_workers=4, queue_size=2, write_cells_to=str(tmp_path / "cells"))
+    df = pd.read_csv(csv_path, header=None)
+    assert df.values.tolist() == [[2 * (r * 4 + c + 1) for c in range(4)] for r in range(3)]
+    assert (tmp_path / "cells" / "row_3" / "col_4.png").exists()
+
+    # Switching format replaces the cell tree instead of leaving PNGs next to the WebPs
+    stream_table(image_path, grid, str(tmp_path / "csv"), "scan", client, cell_format="webp",
+                 write_cells_to=str(tmp_path / "cells"))
+    assert sorted(os.listdir(tmp_path / "cells" / "row_3")) == ["col_1.webp", "col_2.webp", "col_3.webp", "col_4.webp"]
+
+    cancel = threading.Event()
+    with pytest.raises(JobCancelled):
+        stream_table(image_path, grid, str(tmp_path / "csv"), "cancelled", client, queue_size=2,
+                     write_cells_to=str(tmp_path / "cells"), progress=lambda done, total: cancel.set(), cancel=cancel)
+    assert sorted(os.listdir(tmp_path / "csv")) == ["scan.csv", "scan.metrics.json"]
+    assert not (tmp_path / "cells.partial").exists()
+    assert (tmp_path / "cells" / "row_3" / "col_4.webp").exists()
+
+    # An error in the main loop (here the progress callback) cleans up the same way
+    def broken(done, total):
+        raise RuntimeError("progress display failed")
+
+    with pytest.raises(RuntimeError):
+        stream_table(image_path, grid, str(tmp_path / "csv"), "broken", client, queue_size=2,
+                     write_cells_to=str(tmp_path / "cells"), progress=broken)
+    assert sorted(os.listdir(tmp_path / "csv")) == ["scan.csv", "scan.metrics.json"]
+    assert not (tmp_path / "cells.partial").exists()
+
+    # Without cell images the checker cuts cells from the scan, sharpened like the OCR'd ones,
+    # reading grid.json only once for the table
+    import error_checker_gui
+    from payload import sharpen_image
+    gui = OCRCheckerGUI.__new__(OCRCheckerGUI)
+    gui.table_path = str(tmp_path / "out")
+    gui.full_image = None
+    with mock.patch.object(error_checker_gui, "load_grid", wraps=error_checker_gui.load_grid) as loads:
+        cells = [gui.cell_image(1, c) for c in range(4)]
+    assert loads.call_count == 1
+    assert np.array_equal(cells[2], sharpen_image(scan[30:60, 60:90]))
+    gui.close_scan()
+
+
+def test_bulk_edit_previews_applies_and_undoes():
+    """Test the vectorized bulk edits, their preview, undo, and the checker's Add Decimal Prefix."""
+    from bulk_edit import EditHistory, insert_decimal, substitute_characters, scale, parse_index_list, selection_mask, preview
+
+    df = pd.DataFrame([["1893", "12", "-5", "3.4"], ["1894", "lO", "abc", None]], dtype=object)
+    everything = selection_mask(df.shape, cols=parse_index_list("2-4", df.shape[1]))
+
+    edit = preview(df, insert_decimal(), everything)
+    assert sorted(zip(edit.rows.tolist(), edit.cols.tolist(), edit.new.tolist())) == [(0, 1, ".12"), (0, 2, "-.5")]
+    assert df.iat[0, 1] == "12"  # Previewing leaves the frame alone
+    assert preview(df, insert_decimal(1), everything).new.tolist() == ["1.2", "-0.5"]
+    assert preview(df, substitute_characters(), everything).new.tolist() == ["10"]
+    assert preview(df, scale(10), selection_mask(df.shape, rows=[0], cols=[3])).new.tolist() == ["34"]
+    assert preview(df, scale(0.5, 2), selection_mask(df.shape, rows=[0], cols=[3])).new.tolist() == ["1.70"]
+    padded = pd.DataFrame([[" 12", "7 "]], dtype=object)
+    assert preview(padded, insert_decimal(), np.ones(padded.shape, bool)).new.tolist() == [".12", ".7"]
+
+    history = EditHistory()
+    history.apply(df, edit)
+    assert df.iloc[0].tolist() == ["1893", ".12", "-.5", "3.4"]
+    assert history.undo(df) == (edit, [])
+    assert df.iloc[0].tolist() == ["1893", "12", "-5", "3.4"] and df.iat[1, 3] is None
+    assert history.undo(df) is None
+
+    # A cell corrected after the bulk edit keeps the correction when the edit is undone
+    history.apply(df, edit)
+    df.iat[0, 2] = "-6"
+    assert history.undo(df) == (edit, [(0, 2)])
+    assert df.iloc[0].tolist() == ["1893", "12", "-6", "3.4"]
+    df.iat[0, 2] = "-5"
+
+    gui = OCRCheckerGUI.__new__(OCRCheckerGUI)
+    gui.current_csv = df
+    gui.edit_history = history
+    gui.refresh_validation = mock.Mock()
+    gui.find_outliers = mock.Mock()
+    gui.update_csv_display = mock.Mock()
+    with mock.patch("error_checker_gui.messagebox") as box:
+        box.askyesno.return_value = True
+        gui.add_decimal_prefix()
+        assert "2 value(s)" in box.askyesno.call_args[0][1]
+    assert df.iloc[0].tolist() == ["1893", ".12", "-.5", "3.4"]
+    assert len(history.stack) == 1
+
+
+def test_incremental_ocr_only_rereads_changed_cells(tmp_path, monkeypatch):
+    """Test that re-OCR after a grid fix only sends moved cells and keeps reviewed values."""
+    import ocr_processor
+    from metrics import RunMetrics
+    from scan_io import FullResImage
+    from segmentation import cut_cells, save_grid
+
+    scan = np.full((90, 90, 3), 255, np.uint8)
+    image_path = str(tmp_path / "scan.png")
+    cv2.imwrite(image_path, scan)
+    table_path = str(tmp_path / "table")
+    csv_dir = tmp_path / "csv_outputs"
+
+    def segment(row_lines, col_lines):
+        with FullResImage(image_path) as full:
+            cut_cells(full, table_path, row_lines, col_lines, 0, RunMetrics("test"))
+        save_grid(table_path, image_path, scan.shape, row_lines, col_lines, 0)
+
+    calls = []
+
+    def text_detection(image, image_context):
+        calls.append(1)
+        return mock.Mock(text_annotations=[mock.Mock(description=f"new{len(calls)}")])
+
+    monkeypatch.setattr(ocr_processor, "_get_vision_client", lambda: mock.Mock(text_detection=text_detection))
+
+    segment([0, 30, 60, 90], [0, 30, 60, 90])
+    ocr_processor.run_ocr_on_table(table_path, str(csv_dir), "april", "table", incremental=True)
+    assert len(calls) == 9
+    reviewed = pd.read_csv(csv_dir / "table.csv", header=None, dtype=str)
+    reviewed.iat[0, 0], reviewed.iat[2, 0] = "1893", "12.5"
+    reviewed.to_csv(csv_dir / "table.csv", index=False, header=False)
+
+    # Nudging one column line only changes the two columns beside it
+    segment([0, 30, 60, 90], [0, 30, 55, 90])
+    ocr_processor.run_ocr_on_table(table_path, str(csv_dir), "april", "table", incremental=True)
+    assert len(calls) == 15
+    df = pd.read_csv(csv_dir / "table.csv", header=None, dtype=str)
+    assert df.iat[0, 0] == "1893" and df.iat[2, 0] == "12.5" and df.iat[0, 1] == "new10"
+
+    # Dropping a row line merges the first two rows; the last row keeps its values under its new index
+    segment([0, 60, 90], [0, 30, 55, 90])
+    assert not os.path.exists(os.path.join(table_path, "row_3"))
+    ocr_processor.run_ocr_on_table(table_path, str(csv_dir), "april", "table", incremental=True)
+    assert len(calls) == 18
+    df = pd.read_csv(csv_dir / "table.csv", header=None, dtype=str)
+    assert df.shape == (2, 3) and df.iat[1, 0] == "12.5" and df.iat[0, 0] == "new16"
+
+
+def test_resegmenting_starts_from_saved_grid(tmp_path, monkeypatch):
+    """Test that redrawing one line of a saved grid keeps every other line at its full-res value."""
+    from segmentation import save_grid, load_grid, diff_grids
+
+    # Wide enough to be shown reduced, at a scale that does not round-trip whole display pixels
+    image_path = str(tmp_path / "scan.png")
+    cv2.imwrite(image_path, np.full((200, 3301, 3), 255, np.uint8))
+    table_path = str(tmp_path / "table")
+    old = save_grid(table_path, image_path, (200, 3301), [0, 67, 133, 200], [0, 1001, 2003, 3301], 1.5)
+
+    callbacks = []
+    scale = 3301 / 1650
+
+    def wait_key(delay):
+        if len(wait_key.calls) == 1:
+            # Columns: right click on the second line to drop it, then draw its replacement
+            callbacks[0](cv2.EVENT_RBUTTONDOWN, round(2003 / scale) + 3, 50, 0, None)
+            callbacks[0](cv2.EVENT_LBUTTONDOWN, 900, 50, 0, None)
+        wait_key.calls.append(delay)
+        return 13
+    wait_key.calls = []
+
+    for name in ("namedWindow", "resizeWindow", "imshow", "destroyAllWindows"):
+        monkeypatch.setattr(cv2, name, lambda *args: None)
+    monkeypatch.setattr(cv2, "setMouseCallback", lambda name, callback: callbacks.append(callback))
+    monkeypatch.setattr(cv2, "waitKey", wait_key)
+
+    grid = start_segmentation(image_path, table_path, cut=False)
+    assert grid == load_grid(table_path)
+    assert grid["row_lines"] == [0, 67, 133, 200] and grid["rotation"] == 1.5
+    assert grid["col_lines"] == [0, 1001, round(900 * scale), 3301]
+    # The first column's cells keep their boxes, so re-OCR skips them
+    assert diff_grids(old, grid) == {(r, 0): (r, 0) for r in range(3)}
+
+
+def test_cut_cells_exports_in_parallel_and_replaces_table_atomically(tmp_path):
+    """Test that cells are written in the chosen format and a failed export leaves the old cells."""
+    from metrics import RunMetrics
+    from ocr_processor import list_cells
+    from scan_io import FullResImage
+    from segmentation import cut_cells, save_grid, load_grid, find_cell_image, cell_write_params, CELL_FORMATS
+
+    scan = np.random.default_rng(0).integers(0, 255, (60, 90, 3), dtype=np.uint8)
+    image_path = str(tmp_path / "scan.png")
+    cv2.imwrite(image_path, scan)
+    table_path = str(tmp_path / "table")
+
+    with FullResImage(image_path) as full:
+        assert cut_cells(full, table_path, [0, 20, 40, 60], [0, 30, 60, 90], 0, RunMetrics("test"), "webp", 4) == 9
+    save_grid(table_path, image_path, scan.shape, [0, 20, 40, 60], [0, 30, 60, 90], 0)
+    cell = find_cell_image(table_path, 2, 1)
+    assert cell.endswith("col_2.webp")
+    assert np.array_equal(cv2.imread(cell), scan[40:60, 30:60])  # lossless
+    assert [len(row) for row in list_cells(table_path)] == [3, 3, 3]
+
+    class Failing(FullResImage):
+        def rotated_crop(self, box, angle):
+            if box == (45, 20, 90, 40):
+                raise OSError("disk full")
+            return super().rotated_crop(box, angle)
+
+    with Failing(image_path) as full, pytest.raises(OSError):
+        cut_cells(full, table_path, [0, 20, 40, 60], [0, 45, 90], 0, RunMetrics("test"), "png", 4)
+    assert [len(row) for row in list_cells(table_path)] == [3, 3, 3]
+    assert not os.path.exists(table_path + ".partial")
+
+    with FullResImage(image_path) as full:
+        cut_cells(full, table_path, [0, 30, 60], [0, 45, 90], 0, RunMetrics("test"), "png_fast", 4)
+    assert [len(row) for row in list_cells(table_path)] == [2, 2]
+    assert find_cell_image(table_path, 0, 0).endswith(".png") and load_grid(table_path) is not None
+    # Sharpening rewrites cells with the level they were cut at, not the PNG default
+    assert cell_write_params(find_cell_image(table_path, 0, 0), "png_fast") == CELL_FORMATS["png_fast"][1]
+    assert cell_write_params(find_cell_image(table_path, 0, 0)) == CELL_FORMATS["png"][1]
+
+
+def test_contact_sheet_tiles_and_batch_accept():
+    """Test that a contact sheet maps clicks back to cells and accepted cells stop being flagged."""
+    from contact_sheet import thumbnail, render_sheet, tile_at, paginate, THUMB_WIDTH, THUMB_HEIGHT
+
+    cells = [np.full((40, 100, 3), v, np.uint8) for v in (0, 80, 160)] + [None]
+    thumbs = [thumbnail(img) for img in cells]
+    assert all(t.shape == (THUMB_HEIGHT, THUMB_WIDTH, 3) for t in thumbs)
+    sheet, boxes = render_sheet(thumbs, ["R1: 1", "R2: 2", "R3: 3", "R4: "], columns=3, highlight={1})
+    assert len(boxes) == 4 and boxes[3][1] > boxes[0][1]  # The fourth tile starts a new row
+    assert sheet.shape[0] >= boxes[-1][3] and sheet.shape[1] >= boxes[2][2]
+    x0, y0, x1, y1 = boxes[2]
+    assert tile_at(boxes, (x0 + x1) // 2, (y0 + y1) // 2) == 2
+    assert tile_at(boxes, 0, 0) is None
+    assert [len(p) for p in paginate(list(range(130)), 64)] == [64, 64, 2]
+
+    gui = OCRCheckerGUI.__new__(OCRCheckerGUI)
+    gui.current_csv = pd.DataFrame([["1893", "abc", "5"], ["1894", "xyz", "6"]])
+    gui.profile = None
+    gui.invalid_mask = None
+    gui.validation_key = None
+    gui.use_min_max = mock.Mock(get=mock.Mock(return_value=False))
+    gui.min_val = mock.Mock(get=mock.Mock(return_value="-50"))
+    gui.max_val = mock.Mock(get=mock.Mock(return_value="99"))
+    gui.ignore_nan_var = mock.Mock(get=mock.Mock(return_value=False))
+    gui.outlier_indices = {(1, 2)}
+    gui.accepted_cells = set()
+    gui.checking_outliers = False
+    gui.row_idx = gui.col_idx = 0
+    gui.load_cell = mock.Mock()
+
+    before = gui.flagged_mask()
+    assert before[:, 1].tolist() == [True, True] and before[1, 2]
+    gui.accept_cells([(0, 1), (1, 2)])
+    before[0, 1] = before[1, 2] = False
+    assert gui.flagged_mask().tolist() == before.tolist()
+    assert gui.outlier_indices == set()
+    gui.col_idx = 1  # Navigation from the accepted cell moves on to the next unaccepted one
+    gui.load_next_invalid_cell()
+    assert (gui.row_idx, gui.col_idx) == min(tuple(p) for p in np.argwhere(before).tolist() if tuple(p) > (0, 1))
@@ -0,0 +1,232 @@
+import os
+import re
+import json
+import warnings
+import numpy as np
+import pandas as pd
+
+# A validation profile is a small JSON document describing what a valid cell looks like
+# in each column of a table. Column keys are 0-based column indices ("0"), inclusive
+# ranges ("1-31") or "*" for every column not matched by a more specific key.
+#
+# {
+#     "name": "daily_temperature",
+#     "columns": {
+#         "0": {"dtype": "int", "min": 1800, "max": 2100},
+#         "*": {"dtype": "float", "min": -50, "max": 99, "allow": ["nan"]}
+#     },
+#     "outlier_skip": [0]
+# }
+#
+# Rule fields (all optional):
+#   dtype     "float", "int" or "str"
+#   min/max   inclusive numeric bounds (numeric dtypes only)
+#   regex     pattern the stripped cell text must fully match
+#   allow     tokens accepted as-is regardless of the other rules (case-insensitive)
+#   required  when true (the default) an empty cell is invalid
+
+PROFILE_SUFFIX = ".profile.json"
+
+DEFAULT_RULE = {"dtype": "float", "min": -50, "max": 99}
+
+DEFAULT_PROFILE = {
+    "name": "default",
+    "columns": {"*": DEFAULT_RULE},
+    "outlier_skip": [0],
+}
+
+
+def make_profile(name=DEFAULT_PROFILE["name"], min_val=DEFAULT_RULE["min"], max_val=DEFAULT_RULE["max"]):
+
+    """
+    Returns a profile applying one numeric range to every column,
+    matching the checker's global Min/Max fields.
+    """
+
+    return dict(
+        DEFAULT_PROFILE,
+        name=name,
+        columns={"*": dict(DEFAULT_RULE, min=min_val, max=max_val)},
+        outlier_skip=list(DEFAULT_PROFILE["outlier_skip"]),
+    )
+
+
+def profile_path_for(csv_path):
+
+    """
+    Returns the path of the profile stored alongside a table's CSV.
+    """
+
+    base, _ = os.path.splitext(csv_path)
+    return base + PROFILE_SUFFIX
+
+
+def load_profile(path):
+
+    """
+    Loads a profile from JSON, returning None if the file does not exist.
+    """
+
+    if not path or not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        profile = json.load(f)
+    _check_profile(profile)
+    return profile
+
+
+def save_profile(profile, path):
+
+    """
+    Writes a profile to JSON, creating the parent folder if needed.
+    """
+
+    _check_profile(profile)
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+
+
+def _check_profile(profile):
+    if not isinstance(profile.get("columns"), dict):
+        raise ValueError("Validation profile must contain a 'columns' mapping.")
+    for key, rule in profile["columns"].items():
+        _parse_column_key(key)
+        dtype = rule.get("dtype", "float")
+        if dtype not in ("float", "int", "str"):
+            raise ValueError(f"Unknown dtype '{dtype}' for column '{key}'.")
+        if "regex" in rule:
+            re.compile(rule["regex"])
+
+
+def _parse_column_key(key):
+    key = str(key).strip()
+    if key == "*":
+        return None
+    if "-" in key:
+        start, end = key.split("-", 1)
+        return int(start), int(end)
+    return int(key), int(key)
+
+
+def resolve_rules(profile, columns):
+
+    """
+    Maps each column label to its rule. Single-column keys beat ranges, ranges beat "*".
+    Returns a list of (rule, [column labels]) groups so columns sharing a rule
+    are validated together.
+    """
+
+    specific, ranges, fallback = {}, [], None
+    for key, rule in profile["columns"].items():
+        span = _parse_column_key(key)
+        if span is None:
+            fallback = rule
+        elif span[0] == span[1]:
+            specific[span[0]] = rule
+        else:
+            ranges.append((span, rule))
+
+    groups = {}
+    for col in columns:
+        rule = specific.get(col)
+        if rule is None:
+            for (start, end), range_rule in ranges:
+                if start <= col <= end:
+                    rule = range_rule
+                    break
+        if rule is None:
+            rule = fallback
+        if rule is None:
+            continue
+        groups.setdefault(id(rule), (rule, []))[1].append(col)
+    return list(groups.values())
+
+
+def _text_array(df):
+    # Missing values are compared as "nan", which is how they render in the checker
+    return df.astype(object).where(df.notna(), "nan").to_numpy(dtype=str)
+
+
+def _rule_mask(text, rule, extra_allow=()):
+    stripped = np.char.strip(text)
+    lowered = np.char.lower(stripped)
+
+    invalid = np.zeros(text.shape, dtype=bool)
+    dtype = rule.get("dtype", "float")
+    if dtype in ("float", "int"):
+        flat = pd.to_numeric(pd.Series(stripped.ravel()), errors="coerce").to_numpy(dtype=float)
+        nums = flat.reshape(text.shape)
+        bad = np.isnan(nums)
+        if dtype == "int":
+            bad |= ~np.isnan(nums) & (nums != np.floor(nums))
+        if rule.get("min") is not None:
+            bad |= nums < float(rule["min"])
+        if rule.get("max") is not None:
+            bad |= nums > float(rule["max"])
+        invalid |= bad
+    if rule.get("regex"):
+        matched = pd.Series(stripped.ravel()).str.fullmatch(rule["regex"]).to_numpy(dtype=bool)
+        invalid |= ~matched.reshape(text.shape)
+
+    empty = stripped == ""
+    if rule.get("required", True):
+        invalid |= empty
+    else:
+        invalid &= ~empty
+
+    allow = [str(t).strip().lower() for t in rule.get("allow", [])] + list(extra_allow)
+    if allow:
+        invalid &= ~np.isin(lowered, allow)
+    return invalid
+
+
+def validate_frame(df, profile, ignore_nan=False):
+
+    """
+    Returns a boolean array shaped like df that is True for every invalid cell.
+    Columns without a rule are always valid. When ignore_nan is set, "nan" cells are accepted.
+    """
+
+    mask = np.zeros(df.shape, dtype=bool)
+    if df.empty:
+        return mask
+    positions = {label: i for i, label in enumerate(df.columns)}
+    extra_allow = ("nan",) if ignore_nan else ()
+    for rule, labels in resolve_rules(profile, list(df.columns)):
+        idx = [positions[label] for label in labels]
+        mask[:, idx] = _rule_mask(_text_array(df.iloc[:, idx]), rule, extra_allow)
+    return mask
+
+
+def find_std_outliers(df, std_thresh, skip_columns=(0,)):
+
+    """
+    Flags numeric cells further than std_thresh standard deviations from their column mean.
+    Returns a boolean array shaped like df.
+    """
+
+    numeric = df.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    if numeric.size == 0:
+        return np.zeros(df.shape, dtype=bool)
+    # All-NaN or single-value columns produce NaN stats, which never compare as outliers
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(numeric, axis=0)
+        std = np.nanstd(numeric, axis=0, ddof=1)
+        mask = np.abs(numeric - mean) > std_thresh * std
+    skip = [i for i, label in enumerate(df.columns) if label in set(skip_columns)]
+    mask[:, skip] = False
+    return mask
+
+
+def clear_tokens(df, tokens=("x",)):
+
+    """
+    Returns a copy of df with every cell matching one of tokens (case-insensitive) blanked.
+    """
+
+    lowered = np.char.lower(np.char.strip(_text_array(df)))
+    return df.mask(np.isin(lowered, [t.lower() for t in tokens]), "")